@@ -4,48 +4,35 @@ from pgmpy.models import DiscreteBayesianNetwork
 from pgmpy.estimators import MaximumLikelihoodEstimator
 from pgmpy.inference import VariableElimination
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import sys
 import itertools
 from scipy.stats import ttest_ind
 
-cwd = os.getcwd()
-print("Current working directory:", cwd)
+import instrument
+import plotting
+import stage_cache
+from features import add_bayes_bins
+from loader import BAYES_COLUMNS, load_sessions
+from model_artifact import BAYES_ARTIFACT_PATH, build_bayes_artifact, save_artifact
+from posterior_table import PosteriorTable
+from resample_stats import feature_report
 
-file_path = os.path.join(cwd, "Model_Training", "session_data.csv")
+file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data.csv")
 print("Full path to CSV:", file_path)
 
 # Check if file exists
+instrument.stage('load')
 if os.path.isfile(file_path):
     print("File found! Loading now...")
-    df = pd.read_csv(file_path)
+    df = load_sessions(file_path, columns=BAYES_COLUMNS)
     print("CSV loaded successfully.")
 else:
     raise FileNotFoundError("CSV file not found. Check filename and folder.")
 
 # Feature Engineering
+instrument.stage('features')
 
-df['ScrollRate'] = df.apply(
-    lambda row: (
-        'high' if row['Scroll Events Count'] / (row['Duration (minutes)'] + 1e-6) > 30 else
-        'medium' if row['Scroll Events Count'] / (row['Duration (minutes)'] + 1e-6) > 10 else
-        'low'
-    ),
-    axis=1
-)
-
-df['ClickRate'] = df.apply(
-    lambda row: (
-        'high' if row['Total Clicks'] / (row['Duration (minutes)'] + 1e-6) > 2 else
-        'medium' if row['Total Clicks'] / (row['Duration (minutes)'] + 1e-6) > 0.5 else
-        'low'
-    ),
-    axis=1
-)
-
-df['SessionLength'] = df['Duration (minutes)'].apply(
-    lambda d: 'long' if d > 30 else 'medium' if d > 10 else 'short'
-)
+add_bayes_bins(df)
 
 df['Doomscrolling'] = df['doomscroll_label'].map({1: 'yes', 0: 'no'})
 
@@ -55,14 +42,20 @@ model = DiscreteBayesianNetwork([
     ('SessionLength', 'Doomscrolling')
 ])
 
-model.fit(df, estimator=MaximumLikelihoodEstimator)
+instrument.stage('fit')
+# CPDs are refitted only when the binned data changes (see stage_cache.py)
+bayes_columns = ['ScrollRate', 'ClickRate', 'SessionLength', 'Doomscrolling']
+model = stage_cache.cached('bayes_fit', lambda: model.fit(df[bayes_columns], estimator=MaximumLikelihoodEstimator),
+                           {'data': df[bayes_columns], 'edges': sorted(model.edges())})
 inference = VariableElimination(model)
 
+instrument.stage('queries')
 # Example query: probability of doomscrolling given certain features
 query_result = inference.query(
     variables=['Doomscrolling'],
     evidence={'ScrollRate': 'high', 'ClickRate': 'low', 'SessionLength': 'long'}
 )
+instrument.count('pgmpy_queries')
 print("Query result for ScrollRate=high, ClickRate=low, SessionLength=long:")
 print(query_result)
 
@@ -94,6 +87,7 @@ print(query_result)
     df_cpd.to_csv(f"{cpd.variable}_cpd.csv", index=False)'''
 
 
+instrument.stage('cpd_tables')
 #Visual CPDs now after confirming they are saved in CSV
 
 for cpd in model.get_cpds():
@@ -122,15 +116,10 @@ for cpd in model.get_cpds():
         )
 
     # Visualization
-    plt.figure(figsize=(8, 5))
-    sns.heatmap(df_cpd, annot=True, fmt=".2f", cmap="Blues")
-    plt.title(f"CPD for {var}")
-    plt.xlabel("Parent States" if len(parents) > 0 else "Probability")
-    plt.ylabel(var)
-    plt.tight_layout()
-    plt.show()
+    plotting.add(plotting.draw_cpd, df_cpd, var, len(parents) > 0, name=f"CPD for {var}")
 
 # Query Testing - More scenarios
+instrument.stage('queries')
 
 scenarios = [
     {'ScrollRate': 'high', 'ClickRate': 'low', 'SessionLength': 'long'},
@@ -140,6 +129,7 @@ scenarios = [
 
 for scenario in scenarios:
     result = inference.query(variables=['Doomscrolling'], evidence=scenario)
+    instrument.count('pgmpy_queries')
     print(f"Scenario: {scenario}")
     print(result)
     print()
@@ -162,8 +152,23 @@ def get_prob_yes(row):
     yes_index = q.state_names['Doomscrolling'].index('yes')
     return q.values[yes_index]
 
-df['Predicted_Prob_Yes'] = df.apply(get_prob_yes, axis=1)
+instrument.stage('scoring')
+# Score every row from the compiled posterior table instead of one query per row;
+# get_prob_yes is kept for spot checks
+posterior_table = stage_cache.cached(
+    'bayes_posteriors',
+    lambda: PosteriorTable.from_inference(inference, 'Doomscrolling', ['ScrollRate', 'ClickRate', 'SessionLength']),
+    {'data': df[bayes_columns], 'edges': sorted(model.edges())},
+    code=[sys.modules[PosteriorTable.__module__]],
+)
+print(f"Compiled posterior table matches pgmpy (max error {posterior_table.check_against(inference):.2e})")
+df['Predicted_Prob_Yes'] = posterior_table.prob(df, 'yes')
+
+# Saved for scoring_service.py, with the default cut points add_bayes_bins used above
+save_artifact(build_bayes_artifact(posterior_table, n_sessions=len(df)), BAYES_ARTIFACT_PATH)
+print("Saved posterior table to", os.path.relpath(BAYES_ARTIFACT_PATH))
 
+instrument.stage('hypothesis_tests')
 # Backup used to see agreement with hypothesis testing from final_model.py
 
 # Split predicted probabilities by true label
@@ -184,3 +189,15 @@ print(f"Focused mean probability: {focused_probs.mean():.3f}")
 print(f"Doomscroll mean probability: {doom_probs.mean():.3f}")
 print(f"t-statistic: {t_stat:.3f}, p-value: {p_val:.4f}")
 print(f"Cohen's d: {cohen_d:.3f}")
+
+# Uncertainty of the above: bootstrap CIs and a permutation p-value (see resample_stats.py)
+row = feature_report(df, ['Predicted_Prob_Yes'], n_resamples=2000, seed=42).iloc[0]
+print("\nBootstrap 95% CIs and permutation test (2000 resamples)")
+print(f"Focused mean probability: {row['focused_mean']:.3f} [{row['focused_mean_low']:.3f}, {row['focused_mean_high']:.3f}]")
+print(f"Doomscroll mean probability: {row['doom_mean']:.3f} [{row['doom_mean_low']:.3f}, {row['doom_mean_high']:.3f}]")
+print(f"Cohen's d: {row['cohen_d']:.3f} [{row['cohen_d_low']:.3f}, {row['cohen_d_high']:.3f}]")
+print(f"AUC: {row['auc']:.3f} [{row['auc_low']:.3f}, {row['auc_high']:.3f}]")
+print(f"Permutation p-value: {row['p_permutation']:.4f}")
+
+instrument.stage('plots')
+plotting.finish()
@@ -0,0 +1,251 @@
+"""Per-stage time and memory benchmarks of the training pipeline at scale.
+
+Each row count gets a synthetic export (synthetic.py) written to a temporary
+CSV, and then every stage the training scripts go through is timed on it:
+loading, feature engineering, RF importance, 5-fold CV, LOOCV, the Bayesian
+network fit and query, and the t-tests / Cohen's d. A second, traced run of
+each stage records its peak memory with tracemalloc. This covers the main
+process, NumPy buffers included, but not CV worker processes.
+
+Results are printed and can be saved as JSON. Passing an earlier JSON file
+with --compare flags stages that got slower or bigger:
+    python Model_Training/bench_suite.py --rows 10000 100000 --json bench.json
+    python Model_Training/bench_suite.py --rows 10000 100000 --compare bench.json
+
+benchmark.py, by contrast, compares specific optimizations with the code they
+replaced.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+from scipy.stats import ttest_ind
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import StandardScaler
+
+import fast_loo
+from benchmark import fit_bayes_net
+from cv_engine import kfold_summary, loo_folds, pooled_summary, run_cv, test_folds
+from features import BAYES_FEATURES, LABEL, TOP_FEATURES, engineer_features
+from loader import RAW_FEATURE_COLUMNS, build_cache, load_sessions
+from posterior_table import PosteriorTable
+from synthetic import load_session_model, write_sessions_csv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def stage_load_csv(ctx):
+    load_sessions(ctx['csv'], use_cache=False)
+
+
+def stage_load_cached(ctx):
+    load_sessions(ctx['csv'])
+
+
+def stage_features(ctx):
+    engineer_features(ctx['raw'].copy(), dtype=np.float64)
+
+
+def stage_rf_importance(ctx):
+    rf = RandomForestClassifier(n_estimators=100, random_state=42)
+    rf.fit(ctx['X'], ctx['y'])
+    ctx['importance'] = rf.feature_importances_
+
+
+def _cv_models():
+    return {
+        'rf': RandomForestClassifier(n_estimators=100, random_state=42),
+        'lr': LogisticRegression(max_iter=1000, random_state=42),
+    }
+
+
+def stage_kfold_cv(ctx):
+    folds = test_folds(KFold(n_splits=5, shuffle=True, random_state=42), ctx['X_scaled'], ctx['y'])
+    results = run_cv(_cv_models(), ctx['X_scaled'], ctx['y'], folds)
+    for fold_results in results.values():
+        kfold_summary(ctx['y'], folds, fold_results)
+
+
+def stage_loocv(ctx):
+    """Exact LOOCV as final_model.py runs it, on the first --loo-rows sessions."""
+    n = ctx['loo_rows']
+    X, y = ctx['X_scaled'][:n], ctx['y'][:n]
+    folds = loo_folds(n)
+    for fold_results in run_cv(_cv_models(), X, y, folds).values():
+        pooled_summary(y, folds, fold_results)
+    return {'rows_used': n}
+
+
+def stage_loocv_fast(ctx):
+    fast_loo.loo_auc(ctx['y'], fast_loo.lr_loo_newton(ctx['X'], ctx['y']))
+    fast_loo.loo_auc(ctx['y'], fast_loo.bayes_loo(ctx['df']))
+
+
+def stage_bayes_fit(ctx):
+    ctx['bayes_inference'] = fit_bayes_net(ctx['raw'])[1]
+
+
+def stage_bayes_query(ctx):
+    if 'bayes_inference' not in ctx:
+        stage_bayes_fit(ctx)
+    table = PosteriorTable.from_inference(ctx['bayes_inference'], 'Doomscrolling', BAYES_FEATURES)
+    table.prob(ctx['df'], 'yes')
+
+
+def stage_stats(ctx):
+    df = ctx['df']
+    doom = df[LABEL].to_numpy() == 1
+    ctx['stats'] = {}
+    for feature in TOP_FEATURES:
+        values = df[feature].to_numpy()
+        x1, x2 = values[~doom], values[doom]
+        t_stat, p_val = ttest_ind(x1, x2, equal_var=False)
+        n1, n2 = len(x1), len(x2)
+        pooled_std = np.sqrt(((n1 - 1) * np.var(x1, ddof=1) + (n2 - 1) * np.var(x2, ddof=1)) / (n1 + n2 - 2))
+        ctx['stats'][feature] = (t_stat, p_val, (x1.mean() - x2.mean()) / pooled_std)
+
+
+STAGES = {
+    'load_csv': stage_load_csv,
+    'load_cached': stage_load_cached,
+    'features': stage_features,
+    'rf_importance': stage_rf_importance,
+    'kfold_cv': stage_kfold_cv,
+    'loocv': stage_loocv,
+    'loocv_fast': stage_loocv_fast,
+    'bayes_fit': stage_bayes_fit,
+    'bayes_query': stage_bayes_query,
+    'stats': stage_stats,
+}
+
+
+def build_context(n_rows, workdir, loo_rows, seed=0):
+    """Write the synthetic CSV and prepare the inputs every stage starts from (untimed)."""
+    csv = os.path.join(workdir, f"sessions_{n_rows}.csv")
+    write_sessions_csv(csv, n_rows, load_session_model(), seed=seed)
+    try:
+        build_cache(csv)
+    except ImportError:
+        pass  # load_cached then measures the CSV fallback
+
+    raw = load_sessions(csv, columns=RAW_FEATURE_COLUMNS, float_dtype=np.float64)
+    df = engineer_features(raw.copy(), dtype=np.float64)
+    X = df[TOP_FEATURES].to_numpy()
+    return {
+        'csv': csv,
+        'raw': raw,
+        'df': df,
+        'X': X,
+        'X_scaled': StandardScaler().fit_transform(X),
+        'y': df[LABEL].to_numpy(),
+        'loo_rows': min(loo_rows, n_rows),
+    }
+
+
+def measure(stage, ctx, trace_memory=True):
+    start = time.perf_counter()
+    extra = STAGES[stage](ctx) or {}
+    result = {'seconds': time.perf_counter() - start, **extra}
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            STAGES[stage](ctx)
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print time/memory ratios against a baseline run; returns the regressed (stage, rows) pairs."""
+    before = {(r['stage'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nAgainst baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for r in results:
+        old = before.get((r['stage'], r['rows']))
+        if old is None:
+            continue
+        ratios = {'time': r['seconds'] / old['seconds']}
+        if 'peak_mb' in r and old.get('peak_mb'):
+            ratios['memory'] = r['peak_mb'] / old['peak_mb']
+        worse = [k for k, v in ratios.items() if v > 1 + tolerance]
+        if worse:
+            regressions.append((r['stage'], r['rows']))
+        print(f"  {r['stage']:<14} rows={r['rows']:>10,}  "
+              + "  ".join(f"{k} x{v:.2f}" for k, v in ratios.items())
+              + ("  REGRESSION" if worse else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and peak memory of each training stage")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--loo-rows', type=int, default=100,
+                        help="sessions used by the exact LOOCV stage (one fit per session per model)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced peak-memory runs")
+    parser.add_argument('--json', help="write the results here")
+    parser.add_argument('--compare', help="earlier --json output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="relative slowdown/growth reported as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    # Import pgmpy now so its import time is not charged to the first Bayes stage
+    import pgmpy.estimators, pgmpy.inference, pgmpy.models  # noqa: F401
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.rows:
+            ctx = build_context(n_rows, workdir, args.loo_rows)
+            for stage in args.stages:
+                result = {'stage': stage, 'rows': n_rows,
+                          **measure(stage, ctx, trace_memory=not args.no_memory)}
+                results.append(result)
+                memory = f"  peak={result['peak_mb']:9.1f}MB" if 'peak_mb' in result else ""
+                print(f"{stage:<14} rows={n_rows:>10,}  {result['seconds']:9.3f}s{memory}", flush=True)
+
+    report = {'meta': environment(), 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Saved results to", args.json)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
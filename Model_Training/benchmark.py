@@ -0,0 +1,237 @@
+"""Benchmarks for the training pipeline.
+
+Run from the repository root:
+    python Model_Training/benchmark.py --rows 10000 100000
+    python Model_Training/benchmark.py --stages bayes --rows 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import fast_loo
+from features import BAYES_FEATURES, TOP_FEATURES, add_bayes_bins, add_ratio_features
+from posterior_table import PosteriorTable
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data.csv")
+
+
+def scale_sessions(df, n_rows, seed=0):
+    """Resample the study export up to n_rows rows, jittering the counts a little."""
+    rng = np.random.default_rng(seed)
+    big = df.iloc[rng.integers(0, len(df), n_rows)].reset_index(drop=True)
+    for col in ['Total Scroll Distance', 'Total Clicks', 'Scroll Events Count']:
+        noise = rng.normal(1.0, 0.1, n_rows).clip(0.5, 1.5)
+        big[col] = (big[col] * noise).round().astype(big[col].dtype)
+    big['Duration (minutes)'] = (big['Duration (minutes)'] + rng.integers(-1, 2, n_rows)).clip(lower=1)
+    return big
+
+
+# Row-wise feature engineering as it was written in the training scripts,
+# kept only as the baseline for bench_features
+def legacy_ratio_features(df):
+    df['Scroll Intensity (px/min)'] = df['Total Scroll Distance'] / df['Duration (minutes)']
+    df['Click Rate (clicks/min)'] = df['Total Clicks'] / df['Duration (minutes)']
+    df['Scroll per Click'] = df['Total Scroll Distance'] / df['Total Clicks'].replace(0,1)
+    df['Avg Scroll Speed (px/event)'] = df['Total Scroll Distance'] / df['Scroll Events Count'].replace(0,1)
+    df['Engagement Score'] = df.apply(
+        lambda row: (row['Total Clicks'] * 1000 / row['Total Scroll Distance']) if row['Total Scroll Distance'] > 0 else 0,
+        axis=1
+    )
+    return df
+
+
+def legacy_bayes_bins(df):
+    df['ScrollRate'] = df.apply(
+        lambda row: (
+            'high' if row['Scroll Events Count'] / (row['Duration (minutes)'] + 1e-6) > 30 else
+            'medium' if row['Scroll Events Count'] / (row['Duration (minutes)'] + 1e-6) > 10 else
+            'low'
+        ),
+        axis=1
+    )
+    df['ClickRate'] = df.apply(
+        lambda row: (
+            'high' if row['Total Clicks'] / (row['Duration (minutes)'] + 1e-6) > 2 else
+            'medium' if row['Total Clicks'] / (row['Duration (minutes)'] + 1e-6) > 0.5 else
+            'low'
+        ),
+        axis=1
+    )
+    df['SessionLength'] = df['Duration (minutes)'].apply(
+        lambda d: 'long' if d > 30 else 'medium' if d > 10 else 'short'
+    )
+    return df
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_features(base, n_rows):
+    data = scale_sessions(base, n_rows)
+    # exportToCSV rounds Duration, so sessions under 30 s come out as 0 minutes
+    data.loc[::100, 'Duration (minutes)'] = 0
+    zero = data['Duration (minutes)'].to_numpy() == 0
+
+    legacy, t_legacy = timed(lambda d: legacy_bayes_bins(legacy_ratio_features(d)), data.copy())
+    fast, t_fast = timed(lambda d: add_bayes_bins(add_ratio_features(d)), data.copy())
+
+    # Both paths must agree before the timing means anything
+    for col in ['ScrollRate', 'ClickRate', 'SessionLength']:
+        if not (legacy[col].to_numpy() == fast[col].astype(str).to_numpy()).all():
+            raise AssertionError(f"{col} differs from the apply-based version")
+    for col in ['Scroll per Click', 'Avg Scroll Speed (px/event)', 'Engagement Score']:
+        np.testing.assert_allclose(fast[col], legacy[col], rtol=1e-6)
+    # The per-minute features were inf (or NaN) on 0-minute sessions and are 0 now
+    for col in ['Scroll Intensity (px/min)', 'Click Rate (clicks/min)']:
+        np.testing.assert_allclose(fast[col][~zero], legacy[col][~zero], rtol=1e-6)
+        if (fast[col][zero] != 0).any():
+            raise AssertionError(f"{col} is not 0 on 0-minute sessions")
+
+    legacy_mb = legacy.memory_usage(deep=True).sum() / 1e6
+    fast_mb = fast.memory_usage(deep=True).sum() / 1e6
+    print(f"features  rows={n_rows:>9,}  apply={t_legacy:8.3f}s  vectorized={t_fast:7.3f}s  "
+          f"speedup={t_legacy / t_fast:7.1f}x  frame={legacy_mb:8.1f}MB -> {fast_mb:8.1f}MB")
+
+
+def fit_bayes_net(df, **cuts):
+    from pgmpy.estimators import MaximumLikelihoodEstimator
+    from pgmpy.inference import VariableElimination
+    from pgmpy.models import DiscreteBayesianNetwork
+
+    data = add_bayes_bins(df.copy(), **cuts)
+    data['Doomscrolling'] = data['doomscroll_label'].map({1: 'yes', 0: 'no'})
+    model = DiscreteBayesianNetwork([(f, 'Doomscrolling') for f in BAYES_FEATURES])
+    model.fit(data[BAYES_FEATURES + ['Doomscrolling']], estimator=MaximumLikelihoodEstimator)
+    return model, VariableElimination(model)
+
+
+def bench_bayes_scoring(base, n_rows, sample_rows=500):
+    _, inference = fit_bayes_net(base)
+    data = add_bayes_bins(scale_sessions(base, n_rows))
+
+    table, t_compile = timed(PosteriorTable.from_inference, inference, 'Doomscrolling', BAYES_FEATURES)
+    max_err = table.check_against(inference)
+    probs, t_table = timed(table.prob, data, 'yes')
+
+    # Per-row VariableElimination is far too slow to run on every row, so time a
+    # sample and extrapolate
+    def per_row(frame):
+        return np.array([
+            inference.query(['Doomscrolling'], evidence=dict(zip(BAYES_FEATURES, states)),
+                            show_progress=False).get_value(Doomscrolling='yes')
+            for states in frame[BAYES_FEATURES].astype(str).itertuples(index=False)
+        ])
+    sample = data.iloc[:sample_rows]
+    expected, t_sample = timed(per_row, sample)
+    np.testing.assert_allclose(probs[:sample_rows], expected, atol=1e-12)
+    t_per_row = t_sample / len(sample) * n_rows
+
+    print(f"bayes     rows={n_rows:>9,}  per-row query~{t_per_row:8.1f}s  compile={t_compile:.3f}s  "
+          f"gather={t_table:.3f}s  speedup~{t_per_row / (t_compile + t_table):9.0f}x  max_err={max_err:.1e}")
+
+
+def bench_fast_loo(base, n_rows, exact_sample=50):
+    data = add_bayes_bins(add_ratio_features(scale_sessions(base, n_rows), dtype=np.float64))
+    X = data[TOP_FEATURES].to_numpy()
+    y = data['doomscroll_label'].to_numpy()
+
+    report = fast_loo.compare_lr_loo(X, y, exact_sample=exact_sample)
+    _, t_bayes = timed(fast_loo.bayes_loo, data)
+    for name in ('warm', 'newton'):
+        r = report[name]
+        print(f"loo-{name:<6} rows={n_rows:>9,}  exact~{report['exact_seconds']:9.1f}s  fast={r['seconds']:9.3f}s  "
+              f"speedup~{r['speedup']:9.1f}x  max|dp|={r['max_abs_dev']:.1e}")
+    print(f"loo-bayes  rows={n_rows:>9,}  count subtraction={t_bayes:.3f}s")
+
+
+PLOTTING_MODULES = ('matplotlib', 'seaborn')
+
+
+def import_profile(cmd, cwd, env):
+    """Seconds spent importing, in total and in PLOTTING_MODULES, by one run of cmd (-X importtime)."""
+    result = subprocess.run([cmd[0], '-X', 'importtime'] + cmd[1:], cwd=cwd, env=env,
+                            check=True, capture_output=True, text=True)
+    total = plotting = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('  '):    # nested import, already inside its parent's cumulative time
+            continue
+        total += int(cumulative)
+        if name.strip().split('.')[0] in PLOTTING_MODULES:
+            plotting += int(cumulative)
+    return total / 1e6, plotting / 1e6
+
+
+def bench_startup(ref=None, repeats=3):
+    """The unchanged final_model.py at ref (the baseline commit by default) vs cli.py final --no-plots.
+
+    The old script runs from a temporary git worktree with MPLBACKEND=Agg so
+    its plt.show() calls return at once; the CLI runs with --no-cache so no
+    stage is reused. Both train on session_data.csv from start to finish.
+    """
+    repo = os.path.dirname(os.path.dirname(CSV_PATH))
+    ref = ref or subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=repo, check=True,
+                                capture_output=True, text=True).stdout.split()[0]
+    env = dict(os.environ, MPLBACKEND='Agg')
+
+    def best_of(cmd, cwd):
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=cwd, env=env, check=True, capture_output=True)
+            runs.append(time.perf_counter() - start)
+        return min(runs)
+
+    with tempfile.TemporaryDirectory(prefix='startup_baseline_') as tmp:
+        worktree = os.path.join(tmp, 'tree')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, ref], cwd=repo, check=True,
+                       capture_output=True)
+        try:
+            runs = [(f"{ref[:10]} final_model.py", [sys.executable, 'Model_Training/final_model.py'], worktree),
+                    ("cli.py final --no-plots", [sys.executable, 'Model_Training/cli.py', 'final', '--no-plots',
+                                                 '--no-cache'], repo)]
+            for name, cmd, cwd in runs:
+                imports, plotting_imports = import_profile(cmd, cwd, env)
+                print(f"startup   {name:<28} wall={best_of(cmd, cwd):6.2f}s  imports={imports:5.2f}s  "
+                      f"matplotlib+seaborn={plotting_imports:5.2f}s")
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=repo, capture_output=True)
+
+
+STAGES = {
+    'features': bench_features,
+    'bayes': bench_bayes_scoring,
+    'loo': bench_fast_loo,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES) + ['startup'],
+                        default=list(STAGES) + ['startup'])
+    parser.add_argument('--startup-ref', help="commit whose final_model.py the startup stage compares against "
+                                              "(default: the repository's first commit)")
+    args = parser.parse_args()
+
+    if 'startup' in args.stages:
+        bench_startup(args.startup_ref)
+    base = pd.read_csv(CSV_PATH)
+    for stage in (s for s in args.stages if s != 'startup'):
+        for n_rows in args.rows:
+            STAGES[stage](base, n_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Command-line entry point for the training scripts.
+
+    python Model_Training/cli.py bayes   [--no-plots | --plots-dir DIR] [--no-cache | --clear-cache]
+    python Model_Training/cli.py final   [--no-plots | --plots-dir DIR] [--no-cache | --clear-cache]
+    python Model_Training/cli.py explore [--no-plots | --plots-dir DIR] [--no-cache | --clear-cache] [--content CSV]
+    python Model_Training/cli.py final --profile-report prof/final.json [--trace-memory] [--cprofile loocv]
+
+bayes runs bay_net.py, final runs final_model.py and explore runs model.py.
+Without a plot option figures open interactively, exactly as when running
+the script directly. --plots-dir renders them headless (Agg) in parallel
+and --no-plots skips them without importing matplotlib, which is what
+scheduled retraining jobs want.
+
+Fitted models and CV results are reused from the stage cache (stage_cache.py)
+when their inputs have not changed. --no-cache recomputes everything without
+touching it, and --clear-cache empties it first.
+
+--profile-report times every stage the script marks (see instrument.py) and
+writes wall/CPU time, memory and operation counts as JSON, plus a .folded
+file for flame graph tools. --trace-memory measures memory with tracemalloc
+instead of the process's peak RSS, and --cprofile STAGE also dumps a
+cProfile of that stage next to the report.
+
+explore --content adds the per-session title-label shares written by
+title_embed.py --out to model.py's candidate features.
+
+Only the standard library is imported here; each script pulls in its own
+dependencies when it runs.
+"""
+import argparse
+import os
+import runpy
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    'bayes': ('bay_net.py', "Fit and query the discrete Bayesian network"),
+    'final': ('final_model.py', "Train and evaluate the final LR/RF models on the top features"),
+    'explore': ('model.py', "Feature importance and CV over all nine engineered features"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Doomscrolling model training")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        sub = commands.add_parser(name, help=help_text, description=help_text)
+        plots = sub.add_mutually_exclusive_group()
+        plots.add_argument('--no-plots', action='store_true', help="skip every figure")
+        plots.add_argument('--plots-dir', help="save figures as PNGs here instead of showing them")
+        sub.add_argument('--plot-workers', type=int, default=None,
+                         help="processes used to render figures (default: one per CPU)")
+        cache = sub.add_mutually_exclusive_group()
+        cache.add_argument('--no-cache', action='store_true', help="recompute every stage, bypassing the cache")
+        cache.add_argument('--clear-cache', action='store_true', help="empty the stage cache before running")
+        sub.add_argument('--cache-size', type=float, default=None,
+                         help="stage cache size limit in MB (default 1024)")
+        sub.add_argument('--profile-report', metavar='PATH',
+                         help="write per-stage time, memory and counts to this JSON file")
+        sub.add_argument('--trace-memory', action='store_true',
+                         help="with --profile-report, measure memory with tracemalloc instead of peak RSS")
+        sub.add_argument('--cprofile', metavar='STAGE',
+                         help="with --profile-report, also run cProfile on this stage")
+        if name == 'explore':
+            sub.add_argument('--content', metavar='CSV',
+                             help="per-session content features from title_embed.py --out, joined by Session ID")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import plotting
+    if args.no_plots:
+        plotting.configure('off')
+    elif args.plots_dir:
+        plotting.configure('save', os.path.abspath(args.plots_dir), args.plot_workers)
+
+    import stage_cache
+    max_bytes = int(args.cache_size * 2**20) if args.cache_size is not None else None
+    stage_cache.configure(enabled=not args.no_cache, max_bytes=max_bytes)
+    if args.clear_cache:
+        stage_cache.clear()
+
+    import instrument
+    if args.profile_report:
+        report = os.path.abspath(args.profile_report)
+        profile_path = f"{os.path.splitext(report)[0]}.{args.cprofile}.prof" if args.cprofile else None
+        instrument.configure(memory='tracemalloc' if args.trace_memory else 'rss',
+                             profile_stage=args.cprofile, profile_path=profile_path)
+
+    if getattr(args, 'content', None):
+        import title_embed
+        title_embed.configure(content_path=os.path.abspath(args.content))
+
+    script, _ = COMMANDS[args.command]
+    start = time.perf_counter()
+    runpy.run_path(os.path.join(HERE, script), run_name='__main__')
+    print(f"\n[{args.command}] finished in {time.perf_counter() - start:.1f}s ({stage_cache.summary()})")
+
+    if args.profile_report:
+        paths = instrument.write_report(report)
+        print("\n".join(instrument.summary()))
+        print("Profile report written to", ", ".join(os.path.relpath(path) for path in paths))
+        if args.cprofile and instrument.profile_written():
+            print("cProfile stats for", args.cprofile, "written to", os.path.relpath(profile_path))
+        elif args.cprofile:
+            print(f"Warning: stage {args.cprofile!r} was never entered, so no cProfile stats were written")
+
+
+if __name__ == '__main__':
+    main()
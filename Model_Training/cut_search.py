@@ -0,0 +1,213 @@
+"""Search for the Bayesian network's cut points from label counts.
+
+bay_net.py bins scroll rate, click rate and session length at hand-picked
+edges (features.SCROLL_RATE_CUTS etc.). With every parent observed, the
+network's posterior P(Doomscrolling | ScrollRate, ClickRate, SessionLength)
+is just the CPD: the share of doomscrolling sessions in the training
+sessions' (scroll, click, length) cell. Any binning can therefore be
+scored from counts, without pgmpy:
+
+- Each variable is bucketed once against K candidate edges (its quantiles
+  plus the current cuts). The bucket codes are reused for every evaluation.
+- Coordinate search: for one variable at a time, with the other two bins
+  fixed, one bincount gives label counts per (fold, other-cell, bucket).
+  Cumulative sums over the buckets then give the counts of all K(K-1)/2
+  (low, high) cut pairs at once, as arrays.
+- Each pair is scored by 5-fold held-out log-likelihood or mean fold AUC.
+  The best pair is kept, and the variables are cycled until nothing changes.
+
+Posteriors use add-alpha smoothing, (yes + alpha) / (n + 2 alpha). With
+alpha=0, empty cells get 0.5, as pgmpy's uniform CPD column does.
+
+    python Model_Training/cut_search.py [csv] [--objective auc] [--verify]
+
+The chosen cuts go straight into features.add_bayes_bins (or
+benchmark.fit_bayes_net), i.e. the same DiscreteBayesianNetwork structure.
+--verify refits that network with pgmpy on the chosen bins. It then checks
+that its posterior table matches the counts used by the search.
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.model_selection import KFold
+
+from features import (BAYES_FEATURES, CLICK_RATE_CUTS, CLICKS, DURATION, LABEL, SCROLL_EVENTS,
+                      SCROLL_RATE_CUTS, SESSION_LENGTH_CUTS, add_bayes_bins, minute_rate)
+from loader import BAYES_COLUMNS, DEFAULT_CSV, load_sessions
+
+# Keyword of each variable's cuts in add_bayes_bins, in BAYES_FEATURES order
+CUT_ARGS = ['scroll_cuts', 'click_cuts', 'length_cuts']
+DEFAULT_CUTS = [SCROLL_RATE_CUTS, CLICK_RATE_CUTS, SESSION_LENGTH_CUTS]
+N_BINS = 3
+
+
+def bayes_rates(df):
+    """The three values the network bins, in BAYES_FEATURES order."""
+    duration = df[DURATION].to_numpy()
+    return [minute_rate(df[SCROLL_EVENTS].to_numpy(), duration),
+            minute_rate(df[CLICKS].to_numpy(), duration),
+            np.asarray(duration, dtype=np.float64)]
+
+
+def candidate_edges(values, n_candidates, include=()):
+    """Sorted distinct quantiles of values, plus the given edges."""
+    quantiles = np.quantile(values, np.linspace(0, 1, n_candidates + 2)[1:-1])
+    return np.unique(np.concatenate([quantiles, np.asarray(include, dtype=np.float64)]))
+
+
+def _posterior(yes, total, alpha):
+    out = np.full(np.broadcast(yes, total).shape, 0.5)
+    np.divide(yes + alpha, total + 2 * alpha, out=out, where=(total + 2 * alpha) > 0)
+    return out
+
+
+def _log_likelihood(train, test, alpha):
+    """Held-out log-likelihood per candidate; counts are (..., fold, cell, label)."""
+    p = np.clip(_posterior(train[..., 1], train.sum(axis=-1), alpha), 1e-12, 1 - 1e-12)
+    return (test[..., 1] * np.log(p) + test[..., 0] * np.log1p(-p)).sum(axis=(-1, -2))
+
+
+def _auc(train, test, alpha):
+    """Mean over folds of the held-out AUC; each cell scores all of its sessions the same."""
+    score = _posterior(train[..., 1], train.sum(axis=-1), alpha)
+    pos, neg = test[..., 1], test[..., 0]
+    # AUC over cells: P(score_pos > score_neg) + half the ties, from pairwise cell comparisons
+    above = (score[..., :, None] > score[..., None, :]) + 0.5 * (score[..., :, None] == score[..., None, :])
+    wins = np.einsum('...a,...b,...ab->...', pos, neg, above)
+    pairs = pos.sum(axis=-1) * neg.sum(axis=-1)
+    fold_auc = np.divide(wins, pairs, out=np.full(wins.shape, np.nan), where=pairs > 0)
+    return np.nanmean(fold_auc, axis=-1)
+
+
+OBJECTIVES = {'loglik': _log_likelihood, 'auc': _auc}
+
+
+class CutSearch:
+    def __init__(self, rates, y, n_candidates=32, n_splits=5, seed=42, alpha=1.0, objective='loglik',
+                 start=DEFAULT_CUTS):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective: {objective}")
+        self.y = np.asarray(y, dtype=np.int64)
+        self.alpha = alpha
+        self.objective = objective
+        self.n_folds = n_splits
+
+        self.fold = np.empty(len(self.y), dtype=np.int64)
+        for k, (_, test) in enumerate(KFold(n_splits, shuffle=True, random_state=seed).split(self.y)):
+            self.fold[test] = k
+
+        # Bucket every value once: bucket e holds values in (edges[e-1], edges[e]],
+        # the same side as features.bin_codes
+        self.edges, self.buckets = [], []
+        for values, cuts in zip(rates, start):
+            edges = candidate_edges(values, n_candidates, include=cuts)
+            self.edges.append(edges)
+            self.buckets.append(np.searchsorted(edges, values, side='left'))
+        self.cuts = [tuple(np.searchsorted(e, c) for c in cuts) for e, cuts in zip(self.edges, start)]
+
+    def _bins(self, var, pair):
+        low, high = pair
+        return (self.buckets[var] > low).astype(np.int64) + (self.buckets[var] > high)
+
+    def _other_cell(self, var):
+        cell = np.zeros(len(self.y), dtype=np.int64)
+        for other in range(len(self.buckets)):
+            if other != var:
+                cell = cell * N_BINS + self._bins(other, self.cuts[other])
+        return cell
+
+    def _pair_counts(self, var):
+        """Label counts (n_pairs, fold, other cell x bin, label) for every cut pair of var, plus the pairs."""
+        n_buckets = len(self.edges[var]) + 1
+        n_other = N_BINS ** (len(self.buckets) - 1)
+        flat = ((self.fold * n_other + self._other_cell(var)) * n_buckets + self.buckets[var]) * 2 + self.y
+        counts = np.bincount(flat, minlength=self.n_folds * n_other * n_buckets * 2)
+        cumulative = counts.reshape(self.n_folds, n_other, n_buckets, 2).cumsum(axis=2)
+
+        low, high = np.triu_indices(n_buckets - 1, k=1)
+        total = cumulative[:, :, -1]
+        at_low, at_high = cumulative[:, :, low], cumulative[:, :, high]
+        # (fold, other, pair, bin, label) -> (pair, fold, other x bin, label)
+        binned = np.stack([at_low, at_high - at_low, total[:, :, None] - at_high], axis=3)
+        binned = binned.transpose(2, 0, 1, 3, 4).reshape(len(low), self.n_folds, n_other * N_BINS, 2)
+        return binned, list(zip(low, high))
+
+    def _score(self, binned):
+        train = binned.sum(axis=1, keepdims=True) - binned
+        return OBJECTIVES[self.objective](train, binned, self.alpha)
+
+    def score(self):
+        """Held-out objective of the current cuts."""
+        var = 0
+        binned, pairs = self._pair_counts(var)
+        return float(self._score(binned[pairs.index(self.cuts[var])][None])[0])
+
+    def run(self, max_rounds=10):
+        history = [self.score()]
+        for _ in range(max_rounds):
+            changed = False
+            for var in range(len(self.buckets)):
+                binned, pairs = self._pair_counts(var)
+                scores = self._score(binned)
+                best = int(np.nanargmax(scores))
+                if scores[best] > scores[pairs.index(self.cuts[var])] + 1e-12:
+                    self.cuts[var] = pairs[best]
+                    changed = True
+            history.append(self.score())
+            if not changed:
+                break
+        return history
+
+    def cut_values(self):
+        """{add_bayes_bins keyword: (low, high)} of the current cuts."""
+        return {arg: tuple(float(edges[i]) for i in pair)
+                for arg, edges, pair in zip(CUT_ARGS, self.edges, self.cuts)}
+
+
+def verify_with_pgmpy(df, cuts, search):
+    """Max difference between pgmpy's posteriors on the chosen bins and the counts' (alpha=0) ones, per session."""
+    from benchmark import fit_bayes_net
+    from posterior_table import PosteriorTable
+
+    _, inference = fit_bayes_net(df, **cuts)
+    table = PosteriorTable.from_inference(inference, 'Doomscrolling', BAYES_FEATURES)
+    pgmpy_yes = table.prob(add_bayes_bins(df.copy(), **cuts), 'yes')
+
+    bins = [search._bins(var, search.cuts[var]) for var in range(len(search.buckets))]
+    cell = np.ravel_multi_index(bins, (N_BINS,) * len(bins))
+    yes = np.bincount(cell, weights=search.y, minlength=N_BINS ** len(bins))
+    total = np.bincount(cell, minlength=N_BINS ** len(bins))
+    return float(np.abs(pgmpy_yes - _posterior(yes, total, 0.0)[cell]).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the Bayesian network's cut points")
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--objective', choices=list(OBJECTIVES), default='loglik')
+    parser.add_argument('--candidates', type=int, default=32, help="quantile edges tried per variable")
+    parser.add_argument('--alpha', type=float, default=1.0, help="add-alpha smoothing of the posteriors")
+    parser.add_argument('--verify', action='store_true', help="refit with pgmpy on the chosen bins and compare")
+    args = parser.parse_args()
+
+    df = load_sessions(args.csv, columns=BAYES_COLUMNS, float_dtype=np.float64)
+    start = time.perf_counter()
+    search = CutSearch(bayes_rates(df), df[LABEL].to_numpy(), n_candidates=args.candidates,
+                       alpha=args.alpha, objective=args.objective)
+    history = search.run()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.objective}: hand-picked cuts {history[0]:.4f} -> searched {history[-1]:.4f} "
+          f"({len(history) - 1} rounds, {elapsed:.2f}s, {len(df):,} sessions)")
+    cuts = search.cut_values()
+    for name, arg, default in zip(BAYES_FEATURES, CUT_ARGS, DEFAULT_CUTS):
+        print(f"  {name:<14} {tuple(default)} -> ({cuts[arg][0]:.4g}, {cuts[arg][1]:.4g})")
+    print("add_bayes_bins(df, " + ", ".join(f"{k}=({a:.6g}, {b:.6g})" for k, (a, b) in cuts.items()) + ")")
+
+    if args.verify:
+        print(f"pgmpy posteriors on the chosen bins match the counts (max error "
+              f"{verify_with_pgmpy(df, cuts, search):.2e})")
+
+
+if __name__ == '__main__':
+    main()
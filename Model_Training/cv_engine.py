@@ -0,0 +1,182 @@
+"""Parallel cross-validation shared by model.py and final_model.py.
+
+Every (model, fold) pair is an independent job sent to a process pool. The
+feature matrix and labels are placed in shared memory once and viewed by the
+workers without copying. Folds are described only by their test indices (the
+training set is everything else), so even leave-one-out never materializes N
+training index arrays.
+
+Results are gathered by (model, fold) and reduced in fold order, so the
+confusion matrices, ROC curves and AUCs are identical for any worker count.
+
+The training scripts run top to bottom without a __main__ guard, so workers
+are forked; where fork is unavailable (Windows) the jobs run in-process.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import auc, confusion_matrix, roc_curve
+
+import instrument
+
+# Set in each worker by _init_worker
+_shared = {}
+
+
+def test_folds(cv, X, y, groups=None):
+    """Test-index array of every split produced by an sklearn splitter."""
+    return [test_idx for _, test_idx in cv.split(X, y, groups)]
+
+
+def loo_folds(n_samples):
+    """Leave-one-out folds without going through LeaveOneOut.split."""
+    return list(np.arange(n_samples).reshape(-1, 1))
+
+
+def group_folds(groups, n_splits=5, seed=None):
+    """GroupKFold(n_splits, shuffle=True) folds without going through GroupKFold.split.
+
+    groups are integer codes 0..n_groups-1 (e.g. pd.factorize output). The
+    folds are the same as GroupKFold's on those codes, but found with one
+    lookup per row instead of an np.isin per fold, which is slow for
+    hundreds of thousands of groups.
+    """
+    groups = np.asarray(groups)
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    if n_splits > n_groups:
+        raise ValueError(f"Cannot have n_splits={n_splits} greater than the number of groups: {n_groups}")
+    shuffled = np.random.RandomState(seed).permutation(n_groups)
+    fold_of_group = np.empty(n_groups, dtype=np.int64)
+    fold_of_group[shuffled] = np.repeat(np.arange(n_splits), [len(s) for s in np.array_split(shuffled, n_splits)])
+    fold = fold_of_group[groups]
+    return [np.flatnonzero(fold == k) for k in range(n_splits)]
+
+
+def _to_shared(array):
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(models, X_spec, y_spec):
+    # Keep the SharedMemory handles alive for as long as the views are used
+    _shared['x_shm'], _shared['X'] = _attach(X_spec)
+    _shared['y_shm'], _shared['y'] = _attach(y_spec)
+    _shared['models'] = models
+
+
+def _fit_predict(models, X, y, job):
+    name, fold, test_idx = job
+    train_mask = np.ones(len(y), dtype=bool)
+    train_mask[test_idx] = False
+
+    model = clone(models[name])
+    model.fit(X[train_mask], y[train_mask])
+    y_pred = model.predict(X[test_idx])
+    y_proba = model.predict_proba(X[test_idx])[:, 1]
+    return name, fold, y_pred, y_proba
+
+
+def _run_job(job):
+    return _fit_predict(_shared['models'], _shared['X'], _shared['y'], job)
+
+
+def run_cv(models, X, y, folds, n_jobs=None):
+    """Fit and score every model on every fold.
+
+    models: dict of name -> unfitted sklearn estimator.
+    folds: list of test-index arrays (see test_folds / loo_folds).
+    Returns {name: [(y_pred, y_proba) per fold, in fold order]}.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    jobs = [(name, fold, np.asarray(test_idx)) for name in models for fold, test_idx in enumerate(folds)]
+    instrument.count('cv_folds', len(folds))
+    instrument.count('cv_fits', len(jobs))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        n_jobs = 1
+
+    if n_jobs <= 1:
+        outputs = [_fit_predict(models, X, y, job) for job in jobs]
+    else:
+        x_shm, X_spec = _to_shared(X)
+        y_shm, y_spec = _to_shared(y)
+        try:
+            with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_worker,
+                                     initargs=(models, X_spec, y_spec)) as pool:
+                chunksize = max(1, len(jobs) // (n_jobs * 4))
+                outputs = list(pool.map(_run_job, jobs, chunksize=chunksize))
+        finally:
+            for shm in (x_shm, y_shm):
+                shm.close()
+                shm.unlink()
+
+    results = {name: [None] * len(folds) for name in models}
+    for name, fold, y_pred, y_proba in outputs:
+        results[name][fold] = (y_pred, y_proba)
+    return results
+
+
+def kfold_summary(y, folds, fold_results):
+    """Mean confusion matrix, interpolated mean ROC and mean AUC over folds.
+
+    Folds whose test set has a single class still count towards the
+    confusion matrix but are skipped for ROC/AUC.
+    """
+    y = np.asarray(y)
+    cms, tprs, aucs = [], [], []
+    mean_fpr = np.linspace(0, 1, 100)
+
+    for test_idx, (y_pred, y_proba) in zip(folds, fold_results):
+        y_test = y[test_idx]
+        cms.append(confusion_matrix(y_test, y_pred, labels=[0, 1]))
+
+        if len(np.unique(y_test)) < 2:
+            continue
+
+        fpr, tpr, _ = roc_curve(y_test, y_proba)
+        aucs.append(auc(fpr, tpr))
+
+        tpr_interp = np.interp(mean_fpr, fpr, tpr)
+        tpr_interp[0] = 0.0
+        tprs.append(tpr_interp)
+
+    mean_cm = np.mean(cms, axis=0)
+    mean_tpr = np.mean(tprs, axis=0) if tprs else np.zeros_like(mean_fpr)
+    if tprs:
+        mean_tpr[-1] = 1.0
+    mean_auc = np.mean(aucs) if aucs else float('nan')
+
+    return mean_cm, mean_fpr, mean_tpr, mean_auc
+
+
+def pooled_summary(y, folds, fold_results):
+    """Confusion matrix and ROC over the pooled out-of-fold predictions (used for LOOCV)."""
+    y = np.asarray(y)
+    order = np.concatenate(folds)
+    y_true = y[order]
+    y_pred = np.concatenate([pred for pred, _ in fold_results])
+    y_proba = np.concatenate([proba for _, proba in fold_results])
+
+    cm = confusion_matrix(y_true, y_pred, labels=[0, 1])
+
+    # ROC requires both classes
+    if len(np.unique(y_true)) < 2:
+        return cm, np.array([0, 1]), np.array([0, 1]), float('nan')
+
+    fpr, tpr, _ = roc_curve(y_true, y_proba)
+    return cm, fpr, tpr, auc(fpr, tpr)
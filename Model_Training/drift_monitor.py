@@ -0,0 +1,384 @@
+"""Streaming drift monitor for the features the deployed model standardizes.
+
+model.js standardizes every session with the scaler mean and std of the
+training export, and those never change until the next retrain. If new
+sessions look different, the predictions degrade without any error. This
+monitor reads new exports chunk by chunk (loader.iter_csv_chunks) and
+compares them with the training data:
+
+- Baseline: the scaler mean/std parsed from model.js, and the training
+  export itself (session_data.csv) as the reference distribution.
+- Per feature, a bounded sketch of everything seen so far: count, mean and
+  M2 (merged chunk by chunk, Chan et al.), min/max, and two fixed
+  histograms. The PSI histogram has the baseline's deciles as edges. The KS
+  grid has the baseline's distinct values as edges (at most KS_GRID of its
+  quantiles for big baselines), with separate counts for values equal to a
+  grid point. The baseline ECDF only steps at those points, so the KS
+  distance from the grid counts is exact, not an approximation.
+- Per user (with a User ID column), the PSI histogram only, for PSI and a
+  decile-resolution KS once the user has min_user_sessions sessions.
+
+Memory is fixed by the grid sizes and the number of users, not by how many
+sessions stream through. Each chunk costs one searchsorted and bincount
+per feature. A feature is flagged when its PSI or KS crosses the thresholds
+or its mean has moved more than mean_shift scaler stds. With window_rows
+set, each window of sessions is also scored on its own, so drift that
+starts late is not diluted by the earlier sessions.
+
+Two samples from the same distribution still differ, the more so the
+smaller they are, and the baseline is only 50 sessions. So the PSI limit
+is the threshold plus the PSI such samples show on average,
+(bins - 1) * (1/n + 1/m), and the KS limit is at least the test's 5%
+critical value. Small windows and users with few sessions are then not
+flagged by chance.
+
+    python Model_Training/drift_monitor.py new_sessions.csv [more.csv ...] [--window 100000] [--json report.json]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS, add_ratio_features
+from loader import COUNT_COLUMNS, DEFAULT_CSV, RAW_FEATURE_COLUMNS, USER_ID, iter_csv_chunks, load_sessions
+from model_artifact import ARTIFACT_PATH, MODEL_JS_PATH, load_artifact
+
+PSI_BINS = 10
+KS_GRID = 1000
+PSI_THRESHOLD = 0.25        # the usual "significant shift" level
+KS_THRESHOLD = 0.15
+MEAN_SHIFT_THRESHOLD = 0.5  # in scaler standard deviations
+MIN_USER_SESSIONS = 20
+SMOOTHING = 0.5             # pseudo-count per PSI bin, so an empty bin is not log(0)
+KS_CRITICAL = 1.358         # two-sample KS coefficient at the 5% level
+
+
+def load_model_js_scaler(path=MODEL_JS_PATH):
+    """(mean, std) lists from the scaler constant in model.js."""
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    block = re.search(r'const scaler\s*=\s*\{(.*?)\};', source, re.S)
+    if block is None:
+        raise ValueError(f"No scaler constant in {path}")
+    values = {name: [float(v) for v in re.split(r'\s*,\s*', body.strip()) if v]
+              for name, body in re.findall(r'(mean|std)\s*:\s*\[([^\]]*)\]', block.group(1))}
+    return values['mean'], values['std']
+
+
+def psi(expected, actual):
+    """Population stability index between two proportion vectors (last axis, no zeros)."""
+    return ((actual - expected) * np.log(actual / expected)).sum(axis=-1)
+
+
+def psi_limit(threshold, n_bins, n, m):
+    """threshold plus the mean PSI of two same-distribution samples of sizes n and m."""
+    return threshold + (n_bins - 1) * (1 / np.maximum(n, 1) + 1 / m)
+
+
+def ks_limit(threshold, n, m):
+    """threshold, or the two-sample KS test's 5% critical value if that is higher."""
+    return np.maximum(threshold, KS_CRITICAL * np.sqrt(1 / np.maximum(n, 1) + 1 / m))
+
+
+class FeatureSketch:
+    """Bounded summary of one feature's stream, compared against a baseline sample."""
+
+    def __init__(self, name, baseline, scaler_mean, scaler_std, ks_grid=KS_GRID, psi_bins=PSI_BINS):
+        baseline = np.sort(np.asarray(baseline, dtype=np.float64))
+        baseline = baseline[np.isfinite(baseline)]
+        self.name = name
+        self.scaler_mean, self.scaler_std = scaler_mean, scaler_std
+        self.n_baseline = len(baseline)
+
+        # Decile edges; ties in a small baseline can merge bins
+        self.psi_edges = np.unique(np.quantile(baseline, np.linspace(0, 1, psi_bins + 1)[1:-1]))
+        self.psi_expected = self._proportions(np.bincount(self.psi_cells(baseline), minlength=self.n_psi))
+
+        grid = np.unique(baseline)
+        if len(grid) > ks_grid:
+            grid = np.unique(np.quantile(baseline, np.linspace(0, 1, ks_grid)))
+        self.grid = grid
+        self.ks_baseline = self._cdf(*self._grid_counts(baseline), len(baseline))
+
+        self.n = 0
+        self.mean = self.m2 = 0.0
+        self.min, self.max = np.inf, -np.inf
+        self.psi_counts = np.zeros(self.n_psi, dtype=np.int64)
+        self.below = np.zeros(len(grid) + 1, dtype=np.int64)   # strictly between grid points
+        self.equal = np.zeros(len(grid), dtype=np.int64)       # exactly on a grid point
+
+    @property
+    def n_psi(self):
+        return len(self.psi_edges) + 1
+
+    @staticmethod
+    def _proportions(counts):
+        """Bin proportions (last axis) with SMOOTHING added to every bin."""
+        counts = counts + SMOOTHING
+        return counts / counts.sum(axis=-1, keepdims=True)
+
+    def psi_cells(self, values):
+        return np.searchsorted(self.psi_edges, values, side='right')
+
+    def _grid_counts(self, values):
+        k = np.searchsorted(self.grid, values, side='left')
+        hit = k < len(self.grid)
+        hit[hit] = self.grid[k[hit]] == values[hit]
+        below = np.bincount(k[~hit], minlength=len(self.grid) + 1)
+        equal = np.bincount(k[hit], minlength=len(self.grid))
+        return below, equal
+
+    def _cdf(self, below, equal, n):
+        """ECDF just below and at every grid point, as one (2 * grid) vector."""
+        before = np.cumsum(below[:-1]) + np.concatenate([[0], np.cumsum(equal)[:-1]])
+        at = before + equal
+        return np.concatenate([before, at]) / max(n, 1)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        # Chan et al. merge of (n, mean, M2) with the chunk's moments
+        n, mean = len(values), values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+
+        self.psi_counts += np.bincount(self.psi_cells(values), minlength=self.n_psi)
+        below, equal = self._grid_counts(values)
+        self.below += below
+        self.equal += equal
+
+    def ks(self):
+        return float(np.abs(self._cdf(self.below, self.equal, self.n) - self.ks_baseline).max()) if self.n else 0.0
+
+    def report(self, thresholds):
+        """Moments, PSI and KS so far, their limits for this sample size, and which limits are crossed."""
+        std = np.sqrt(self.m2 / self.n) if self.n else 0.0
+        out = {
+            'feature': self.name,
+            'sessions': self.n,
+            'mean': self.mean,
+            'std': float(std),
+            'min': float(self.min) if self.n else None,
+            'max': float(self.max) if self.n else None,
+            'scaler_mean': self.scaler_mean,
+            'scaler_std': self.scaler_std,
+            'mean_shift': (self.mean - self.scaler_mean) / self.scaler_std if self.n else 0.0,
+            'std_ratio': float(std / self.scaler_std),
+            'psi': float(psi(self.psi_expected, self._proportions(self.psi_counts))) if self.n else 0.0,
+            'ks': self.ks(),
+            'psi_limit': float(psi_limit(thresholds['psi'], self.n_psi, self.n, self.n_baseline)),
+            'ks_limit': float(ks_limit(thresholds['ks'], self.n, self.n_baseline)),
+        }
+        out['flags'] = [name for name, crossed in [('psi', out['psi'] > out['psi_limit']),
+                                                   ('ks', out['ks'] > out['ks_limit']),
+                                                   ('mean_shift', abs(out['mean_shift']) > thresholds['mean_shift'])]
+                        if crossed and self.n]
+        return out
+
+    def reset(self):
+        """Forget the stream (the baseline stays); used between windows."""
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = np.inf, -np.inf
+        self.psi_counts[:] = 0
+        self.below[:] = 0
+        self.equal[:] = 0
+
+
+class UserSketches:
+    """PSI histograms of every user's sessions, for all monitored features at once."""
+
+    def __init__(self, sketches):
+        self.sketches = sketches
+        self.index = {}
+        self.ids = []
+        self.counts = np.zeros((len(sketches), 1024, max(s.n_psi for s in sketches)), dtype=np.int32)
+
+    def update(self, users, cells):
+        """users: array of user IDs; cells: one PSI cell array per feature."""
+        codes, uniques = pd.factorize(users)
+        index = self.index
+        new = [u for u in uniques if u not in index]
+        for user in new:
+            index[user] = len(self.ids)
+            self.ids.append(user)
+        if len(self.ids) > self.counts.shape[1]:
+            grown = np.zeros((self.counts.shape[0], 2 * len(self.ids), self.counts.shape[2]), dtype=np.int32)
+            grown[:, :self.counts.shape[1]] = self.counts
+            self.counts = grown
+        rows = np.fromiter((index[u] for u in uniques), dtype=np.int64, count=len(uniques))
+        n_cells = self.counts.shape[2]
+        for f, cell in enumerate(cells):
+            # Counted per chunk-local user, then added to each (distinct) user's row once
+            local = np.bincount(codes * n_cells + cell, minlength=len(uniques) * n_cells)
+            self.counts[f, rows] += local.reshape(len(uniques), n_cells).astype(np.int32)
+
+    def report(self, min_sessions=MIN_USER_SESSIONS, psi_threshold=PSI_THRESHOLD, ks_threshold=KS_THRESHOLD):
+        """DataFrame of every user with enough sessions: sessions, per-feature PSI and KS, flagged."""
+        counts = self.counts[:, :len(self.ids)]
+        sessions = counts[0].sum(axis=1)
+        keep = sessions >= min_sessions
+        out = pd.DataFrame({USER_ID: np.asarray(self.ids, dtype=object)[keep], 'sessions': sessions[keep]})
+        flagged = np.zeros(keep.sum(), dtype=bool)
+        for f, sketch in enumerate(self.sketches):
+            user_counts = counts[f, keep, :sketch.n_psi]
+            observed = FeatureSketch._proportions(user_counts.astype(np.float64))
+            out[f'psi {sketch.name}'] = user_psi = psi(sketch.psi_expected, observed)
+            # KS at decile resolution: the largest CDF gap at the PSI edges
+            gaps = np.abs(np.cumsum(observed, axis=1) - np.cumsum(sketch.psi_expected))[:, :-1]
+            out[f'ks {sketch.name}'] = user_ks = gaps.max(axis=1) if gaps.shape[1] else 0.0
+            n = sessions[keep]
+            flagged |= (user_psi > psi_limit(psi_threshold, sketch.n_psi, n, sketch.n_baseline)) \
+                | (user_ks > ks_limit(ks_threshold, n, sketch.n_baseline))
+        out['flagged'] = flagged
+        return out
+
+
+class DriftMonitor:
+    """Feature sketches for the whole stream, for the current window, and per user."""
+
+    def __init__(self, baseline_df, features, scaler_mean, scaler_std, window_rows=None,
+                 psi_threshold=PSI_THRESHOLD, ks_threshold=KS_THRESHOLD, mean_shift=MEAN_SHIFT_THRESHOLD):
+        baseline_df = add_ratio_features(baseline_df.copy(), dtype=np.float64)
+        self.features = list(features)
+        self.total = [FeatureSketch(f, baseline_df[f], m, s) for f, m, s in zip(features, scaler_mean, scaler_std)]
+        self.window = [FeatureSketch(f, baseline_df[f], m, s) for f, m, s in zip(features, scaler_mean, scaler_std)] \
+            if window_rows else None
+        self.window_rows = window_rows
+        self.window_fill = 0
+        self.windows = []
+        self.users = UserSketches(self.total)
+        self.thresholds = {'psi': psi_threshold, 'ks': ks_threshold, 'mean_shift': mean_shift}
+
+    def update(self, chunk):
+        """Add one chunk of a session export (raw count columns, optionally User ID)."""
+        chunk = add_ratio_features(chunk, dtype=np.float64)
+        values = [chunk[f].to_numpy(dtype=np.float64) for f in self.features]
+        for sketch, column in zip(self.total, values):
+            sketch.update(column)
+        if USER_ID in chunk:
+            self.users.update(chunk[USER_ID].to_numpy(), [s.psi_cells(v) for s, v in zip(self.total, values)])
+        if self.window is not None:
+            self._update_windows(values)
+
+    def _update_windows(self, values):
+        start = 0
+        while start < len(values[0]):
+            stop = min(len(values[0]), start + self.window_rows - self.window_fill)
+            for sketch, column in zip(self.window, values):
+                sketch.update(column[start:stop])
+            self.window_fill += stop - start
+            start = stop
+            if self.window_fill == self.window_rows:
+                self._close_window()
+
+    def _close_window(self):
+        reports = [s.report(self.thresholds) for s in self.window]
+        self.windows.append({'start': sum(w['sessions'] for w in self.windows), 'sessions': self.window_fill,
+                             'features': {r['feature']: {k: r[k] for k in ('psi', 'ks', 'mean_shift')}
+                                          for r in reports},
+                             'flagged': sorted(r['feature'] for r in reports if r['flags'])})
+        for sketch in self.window:
+            sketch.reset()
+        self.window_fill = 0
+
+    def report(self, min_user_sessions=MIN_USER_SESSIONS):
+        if self.window is not None and self.window_fill:
+            self._close_window()
+        features = [s.report(self.thresholds) for s in self.total]
+        users = self.users.report(min_user_sessions, self.thresholds['psi'], self.thresholds['ks']) \
+            if self.users.ids else None
+        return {
+            'thresholds': self.thresholds,
+            'features': features,
+            'windows': self.windows,
+            'users_checked': 0 if users is None else len(users),
+            'users_flagged': [] if users is None else users.loc[users['flagged']].drop(columns='flagged')
+                                                          .to_dict('records'),
+            'drift': any(f['flags'] for f in features),
+        }
+
+
+def monitor(paths, baseline_csv=DEFAULT_CSV, model_js=MODEL_JS_PATH, artifact_path=ARTIFACT_PATH,
+            features=None, window_rows=None, chunksize=500_000, **thresholds):
+    """Stream the exports at `paths` through a DriftMonitor; returns (monitor, sessions read)."""
+    baseline_df = load_sessions(baseline_csv, RAW_FEATURE_COLUMNS, np.float64)
+    mean, std = load_model_js_scaler(model_js)
+    names = load_artifact(artifact_path)['features']
+    extra = [f for f in features or () if f not in names]
+    if extra:
+        # Features model.js does not standardize are compared with the baseline's own moments
+        engineered = add_ratio_features(baseline_df.copy(), dtype=np.float64)
+        mean = mean + [float(engineered[f].mean()) for f in extra]
+        std = std + [float(engineered[f].std(ddof=0)) or 1.0 for f in extra]
+        names = names + extra
+    drift = DriftMonitor(baseline_df, names, mean, std, window_rows, **thresholds)
+    columns = list(COUNT_COLUMNS)
+    n_rows = 0
+    for path in paths:
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = columns + ([USER_ID] if USER_ID in header else [])
+        for chunk in iter_csv_chunks(path, usecols, chunksize, np.float64):
+            drift.update(chunk)
+            n_rows += len(chunk)
+    return drift, n_rows
+
+
+def print_report(report, n_rows, elapsed):
+    print(f"{n_rows:,} sessions in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9) / 1e6:.2f}M rows/s)")
+    rows = pd.DataFrame(report['features']).set_index('feature')
+    rows['flags'] = rows['flags'].map(lambda f: ', '.join(f) or '-')
+    print(rows[['mean', 'scaler_mean', 'mean_shift', 'std_ratio', 'psi', 'psi_limit', 'ks', 'ks_limit', 'flags']]
+          .to_string(float_format=lambda v: f"{v:.3f}"))
+    flagged_windows = [w for w in report['windows'] if w['flagged']]
+    if report['windows']:
+        print(f"{len(flagged_windows)} of {len(report['windows'])} windows flagged")
+        for window in flagged_windows[:10]:
+            print(f"  sessions {window['start']:,}+{window['sessions']:,}: {', '.join(window['flagged'])}")
+    if report['users_checked']:
+        print(f"{len(report['users_flagged']):,} of {report['users_checked']:,} users with enough sessions flagged")
+    print("Drift detected" if report['drift'] else "No drift beyond the thresholds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare new session exports with the model's training data")
+    parser.add_argument('exports', nargs='+', help="session CSVs, read in order")
+    parser.add_argument('--baseline', default=DEFAULT_CSV, help="training export (reference distribution)")
+    parser.add_argument('--model-js', default=MODEL_JS_PATH)
+    parser.add_argument('--all-features', action='store_true',
+                        help="monitor all nine engineered features, not only the model's three")
+    parser.add_argument('--window', type=int, default=None, help="also score every WINDOW sessions on their own")
+    parser.add_argument('--psi', type=float, default=PSI_THRESHOLD)
+    parser.add_argument('--ks', type=float, default=KS_THRESHOLD)
+    parser.add_argument('--mean-shift', type=float, default=MEAN_SHIFT_THRESHOLD)
+    parser.add_argument('--min-user-sessions', type=int, default=MIN_USER_SESSIONS)
+    parser.add_argument('--json', help="write the full report (including flagged users) here")
+    parser.add_argument('--fail-on-drift', action='store_true', help="exit with status 1 if any feature drifted")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    drift, n_rows = monitor(args.exports, args.baseline, args.model_js,
+                            features=FEATURE_COLUMNS if args.all_features else None, window_rows=args.window,
+                            psi_threshold=args.psi, ks_threshold=args.ks, mean_shift=args.mean_shift)
+    report = drift.report(args.min_user_sessions)
+    print_report(report, n_rows, time.perf_counter() - start)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+    if args.fail_on_drift and report['drift']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
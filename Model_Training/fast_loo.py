@@ -0,0 +1,221 @@
+"""Leave-one-out CV without N cold refits.
+
+loo_metrics in final_model.py refits LogisticRegression once per session on
+features scaled with a StandardScaler fit on *all* sessions, so the held-out
+row leaks into its own scaling. Here every fold gets its own scaler, derived
+from full-data running sums minus the held-out row, and the refits are
+avoided or shortened:
+
+- lr_loo_newton: one analytic Newton step from the full-data solution per
+  held-out row (the approximate-LOO / influence formula), no refits at all.
+- lr_loo_warm: real per-fold refits, warm-started from the full-data
+  coefficients mapped into each fold's scaling.
+- bayes_loo: the bay_net.py network is MLE counts, so removing a session is
+  subtracting one count; this is exact, not an approximation.
+
+lr_loo_exact is the leak-free reference the approximations are measured
+against. Run this file for a report on the study export:
+    python Model_Training/fast_loo.py
+"""
+import time
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from cv_engine import pooled_summary
+from features import BAYES_FEATURES
+
+
+def sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+def loo_scalers(X):
+    """Mean and std (ddof=0, like StandardScaler) of X with each row left out in turn.
+
+    Computed from centered full-data sums minus the held-out row, so every
+    fold's scaler costs O(d) instead of a pass over the data.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    mean = X.mean(axis=0)
+    centered = X - mean
+    sq_total = (centered ** 2).sum(axis=0)
+
+    shift = -centered / (n - 1)
+    means = mean + shift
+    var = (sq_total - centered ** 2) / (n - 1) - shift ** 2
+    stds = np.sqrt(np.clip(var, 0, None))
+    stds[stds == 0] = 1.0
+    return means, stds
+
+
+def _full_fit(X, y, C, max_iter):
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(C=C, max_iter=max_iter).fit(scaler.transform(X), y)
+    return scaler, model
+
+
+def lr_loo_exact(X, y, C=1.0, max_iter=1000, rows=None):
+    """Reference LOOCV: per-fold StandardScaler and a cold LogisticRegression fit per row.
+
+    rows restricts the held-out rows (e.g. a sample, to estimate deviation at scale).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    rows = np.arange(len(y)) if rows is None else np.asarray(rows)
+    proba = np.empty(len(rows))
+    for k, i in enumerate(rows):
+        train = np.ones(len(y), dtype=bool)
+        train[i] = False
+        scaler, model = _full_fit(X[train], y[train], C, max_iter)
+        proba[k] = model.predict_proba(scaler.transform(X[i:i + 1]))[0, 1]
+    return proba
+
+
+def lr_loo_warm(X, y, C=1.0, max_iter=1000, rows=None):
+    """Per-fold refits warm-started from the full-data solution."""
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    rows = np.arange(len(y)) if rows is None else np.asarray(rows)
+    scaler, full = _full_fit(X, y, C, max_iter)
+    means, stds = loo_scalers(X)
+    w, b = full.coef_[0], full.intercept_[0]
+
+    proba = np.empty(len(rows))
+    model = LogisticRegression(C=C, max_iter=max_iter, warm_start=True)
+    for k, i in enumerate(rows):
+        train = np.ones(len(y), dtype=bool)
+        train[i] = False
+        mu, sd = means[i], stds[i]
+
+        # Same decision function as the full fit, expressed in this fold's scaling
+        model.coef_ = (w * sd / scaler.scale_)[None, :]
+        model.intercept_ = np.array([b + w @ ((mu - scaler.mean_) / scaler.scale_)])
+        model.fit((X[train] - mu) / sd, y[train])
+        proba[k] = model.predict_proba(((X[i] - mu) / sd)[None, :])[0, 1]
+    return proba
+
+
+def lr_loo_newton(X, y, C=1.0, max_iter=1000):
+    """Approximate LOO probabilities from one Newton step off the full-data fit.
+
+    With H the penalized Hessian at the full solution and q_i = x_i' H^-1 x_i,
+    removing row i moves its linear predictor by (p_i - y_i) q_i / (1 - w_i q_i),
+    where w_i = p_i (1 - p_i). Everything is one batched solve, O(n d^2).
+    Scaling uses the full-data scaler; the held-out row's effect on it is
+    part of the approximation error reported by compare_lr_loo.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    scaler, full = _full_fit(X, y, C, max_iter)
+
+    Xa = np.hstack([scaler.transform(X), np.ones((len(X), 1))])
+    theta = np.append(full.coef_[0], full.intercept_[0])
+    eta = Xa @ theta
+    p = sigmoid(eta)
+    weights = p * (1 - p)
+
+    # sklearn minimizes C * log-loss + ||coef||^2 / 2; the intercept is not penalized
+    penalty = np.full(Xa.shape[1], 1.0 / C)
+    penalty[-1] = 0.0
+    H = Xa.T @ (Xa * weights[:, None]) + np.diag(penalty)
+
+    q = np.einsum('ij,ij->i', Xa, np.linalg.solve(H, Xa.T).T)
+    leverage = weights * q
+    eta_loo = eta + (p - y) * q / (1 - leverage)
+    return sigmoid(eta_loo)
+
+
+def bayes_loo(df, features=BAYES_FEATURES, label='doomscroll_label'):
+    """Exact LOO P(doomscrolling | bins) for the bay_net.py network.
+
+    df holds the categorical bins from features.add_bayes_bins. Each row's
+    posterior is its parent configuration's CPD column after subtracting that
+    row's own count; configurations left empty get pgmpy's uniform 0.5.
+    """
+    sizes = [len(df[f].cat.categories) for f in features]
+    codes = np.ravel_multi_index([df[f].cat.codes.to_numpy() for f in features], sizes)
+    y = df[label].to_numpy().astype(np.float64)
+
+    n_configs = int(np.prod(sizes))
+    n_total = np.bincount(codes, minlength=n_configs)[codes] - 1
+    n_yes = np.bincount(codes, weights=y, minlength=n_configs)[codes] - y
+
+    proba = np.full(len(df), 0.5)
+    np.divide(n_yes, n_total, out=proba, where=n_total > 0)
+    return proba
+
+
+def loo_auc(y, proba):
+    """Confusion matrix, ROC and AUC of pooled LOO probabilities (threshold 0.5)."""
+    y = np.asarray(y)
+    pred = (proba >= 0.5).astype(int)
+    return pooled_summary(y, [np.arange(len(y))], [(pred, proba)])
+
+
+def compare_lr_loo(X, y, C=1.0, max_iter=1000, exact_sample=None, seed=0):
+    """Time the fast LR modes against exact LOOCV and report their deviation.
+
+    If exact_sample is given, the exact and warm-start refits only run on that
+    many random rows and their full-size timings are extrapolated.
+    """
+    n = len(y)
+    rows = np.arange(n)
+    if exact_sample is not None and exact_sample < n:
+        rows = np.sort(np.random.default_rng(seed).choice(n, exact_sample, replace=False))
+    scale = n / len(rows)
+
+    start = time.perf_counter()
+    exact = lr_loo_exact(X, y, C, max_iter, rows)
+    t_exact = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    warm = lr_loo_warm(X, y, C, max_iter, rows)
+    t_warm = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    newton = lr_loo_newton(X, y, C, max_iter)
+    t_newton = time.perf_counter() - start
+
+    report = {'n': n, 'exact_rows': len(rows), 'exact_seconds': t_exact}
+    for name, proba, seconds in [('warm', warm, t_warm), ('newton', newton[rows], t_newton)]:
+        report[name] = {
+            'seconds': seconds,
+            'speedup': t_exact / seconds,
+            'max_abs_dev': float(np.abs(proba - exact).max()),
+            'mean_abs_dev': float(np.abs(proba - exact).mean()),
+            'label_agreement': float(((proba >= 0.5) == (exact >= 0.5)).mean()),
+        }
+    return report
+
+
+def _print_report(report):
+    print(f"LR LOOCV, n={report['n']} (exact refits on {report['exact_rows']} rows), "
+          f"exact ~{report['exact_seconds']:.2f}s")
+    for name in ('warm', 'newton'):
+        r = report[name]
+        print(f"  {name:<7} {r['seconds']:8.3f}s  speedup {r['speedup']:8.1f}x  "
+              f"max |dp| {r['max_abs_dev']:.2e}  mean |dp| {r['mean_abs_dev']:.2e}  "
+              f"same label {r['label_agreement']:.1%}")
+
+
+if __name__ == '__main__':
+    from features import TOP_FEATURES, add_bayes_bins, add_ratio_features
+    from loader import RAW_FEATURE_COLUMNS, load_sessions
+
+    df = load_sessions(columns=RAW_FEATURE_COLUMNS, float_dtype=np.float64)
+    add_ratio_features(df, dtype=np.float64)
+    add_bayes_bins(df)
+    X = df[TOP_FEATURES].to_numpy()
+    y = df['doomscroll_label'].to_numpy()
+
+    _print_report(compare_lr_loo(X, y))
+    for name, proba in [('exact', lr_loo_exact(X, y)), ('newton', lr_loo_newton(X, y))]:
+        print(f"LR LOOCV AUC ({name}): {loo_auc(y, proba)[3]:.3f}")
+
+    start = time.perf_counter()
+    bayes = bayes_loo(df)
+    print(f"Bayesian network LOOCV AUC (count subtraction, {time.perf_counter() - start:.4f}s): "
+          f"{loo_auc(y, bayes)[3]:.3f}")
@@ -0,0 +1,148 @@
+"""Shared feature engineering for bay_net.py, model.py and final_model.py.
+
+Every engineered column is computed with whole-column NumPy operations (no
+row-wise df.apply), so the same code handles the 50-row study export and
+pooled multi-user exports with millions of sessions.
+"""
+import numpy as np
+import pandas as pd
+
+# Raw columns written by exportToCSV in popup.js
+DURATION = 'Duration (minutes)'
+SCROLL_DISTANCE = 'Total Scroll Distance'
+CLICKS = 'Total Clicks'
+SCROLL_EVENTS = 'Scroll Events Count'
+LABEL = 'doomscroll_label'
+URL = 'URL'
+
+# Totals exportToCSV leaves out, rebuilt from raw storage dumps (sessionize.py)
+SHORTS_TIME = 'Time in Shorts (minutes)'
+VIDEO_TIME = 'Time Watching Video (minutes)'
+WATCH_TIME = 'Actual Watch Time (minutes)'
+NUDGES_SHOWN = 'Nudges Shown'
+WATCH_COLUMNS = [SHORTS_TIME, VIDEO_TIME, WATCH_TIME]
+
+# Continuous engineered features
+SCROLL_INTENSITY = 'Scroll Intensity (px/min)'
+CLICK_RATE = 'Click Rate (clicks/min)'
+SCROLL_PER_CLICK = 'Scroll per Click'
+AVG_SCROLL_SPEED = 'Avg Scroll Speed (px/event)'
+ENGAGEMENT = 'Engagement Score'
+
+# All nine candidate features used by model.py
+FEATURE_COLUMNS = [
+    DURATION,
+    SCROLL_DISTANCE,
+    CLICKS,
+    SCROLL_EVENTS,
+    SCROLL_INTENSITY,
+    CLICK_RATE,
+    SCROLL_PER_CLICK,
+    AVG_SCROLL_SPEED,
+    ENGAGEMENT
+]
+
+# Features used by final_model.py and predictDoomscrollProbability in model.js
+TOP_FEATURES = [SCROLL_INTENSITY, ENGAGEMENT, DURATION]
+
+# Per-session content features from the offline title labels (title_embed.py)
+PRODUCTIVE_SHARE = 'Productive Video Share'
+UNPRODUCTIVE_SHARE = 'Unproductive Video Share'
+TITLED_VIDEOS = 'Titled Videos'
+LAST_VIDEO_LABEL = 'Last Video Label'
+CONTENT_FEATURES = [PRODUCTIVE_SHARE, UNPRODUCTIVE_SHARE, TITLED_VIDEOS]
+
+# Columns decoded from the session's last URL (url_parse.py), added by
+# engineer_features whenever the frame has the URL column
+VIDEO_ID = 'Video ID'
+PLAYLIST_ID = 'Playlist ID'
+PLAYLIST_INDEX = 'Playlist Index'
+PAGE_TYPE = 'Page Type'
+URL_COLUMNS = [VIDEO_ID, PLAYLIST_ID, PLAYLIST_INDEX, PAGE_TYPE]
+
+# Discretized features for the Bayesian network in bay_net.py.
+# Cut points are (low/medium, medium/high) edges; a value has to be strictly
+# greater than an edge to move up a bin.
+SCROLL_RATE_CUTS = (10, 30)        # scroll events per minute
+CLICK_RATE_CUTS = (0.5, 2)         # clicks per minute
+SESSION_LENGTH_CUTS = (10, 30)     # minutes
+RATE_LEVELS = ['low', 'medium', 'high']
+LENGTH_LEVELS = ['short', 'medium', 'long']
+BAYES_FEATURES = ['ScrollRate', 'ClickRate', 'SessionLength']
+# The binned rates divide by duration + RATE_EPS, as bay_net.py always has:
+# exportToCSV rounds Duration to whole minutes, so a session under 30 s
+# exports as 0 and its nonzero rates land in 'high'
+RATE_EPS = 1e-6
+
+
+def safe_rate(numerator, denominator):
+    """Elementwise numerator / denominator, 0 wherever the denominator is not positive."""
+    num = np.asarray(numerator, dtype=np.float64)
+    den = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros(np.broadcast(num, den).shape, dtype=np.float64)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def minute_rate(count, duration):
+    """count / (duration + RATE_EPS): the per-minute rate the Bayes bins are cut on."""
+    return np.asarray(count, dtype=np.float64) / (np.asarray(duration, dtype=np.float64) + RATE_EPS)
+
+
+def per_nonzero(numerator, denominator):
+    """numerator / denominator with zero denominators replaced by 1 (the old .replace(0, 1))."""
+    num = np.asarray(numerator, dtype=np.float64)
+    den = np.asarray(denominator, dtype=np.float64)
+    return num / np.where(den == 0, 1.0, den)
+
+
+def bin_codes(values, cuts):
+    """Bin index for each value: 0 if <= cuts[0], 1 if <= cuts[1], ... (int8)."""
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.searchsorted(np.asarray(cuts, dtype=np.float64), values, side='left')
+    codes[np.isnan(values)] = 0
+    return codes.astype(np.int8)
+
+
+def discretize(values, cuts, labels):
+    """Categorical version of bin_codes with the given level names."""
+    if len(labels) != len(cuts) + 1:
+        raise ValueError(f"Need {len(cuts) + 1} labels for {len(cuts)} cut points, got {len(labels)}")
+    return pd.Categorical.from_codes(bin_codes(values, cuts), categories=labels, ordered=True)
+
+
+def add_ratio_features(df, dtype=np.float32):
+    """Add the five continuous engineered features to df (in place) and return it."""
+    duration = df[DURATION].to_numpy()
+    distance = df[SCROLL_DISTANCE].to_numpy()
+    clicks = df[CLICKS].to_numpy()
+    events = df[SCROLL_EVENTS].to_numpy()
+
+    df[SCROLL_INTENSITY] = safe_rate(distance, duration).astype(dtype)
+    df[CLICK_RATE] = safe_rate(clicks, duration).astype(dtype)
+    df[SCROLL_PER_CLICK] = per_nonzero(distance, clicks).astype(dtype)
+    df[AVG_SCROLL_SPEED] = per_nonzero(distance, events).astype(dtype)
+    df[ENGAGEMENT] = safe_rate(np.asarray(clicks, dtype=np.float64) * 1000, distance).astype(dtype)
+    return df
+
+
+def add_bayes_bins(df, scroll_cuts=SCROLL_RATE_CUTS, click_cuts=CLICK_RATE_CUTS,
+                   length_cuts=SESSION_LENGTH_CUTS):
+    """Add the categorical ScrollRate, ClickRate and SessionLength columns to df (in place)."""
+    duration = df[DURATION].to_numpy()
+
+    df['ScrollRate'] = discretize(minute_rate(df[SCROLL_EVENTS].to_numpy(), duration), scroll_cuts, RATE_LEVELS)
+    df['ClickRate'] = discretize(minute_rate(df[CLICKS].to_numpy(), duration), click_cuts, RATE_LEVELS)
+    df['SessionLength'] = discretize(duration, length_cuts, LENGTH_LEVELS)
+    return df
+
+
+def engineer_features(df, dtype=np.float32, **cuts):
+    """Add every engineered column (continuous, binned and, given a URL column, URL_COLUMNS) to df and return it."""
+    add_ratio_features(df, dtype=dtype)
+    add_bayes_bins(df, **cuts)
+    if URL in df:
+        # Imported here: url_parse takes its column names from this module
+        from url_parse import add_url_features
+        add_url_features(df, URL)
+    return df
@@ -1,34 +1,38 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import KFold, LeaveOneOut
+from sklearn.model_selection import KFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import confusion_matrix, roc_curve, auc, roc_auc_score, classification_report
-import matplotlib.pyplot as plt
-import seaborn as sns
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.metrics import roc_auc_score, classification_report
 import os
 from scipy.stats import ttest_ind
 
+import cv_engine
+import instrument
+import plotting
+import stage_cache
+from cv_engine import kfold_summary, loo_folds, pooled_summary, run_cv, test_folds
+from features import TOP_FEATURES, add_ratio_features
+from loader import RAW_FEATURE_COLUMNS, load_sessions
+from resample_stats import feature_report
+from model_artifact import ARTIFACT_PATH, MODEL_JS_PATH, build_artifact, save_artifact, write_model_js
+
 # 1. Load Dataset
-cwd = os.getcwd()
-file_path = os.path.join(cwd, "Model_Training", "session_data.csv")
+instrument.stage('load')
+file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data.csv")
 
 if not os.path.isfile(file_path):
     raise FileNotFoundError(f"CSV file not found at {file_path}")
 
-df = pd.read_csv(file_path)
+df = load_sessions(file_path, columns=RAW_FEATURE_COLUMNS, float_dtype=np.float64)
 print(f"Total sessions: {len(df)}")
 
 # 2. Feature Engineering
-df['Scroll Intensity (px/min)'] = df['Total Scroll Distance'] / df['Duration (minutes)']
-df['Click Rate (clicks/min)'] = df['Total Clicks'] / df['Duration (minutes)']
-df['Scroll per Click'] = df['Total Scroll Distance'] / df['Total Clicks'].replace(0,1)
-df['Avg Scroll Speed (px/event)'] = df['Total Scroll Distance'] / df['Scroll Events Count'].replace(0,1)
-df['Engagement Score'] = df.apply(
-    lambda row: (row['Total Clicks'] * 1000 / row['Total Scroll Distance']) if row['Total Scroll Distance'] > 0 else 0,
-    axis=1
-)
+instrument.stage('features')
+# Full precision here: the scaler and LR constants below are copied into model.js
+add_ratio_features(df, dtype=np.float64)
 
 # 3. Use Pre-Labeled Column
 df['is_doomscrolling'] = df['doomscroll_label']
@@ -38,7 +42,7 @@ print(f"Doomscrolling sessions: {y.sum()} ({y.sum()/len(y)*100:.1f}%)")
 print(f"Focused sessions: {len(y)-y.sum()} ({(len(y)-y.sum())/len(y)*100:.1f}%)")
 
 # 4. Select Top Features Only
-top_features = ['Scroll Intensity (px/min)', 'Engagement Score', 'Duration (minutes)']
+top_features = list(TOP_FEATURES)
 X = df[top_features]
 
 # Print Feature Summary (mean/std per label)
@@ -57,8 +61,11 @@ print("\nFeature Summary (mean/std per label):")
 print(summary_df)
 
 # Print feature importance using Random Forest
+instrument.stage('rf_importance')
+# (fitted once per distinct data/parameters, see stage_cache.py)
 rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-rf_model.fit(X, y)
+rf_model = stage_cache.cached('rf_importance', lambda: rf_model.fit(X, y),
+                              {'X': X, 'y': y, 'model': rf_model})
 importance_df = pd.DataFrame({
     'feature': X.columns,
     'importance': rf_model.feature_importances_
@@ -67,121 +74,65 @@ print("\nFeature Importance (Random Forest):")
 print(importance_df)
 
 # 5. Scale Features
+instrument.stage('scale')
 scaler = StandardScaler()
 X_scaled = scaler.fit_transform(X)
 
 # 6. Define Models
 lr_model = LogisticRegression(max_iter=1000, random_state=42)
+# Nearest past sessions in the same standardized space as session_index.py
+knn_model = KNeighborsClassifier(n_neighbors=5, algorithm='kd_tree')
 
 
-# --- FIXED: Safe cross-validation function ---
-def cross_val_metrics(model, X, y, cv):
-    cms, tprs, aucs = [], [], []
-    mean_fpr = np.linspace(0, 1, 100)
-
-    for train_idx, test_idx in cv.split(X, y):
-        X_train, X_test = X[train_idx], X[test_idx]
-        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
-
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-
-        # SAFE CM: always 0 and 1 labels
-        cm = confusion_matrix(y_test, y_pred, labels=[0, 1])
-        cms.append(cm)
-
-        # skip ROC if test set has one class
-        if len(np.unique(y_test)) < 2:
-            continue
-
-        y_proba = model.predict_proba(X_test)[:, 1]
-        fpr, tpr, _ = roc_curve(y_test, y_proba)
-        aucs.append(auc(fpr, tpr))
-
-        tpr_interp = np.interp(mean_fpr, fpr, tpr)
-        tpr_interp[0] = 0.0
-        tprs.append(tpr_interp)
-
-    mean_cm = np.mean(cms, axis=0)
-    mean_tpr = np.mean(tprs, axis=0) if tprs else np.zeros_like(mean_fpr)
-    if tprs:
-        mean_tpr[-1] = 1.0
-    mean_auc = np.mean(aucs) if aucs else float('nan')
-
-    return mean_cm, mean_fpr, mean_tpr, mean_auc
-
+# 7. Cross-validation engine: every (model, fold) pair runs in a process pool
+# with X_scaled in shared memory (see cv_engine.py)
+cv_models = {'rf': rf_model, 'lr': lr_model, 'knn': knn_model}
 
 # 8. Run 5-Fold CV
+instrument.stage('kfold_cv')
 kf = KFold(n_splits=5, shuffle=True, random_state=42)
+kf_folds = test_folds(kf, X_scaled, y)
+kf_results = stage_cache.cached('kfold_cv', lambda: run_cv(cv_models, X_scaled, y, kf_folds),
+                                {'X': X_scaled, 'y': y, 'models': cv_models, 'folds': kf_folds},
+                                code=[cv_engine])
 
-rf_cm_5, rf_fpr_5, rf_tpr_5, rf_auc_5 = cross_val_metrics(rf_model, X_scaled, y, kf)
-lr_cm_5, lr_fpr_5, lr_tpr_5, lr_auc_5 = cross_val_metrics(lr_model, X_scaled, y, kf)
+rf_cm_5, rf_fpr_5, rf_tpr_5, rf_auc_5 = kfold_summary(y, kf_folds, kf_results['rf'])
+lr_cm_5, lr_fpr_5, lr_tpr_5, lr_auc_5 = kfold_summary(y, kf_folds, kf_results['lr'])
+knn_auc_5 = kfold_summary(y, kf_folds, kf_results['knn'])[3]
 
 print(f"\nRandom Forest 5-Fold AUC: {rf_auc_5:.3f}")
 print(f"Logistic Regression 5-Fold AUC: {lr_auc_5:.3f}")
+print(f"k-NN (k=5) 5-Fold AUC: {knn_auc_5:.3f}")
 
 # 9. Plot Confusion Matrix
 def plot_cm(cm, title):
-    plt.figure(figsize=(5,4))
-    sns.heatmap(cm, annot=True, fmt=".1f", cmap='Blues',
-                xticklabels=['Focused','Doomscrolling'],
-                yticklabels=['Focused','Doomscrolling'])
-    plt.xlabel("Predicted")
-    plt.ylabel("Actual")
-    plt.title(title)
-    plt.show()
+    plotting.add(plotting.draw_cm, cm, title, name=title)
 
 plot_cm(rf_cm_5, "Random Forest 5-Fold CV")
 plot_cm(lr_cm_5, "Logistic Regression 5-Fold CV")
 
 # 10. Plot ROC Curve
 def plot_roc(fpr, tpr, auc_score, title):
-    plt.figure(figsize=(6,5))
-    plt.plot(fpr, tpr, label=f'AUC={auc_score:.3f}')
-    plt.plot([0,1],[0,1],'k--')
-    plt.xlabel('False Positive Rate')
-    plt.ylabel('True Positive Rate')
-    plt.title(title)
-    plt.legend()
-    plt.show()
+    plotting.add(plotting.draw_roc, fpr, tpr, auc_score, title, name=title)
 
 plot_roc(rf_fpr_5, rf_tpr_5, rf_auc_5, "Random Forest 5-Fold ROC")
 plot_roc(lr_fpr_5, lr_tpr_5, lr_auc_5, "Logistic Regression 5-Fold ROC")
 
 
-# --- FIXED: LOOCV that handles single-class safely ---
-def loo_metrics(model, X_scaled, y):
-    y_true, y_pred, y_proba = [], [], []
-
-    for train_idx, test_idx in LeaveOneOut().split(X_scaled, y):
-        X_train, X_test = X_scaled[train_idx], X_scaled[test_idx]
-        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
-
-        model.fit(X_train, y_train)
-        pred = model.predict(X_test)
-        proba = model.predict_proba(X_test)[:, 1]
-
-        y_true.append(y_test.values[0])
-        y_pred.append(pred[0])
-        y_proba.append(proba[0])
-
-    cm = confusion_matrix(y_true, y_pred, labels=[0, 1])
-
-    # ROC requires both classes
-    if len(np.unique(y_true)) < 2:
-        return cm, np.array([0,1]), np.array([0,1]), float('nan')
-
-    fpr, tpr, _ = roc_curve(y_true, y_proba)
-    roc_auc = auc(fpr, tpr)
-    return cm, fpr, tpr, roc_auc
-
-
 # 11. Run LOOCV
-rf_cm_loo, rf_fpr_loo, rf_tpr_loo, rf_auc_loo = loo_metrics(rf_model, X_scaled, y)
-lr_cm_loo, lr_fpr_loo, lr_tpr_loo, lr_auc_loo = loo_metrics(lr_model, X_scaled, y)
+instrument.stage('loocv')
+loo = loo_folds(len(y))
+loo_results = stage_cache.cached('loocv', lambda: run_cv(cv_models, X_scaled, y, loo),
+                                 {'X': X_scaled, 'y': y, 'models': cv_models, 'folds': loo},
+                                 code=[cv_engine])
+
+rf_cm_loo, rf_fpr_loo, rf_tpr_loo, rf_auc_loo = pooled_summary(y, loo, loo_results['rf'])
+lr_cm_loo, lr_fpr_loo, lr_tpr_loo, lr_auc_loo = pooled_summary(y, loo, loo_results['lr'])
+knn_auc_loo = pooled_summary(y, loo, loo_results['knn'])[3]
 
 print(f"\nRandom Forest LOOCV AUC: {rf_auc_loo:.3f}")
 print(f"Logistic Regression LOOCV AUC: {lr_auc_loo:.3f}")
+print(f"k-NN (k=5) LOOCV AUC: {knn_auc_loo:.3f}")
 
 plot_cm(rf_cm_loo, "Random Forest LOOCV")
 plot_roc(rf_fpr_loo, rf_tpr_loo, rf_auc_loo, "Random Forest LOOCV ROC")
@@ -190,6 +141,7 @@ plot_cm(lr_cm_loo, "Logistic Regression LOOCV")
 plot_roc(lr_fpr_loo, lr_tpr_loo, lr_auc_loo, "Logistic Regression LOOCV ROC")
 
 # 12. T-tests & Cohen's d for hypothesis testing
+instrument.stage('hypothesis_tests')
 def cohen_d(x1, x2):
     """Compute Cohen's d for two independent samples."""
     n1, n2 = len(x1), len(x2)
@@ -210,8 +162,29 @@ for feature in top_features:
     print(f"  t-statistic: {t_stat:.3f}, p-value: {p_val:.4f}")
     print(f"  Cohen's d: {d_val:.3f}")
 
+# Uncertainty of the above: bootstrap CIs and permutation p-values (see resample_stats.py)
+report = feature_report(df, top_features, label='is_doomscrolling', n_resamples=2000, seed=42)
+print("\n--- Bootstrap 95% CIs and permutation tests (2000 resamples) ---")
+for feature, row in report.iterrows():
+    print(f"\nFeature: {feature}")
+    print(f"  Cohen's d: {row['cohen_d']:.3f} [{row['cohen_d_low']:.3f}, {row['cohen_d_high']:.3f}]")
+    print(f"  AUC: {row['auc']:.3f} [{row['auc_low']:.3f}, {row['auc_high']:.3f}]")
+    print(f"  Permutation p-value: {row['p_permutation']:.4f}")
+
 # End of final_model.py (Needed for script conversion)
+instrument.stage('export')
+# CV only fits copies, so fit the exported model on every session here
+lr_model.fit(X_scaled, y)
 print("LR Coefs:", lr_model.coef_)
 print("LR Intercept:", lr_model.intercept_)
 print("Scaler means:", scaler.mean_)
 print("Scaler std:", scaler.scale_)
+
+# Save the fitted model and regenerate the extension's model.js from it
+artifact = build_artifact(scaler, lr_model, top_features, n_sessions=len(y))
+artifact = save_artifact(artifact)
+write_model_js(artifact)
+print("Saved model artifact to", os.path.relpath(ARTIFACT_PATH), "and regenerated", os.path.relpath(MODEL_JS_PATH))
+
+instrument.stage('plots')
+plotting.finish()
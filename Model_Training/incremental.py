@@ -0,0 +1,256 @@
+"""Incremental retraining from new session exports.
+
+Instead of re-reading the whole history and refitting from scratch, an
+IncrementalTrainer keeps state that new sessions are folded into:
+
+- RunningScaler: count, mean and sum of squared deviations (batched Welford),
+  giving the same mean_/scale_ as a StandardScaler fit on every row so far.
+- an SGDClassifier with log loss, updated with partial_fit. When a batch
+  shifts the scaler, the weights are first re-expressed in the new scaling so
+  the decision function learned so far is unchanged.
+- the bay_net.py network as count tables over (ScrollRate, ClickRate,
+  SessionLength, label). MLE CPDs are ratios of these counts, so adding
+  sessions is an addition and the posteriors match a full refit exactly.
+
+The state is saved together with a checkpoint: the latest session Date
+ingested and the Session IDs at that date. A nightly job only trains on rows
+newer than the checkpoint, so its cost follows the new data, not the history:
+    python Model_Training/incremental.py path/to/export.csv [--export]
+"""
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+
+from features import (BAYES_FEATURES, LABEL, LENGTH_LEVELS, RATE_LEVELS, TOP_FEATURES,
+                      add_bayes_bins, add_ratio_features)
+from loader import CHUNK_ROWS, COUNT_COLUMNS, DATE, DEFAULT_CSV, SESSION_ID, iter_csv_chunks
+from posterior_table import PosteriorTable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(HERE, "artifacts", "incremental_state.pkl")
+STATE_VERSION = 1
+
+BAYES_TARGET = 'Doomscrolling'
+BAYES_STATES = {'ScrollRate': RATE_LEVELS, 'ClickRate': RATE_LEVELS,
+                'SessionLength': LENGTH_LEVELS, BAYES_TARGET: ['no', 'yes']}
+
+
+class RunningScaler:
+    """StandardScaler statistics (ddof=0) updated one batch at a time."""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean_ = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if not len(X):
+            return self
+        n_batch = len(X)
+        batch_mean = X.mean(axis=0)
+        batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+
+        # Chan et al. merge of two (count, mean, M2) summaries
+        total = self.n + n_batch
+        delta = batch_mean - self.mean_
+        self.mean_ = self.mean_ + delta * n_batch / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.n * n_batch / total
+        self.n = total
+        return self
+
+    @property
+    def scale_(self):
+        scale = np.sqrt(self.m2 / max(self.n, 1))
+        scale[scale == 0] = 1.0
+        return scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class BayesCounts:
+    """Session counts per (ScrollRate, ClickRate, SessionLength, label) cell."""
+
+    def __init__(self):
+        self.shape = tuple(len(BAYES_STATES[v]) for v in BAYES_FEATURES + [BAYES_TARGET])
+        self.counts = np.zeros(self.shape, dtype=np.int64)
+
+    def update(self, df):
+        """df holds the categorical bins from features.add_bayes_bins and the label."""
+        index = [df[v].cat.codes.to_numpy() for v in BAYES_FEATURES] + [df[LABEL].to_numpy()]
+        flat = np.ravel_multi_index(index, self.shape)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.shape)
+        return self
+
+    def joint(self):
+        """P(ScrollRate) P(ClickRate) P(SessionLength) P(Doomscrolling | parents), as pgmpy's MLE fit gives."""
+        n = self.counts.sum()
+        parents = self.counts.sum(axis=-1)
+        n_axes = len(BAYES_FEATURES)
+
+        joint = np.ones(self.shape)
+        for axis in range(n_axes):
+            other = tuple(a for a in range(n_axes + 1) if a != axis)
+            marginal = self.counts.sum(axis=other) / n
+            joint *= np.expand_dims(marginal, tuple(a for a in range(n_axes + 1) if a != axis))
+
+        # Parent configurations never seen get a uniform CPD column, like pgmpy
+        cpd = np.full(self.shape, 1.0 / self.shape[-1])
+        np.divide(self.counts, parents[..., None], out=cpd, where=parents[..., None] > 0)
+        return joint * cpd
+
+    def posterior_table(self):
+        return PosteriorTable.from_joint(self.joint(), BAYES_FEATURES, BAYES_STATES, BAYES_TARGET)
+
+
+class IncrementalTrainer:
+    def __init__(self, features=TOP_FEATURES, alpha=1e-3, epochs=5, seed=0):
+        self.features = list(features)
+        self.epochs = epochs
+        self.scaler = RunningScaler(len(self.features))
+        self.lr = SGDClassifier(loss='log_loss', alpha=alpha, random_state=seed)
+        self.bayes = BayesCounts()
+        self.rng = np.random.default_rng(seed)
+        # Checkpoint: latest Date ingested and the Session IDs seen at that Date
+        self.last_date = None
+        self.ids_at_last_date = set()
+
+    @property
+    def n_sessions(self):
+        return self.scaler.n
+
+    def new_rows(self, chunk, checkpoint=None):
+        """Mask of the rows in chunk that come after checkpoint (default: the current one)."""
+        last_date, seen_ids = checkpoint or (self.last_date, self.ids_at_last_date)
+        if last_date is None:
+            return np.ones(len(chunk), dtype=bool)
+        dates = chunk[DATE]
+        at_checkpoint = (dates == last_date) & ~chunk[SESSION_ID].isin(seen_ids)
+        return ((dates > last_date) | at_checkpoint).to_numpy()
+
+    def _advance_checkpoint(self, chunk):
+        latest = chunk[DATE].max()
+        if self.last_date is None or latest > self.last_date:
+            self.last_date = latest
+            self.ids_at_last_date = set()
+        self.ids_at_last_date.update(chunk.loc[chunk[DATE] == self.last_date, SESSION_ID])
+
+    def partial_fit(self, df):
+        """Fold a batch of raw sessions (counts, label, Date, Session ID) into the state."""
+        if not len(df):
+            return self
+        df = add_bayes_bins(add_ratio_features(df.copy(), dtype=np.float64))
+        X = df[self.features].to_numpy()
+        y = df[LABEL].to_numpy()
+
+        old_mean, old_scale = self.scaler.mean_.copy(), self.scaler.scale_
+        self.scaler.update(X)
+        if hasattr(self.lr, 'coef_'):
+            # Same decision function as before, expressed in the updated scaling
+            w = self.lr.coef_[0].copy()
+            self.lr.coef_[0] = w * self.scaler.scale_ / old_scale
+            self.lr.intercept_[0] += w @ ((self.scaler.mean_ - old_mean) / old_scale)
+
+        X_scaled = self.scaler.transform(X)
+        for _ in range(self.epochs):
+            order = self.rng.permutation(len(y))
+            self.lr.partial_fit(X_scaled[order], y[order], classes=[0, 1])
+
+        self.bayes.update(df)
+        if DATE in df and SESSION_ID in df:
+            self._advance_checkpoint(df)
+        return self
+
+    def ingest_csv(self, path, chunksize=CHUNK_ROWS):
+        """Train on the sessions in a CSV export newer than the checkpoint; returns the row count."""
+        columns = [SESSION_ID, DATE] + COUNT_COLUMNS + [LABEL]
+        # Exports are not sorted by Date, so every chunk is compared with the
+        # checkpoint as it was before this file
+        checkpoint = (self.last_date, set(self.ids_at_last_date))
+        added = 0
+        for chunk in iter_csv_chunks(path, columns, chunksize, float_dtype=np.float64):
+            chunk = chunk[self.new_rows(chunk, checkpoint)]
+            self.partial_fit(chunk)
+            added += len(chunk)
+        return added
+
+    def predict_proba(self, df):
+        df = add_ratio_features(df.copy(), dtype=np.float64)
+        return self.lr.predict_proba(self.scaler.transform(df[self.features].to_numpy()))[:, 1]
+
+
+def save_state(trainer, path=STATE_PATH):
+    state = {
+        'version': STATE_VERSION,
+        'features': trainer.features,
+        'epochs': trainer.epochs,
+        'scaler': (trainer.scaler.n, trainer.scaler.mean_, trainer.scaler.m2),
+        'lr': trainer.lr,
+        'bayes_counts': trainer.bayes.counts,
+        'rng': trainer.rng.bit_generator.state,
+        'checkpoint': (trainer.last_date, trainer.ids_at_last_date),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_state(path=STATE_PATH):
+    """The saved trainer, or None if there is no state (or it is from another version)."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != STATE_VERSION:
+        return None
+
+    trainer = IncrementalTrainer(state['features'], epochs=state['epochs'])
+    trainer.scaler.n, trainer.scaler.mean_, trainer.scaler.m2 = state['scaler']
+    trainer.lr = state['lr']
+    trainer.bayes.counts = state['bayes_counts']
+    trainer.rng.bit_generator.state = state['rng']
+    trainer.last_date, trainer.ids_at_last_date = state['checkpoint']
+    return trainer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train on the sessions added since the last checkpoint")
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--reset', action='store_true', help="ignore the saved state and start over")
+    parser.add_argument('--export', action='store_true',
+                        help="write the LR model to the artifact and regenerate model.js")
+    args = parser.parse_args()
+
+    trainer = None if args.reset else load_state(args.state)
+    if trainer is None:
+        trainer = IncrementalTrainer()
+
+    start = time.perf_counter()
+    added = trainer.ingest_csv(args.csv)
+    elapsed = time.perf_counter() - start
+    save_state(trainer, args.state)
+    print(f"Ingested {added} new sessions in {elapsed:.3f}s ({trainer.n_sessions} total), "
+          f"checkpoint {trainer.last_date}")
+
+    table = trainer.bayes.posterior_table()
+    print("P(Doomscrolling=yes | ScrollRate=high, ClickRate=low, SessionLength=long):",
+          f"{table.query({'ScrollRate': 'high', 'ClickRate': 'low', 'SessionLength': 'long'})[1]:.4f}")
+
+    if args.export and added:
+        from model_artifact import build_artifact, save_artifact, write_model_js
+        artifact = build_artifact(trainer.scaler, trainer.lr, trainer.features, trainer.n_sessions)
+        artifact = save_artifact(artifact)
+        write_model_js(artifact)
+        print("Exported the updated model")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Per-stage timing, memory and operation counts for the training scripts.
+
+Scripts mark their stages in one of two ways:
+
+- stage(name) ends the previous top-level stage and starts the next one,
+  so a top-to-bottom script needs one line per section and no indentation;
+- span(name) is a context manager for a nested stage.
+
+count(name, n) adds n operations (CV fits, pgmpy queries, rows scored, ...)
+to the innermost open stage. Every stage records:
+
+- wall time and CPU time of this process (cv_engine's worker processes
+  show up as wall time only, and are outside a cProfile too);
+- memory: with memory='tracemalloc', the peak of Python allocations above
+  the level at the start of the stage (NumPy buffers included); otherwise
+  how far the process's peak RSS rose during the stage;
+- its counts.
+
+report() returns the stage tree as JSON-ready dicts. write_report() saves
+it together with a collapsed-stack file ("load;parse 1234" per line, self
+time in microseconds) that flamegraph.pl and speedscope read directly.
+With profile_stage set, that stage also runs under cProfile, one profiler
+across every entry into it, and finish() dumps its stats to a .prof file
+next to the report.
+
+cli.py turns it on with --profile-report. Otherwise configure() is never
+called: stage() and span() then return a shared no-op context and count()
+returns immediately, so the markers cost one dict lookup each.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows: no RSS high-water mark, memory is left out
+    resource = None
+
+_config = {'enabled': False, 'memory': 'rss', 'profile_stage': None, 'profile_path': None, 'profile_written': False}
+_NULL = nullcontext()
+
+
+class Span:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.counts = {}
+        self.wall = self.cpu = 0.0
+        self.peak_bytes = None
+        self.is_stage = False
+        self._running = False
+        self._child_peak = 0
+        self._profile = None
+
+    def path(self):
+        names, span = [], self
+        while span is not None and span.parent is not None:
+            names.append(span.name)
+            span = span.parent
+        return names[::-1]
+
+    def start(self):
+        if _config['memory'] == 'tracemalloc':
+            current, peak = tracemalloc.get_traced_memory()
+            # The parent's peak so far is kept before the counter restarts for this span
+            if self.parent is not None:
+                self.parent._child_peak = max(self.parent._child_peak, peak)
+            tracemalloc.reset_peak()
+            self._base, self._child_peak = current, 0
+        else:
+            self._base = _max_rss()
+        if self.name == _config['profile_stage']:
+            # Kept across re-entries (bay_net.py enters 'queries' twice) and dumped by finish()
+            if self._profile is None:
+                self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._running = True
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.wall += time.perf_counter() - self._wall
+        self.cpu += time.process_time() - self._cpu
+        if self._profile is not None:
+            self._profile.disable()
+        if _config['memory'] == 'tracemalloc':
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            self.peak_bytes = max(self.peak_bytes or 0, peak - self._base)
+            if self.parent is not None:
+                self.parent._child_peak = max(self.parent._child_peak, peak)
+        elif self._base is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, _max_rss() - self._base)
+
+    def child(self, name):
+        for span in self.children:
+            if span.name == name:
+                return span
+        span = Span(name, self)
+        self.children.append(span)
+        return span
+
+    def as_dict(self):
+        out = {'name': self.name, 'wall_s': round(self.wall, 6), 'cpu_s': round(self.cpu, 6)}
+        if self.peak_bytes is not None:
+            out['peak_mb'] = round(self.peak_bytes / 2**20, 3)
+        if self.counts:
+            out['counts'] = dict(self.counts)
+        if self.children:
+            out['children'] = [span.as_dict() for span in self.children]
+        return out
+
+
+def _max_rss():
+    """Peak resident set size of this process in bytes, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024    # kB on Linux
+
+
+_root = Span('run')
+_stack = [_root]
+
+
+class _Context:
+    """Opens a span on entry and closes it on exit."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append(_stack[-1].child(self.name).start())
+
+    def __exit__(self, *exc):
+        _stack.pop().stop()
+
+
+def configure(enabled=True, memory='rss', profile_stage=None, profile_path=None):
+    """Start a fresh run. memory is 'rss' or 'tracemalloc' (exact but slows allocation-heavy code)."""
+    global _root
+    if memory not in ('rss', 'tracemalloc'):
+        raise ValueError(f"Unknown memory mode: {memory}")
+    if tracemalloc.is_tracing() and (not enabled or memory != 'tracemalloc'):
+        tracemalloc.stop()
+    _config.update(enabled=enabled, memory=memory, profile_stage=profile_stage,
+                   profile_path=profile_path or f"{profile_stage}.prof", profile_written=False)
+    if enabled and memory == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _root = Span('run')
+    _stack[:] = [_root]
+    if enabled:
+        _root.start()
+
+
+def enabled():
+    return _config['enabled']
+
+
+def span(name):
+    """Context manager timing a stage nested in the current one."""
+    if not _config['enabled']:
+        return _NULL
+    return _Context(name)
+
+
+def stage(name):
+    """End the current top-level stage, if any, and start the next one (not inside a span)."""
+    if not _config['enabled']:
+        return
+    _end_stage()
+    span = _root.child(name)
+    span.is_stage = True
+    _stack.append(span.start())
+
+
+def _end_stage():
+    if len(_stack) > 1 and _stack[-1].is_stage:
+        _stack.pop().stop()
+
+
+def count(name, n=1):
+    """Add n operations called name to the innermost open stage."""
+    if not _config['enabled']:
+        return
+    counts = _stack[-1].counts
+    counts[name] = counts.get(name, 0) + n
+
+
+def finish():
+    """Close the last stage() and the run itself, and dump the profile_stage's cProfile stats."""
+    if not _config['enabled']:
+        return
+    _end_stage()
+    if _root._running:
+        _root.stop()
+    profiles = [span._profile for span in _walk(_root) if span._profile is not None]
+    if profiles and not _config['profile_written']:
+        # Spans of that name under different parents are merged into one file
+        stats = pstats.Stats(*profiles)
+        os.makedirs(os.path.dirname(os.path.abspath(_config['profile_path'])), exist_ok=True)
+        stats.dump_stats(_config['profile_path'])
+        _config['profile_written'] = True
+
+
+def profile_written():
+    """Whether finish() wrote the profile_stage's stats (False if the stage was never entered)."""
+    return _config['profile_written']
+
+
+def report():
+    """The run's stage tree: name, wall_s, cpu_s, peak_mb, counts and children per stage."""
+    out = _root.as_dict()
+    out['memory'] = _config['memory']
+    totals = {}
+    for span in _walk(_root):
+        for name, n in span.counts.items():
+            totals[name] = totals.get(name, 0) + n
+    out['total_counts'] = totals
+    return out
+
+
+def _walk(span):
+    yield span
+    for child in span.children:
+        yield from _walk(child)
+
+
+def collapsed_stacks():
+    """Flame graph input: one 'stage;substage self_time_us' line per stage."""
+    lines = []
+    for span in _walk(_root):
+        if span is _root:
+            continue
+        self_time = span.wall - sum(child.wall for child in span.children)
+        lines.append(f"{';'.join(span.path())} {max(int(self_time * 1e6), 0)}")
+    return lines
+
+
+def write_report(path):
+    """Write the JSON report to path and the collapsed stacks next to it (.folded)."""
+    finish()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=2)
+    folded = os.path.splitext(path)[0] + ".folded"
+    with open(folded, 'w') as f:
+        f.write("\n".join(collapsed_stacks()) + "\n")
+    return path, folded
+
+
+def summary(top=8):
+    """Lines listing the whole run, then its slowest stages (wall time, CPU time, memory, counts)."""
+    spans = sorted((s for s in _walk(_root) if s is not _root), key=lambda s: -s.wall)[:top]
+    lines = []
+    for span in [_root] + spans:
+        memory = f"{span.peak_bytes / 2**20:8.1f} MB" if span.peak_bytes is not None else ""
+        counts = ", ".join(f"{k}={v:,}" for k, v in span.counts.items())
+        lines.append(f"  {'/'.join(span.path()) or span.name:<32} {span.wall:8.2f}s wall {span.cpu:8.2f}s cpu {memory}  {counts}")
+    return lines
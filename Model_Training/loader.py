@@ -0,0 +1,164 @@
+"""Loading session exports with compact dtypes and a Parquet cache.
+
+The first load of a CSV streams it in chunks and writes a Parquet copy under
+.cache/ next to it; later loads read only the requested columns from that
+copy. The cache is rebuilt whenever the CSV's size or modification time
+changes. Without pyarrow installed every load falls back to the chunked CSV
+reader.
+
+Exports merged from several users carry a User ID column (see per_user.py);
+it is optional and loaded as a categorical like URL. So are the watch-time
+and nudge columns that sessionize.py rebuilds from raw storage dumps.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from features import CLICKS, DURATION, LABEL, NUDGES_SHOWN, SCROLL_DISTANCE, SCROLL_EVENTS, URL, WATCH_COLUMNS
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data.csv")
+CACHE_DIR = ".cache"
+CACHE_VERSION = 3
+CHUNK_ROWS = 500_000
+
+SESSION_ID = 'Session ID'
+DATE = 'Date'
+USER_ID = 'User ID'
+
+COUNT_COLUMNS = [DURATION, SCROLL_DISTANCE, CLICKS, SCROLL_EVENTS]
+FLOAT_COLUMNS = COUNT_COLUMNS + WATCH_COLUMNS
+CATEGORY_COLUMNS = [URL, USER_ID]
+
+# Column sets used by the training scripts
+RAW_FEATURE_COLUMNS = COUNT_COLUMNS + [LABEL]
+BAYES_COLUMNS = [DURATION, CLICKS, SCROLL_EVENTS, LABEL]
+
+
+def session_dtypes(float_dtype=np.float32):
+    """dtype mapping for read_csv; Date is parsed separately."""
+    dtypes = {col: float_dtype for col in FLOAT_COLUMNS}
+    dtypes[LABEL] = np.int8
+    dtypes[NUDGES_SHOWN] = np.int32
+    dtypes[SESSION_ID] = str
+    dtypes[URL] = str
+    dtypes[USER_ID] = str
+    return dtypes
+
+
+def _finish_chunk(chunk, float_dtype):
+    if DATE in chunk:
+        chunk[DATE] = pd.to_datetime(chunk[DATE], utc=True, format='ISO8601')
+    for col in FLOAT_COLUMNS:
+        if col in chunk:
+            chunk[col] = chunk[col].astype(float_dtype)
+    return chunk
+
+
+def iter_csv_chunks(path, columns=None, chunksize=CHUNK_ROWS, float_dtype=np.float32):
+    """Yield typed DataFrame chunks of a session CSV (strings stay uncategorized)."""
+    dtypes = session_dtypes(float_dtype)
+    if columns is not None:
+        dtypes = {col: dt for col, dt in dtypes.items() if col in columns}
+    reader = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    for chunk in reader:
+        yield _finish_chunk(chunk, float_dtype)
+
+
+def _categorize(df):
+    for col in CATEGORY_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def read_sessions_csv(path, columns=None, chunksize=CHUNK_ROWS, float_dtype=np.float32):
+    """Read a session CSV chunk by chunk into one compact DataFrame."""
+    chunks = list(iter_csv_chunks(path, columns, chunksize, float_dtype))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(chunks, ignore_index=True)
+    return _categorize(df)
+
+
+def cache_paths(csv_path):
+    folder, name = os.path.split(os.path.abspath(csv_path))
+    stem = os.path.splitext(name)[0]
+    base = os.path.join(folder, CACHE_DIR, stem)
+    return base + ".parquet", base + ".parquet.json"
+
+
+def _fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def cache_is_fresh(csv_path):
+    parquet_path, meta_path = cache_paths(csv_path)
+    if not (os.path.isfile(parquet_path) and os.path.isfile(meta_path)):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == _fingerprint(csv_path)
+
+
+def build_cache(csv_path, chunksize=CHUNK_ROWS):
+    """Convert the CSV to Parquet one chunk at a time (full float64 precision)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_path, meta_path = cache_paths(csv_path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    fingerprint = _fingerprint(csv_path)
+    tmp_path = parquet_path + ".tmp"
+
+    writer = None
+    try:
+        for chunk in iter_csv_chunks(csv_path, chunksize=chunksize, float_dtype=np.float64):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"{csv_path} has no rows to cache")
+
+    os.replace(tmp_path, parquet_path)
+    with open(meta_path, 'w') as f:
+        json.dump(fingerprint, f)
+    return parquet_path
+
+
+def read_cache(csv_path, columns=None, float_dtype=np.float32):
+    import pyarrow.parquet as pq
+
+    parquet_path, _ = cache_paths(csv_path)
+    read_dictionary = [c for c in CATEGORY_COLUMNS if columns is None or c in columns]
+    table = pq.read_table(parquet_path, columns=columns, read_dictionary=read_dictionary)
+    df = table.to_pandas()
+    for col in FLOAT_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype(float_dtype)
+    return df
+
+
+def load_sessions(path=DEFAULT_CSV, columns=None, float_dtype=np.float32, use_cache=True):
+    """Load a session export, reading only `columns` (all of them if None).
+
+    Counts come back as float_dtype, URL as a categorical and Date as a UTC
+    datetime.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"CSV file not found at {path}")
+    columns = list(columns) if columns is not None else None
+
+    if use_cache:
+        try:
+            if not cache_is_fresh(path):
+                build_cache(path)
+            return read_cache(path, columns, float_dtype)
+        except ImportError:
+            pass  # no pyarrow, read the CSV directly
+    return read_sessions_csv(path, columns, float_dtype=float_dtype)
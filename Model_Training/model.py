@@ -1,43 +1,36 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import KFold, LeaveOneOut
+from sklearn.model_selection import KFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import confusion_matrix, roc_curve, auc
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 
+import cv_engine
+import instrument
+import plotting
+import stage_cache
+from cv_engine import kfold_summary, loo_folds, pooled_summary, run_cv, test_folds
+import title_embed
+from features import FEATURE_COLUMNS, add_ratio_features
+from loader import RAW_FEATURE_COLUMNS, SESSION_ID, load_sessions
+
 # 1. Load Dataset
-cwd = os.getcwd()
-file_path = os.path.join(cwd, "Model_Training", "session_data.csv")
+instrument.stage('load')
+file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data.csv")
 if not os.path.isfile(file_path):
     raise FileNotFoundError(f"CSV file not found at {file_path}")
 
-df = pd.read_csv(file_path)
+# float64 counts keep the reported RF/LR AUCs identical to the plain read_csv runs
+df = load_sessions(file_path, columns=[SESSION_ID] + RAW_FEATURE_COLUMNS, float_dtype=np.float64)
 
 # 2. Feature Engineering
-df['Scroll Intensity (px/min)'] = df['Total Scroll Distance'] / df['Duration (minutes)']
-df['Click Rate (clicks/min)'] = df['Total Clicks'] / df['Duration (minutes)']
-df['Scroll per Click'] = df['Total Scroll Distance'] / df['Total Clicks'].replace(0,1)
-df['Avg Scroll Speed (px/event)'] = df['Total Scroll Distance'] / df['Scroll Events Count'].replace(0,1)
-df['Engagement Score'] = df.apply(
-    lambda row: (row['Total Clicks'] * 1000 / row['Total Scroll Distance']) if row['Total Scroll Distance'] > 0 else 0,
-    axis=1
-)
-
-feature_columns = [
-    'Duration (minutes)',
-    'Total Scroll Distance',
-    'Total Clicks',
-    'Scroll Events Count',
-    'Scroll Intensity (px/min)',
-    'Click Rate (clicks/min)',
-    'Scroll per Click',
-    'Avg Scroll Speed (px/event)',
-    'Engagement Score'
-]
+instrument.stage('features')
+add_ratio_features(df)
+# With cli.py explore --content, the title-label shares join the candidates
+df, content_columns = title_embed.join_configured_content(df)
+
+feature_columns = list(FEATURE_COLUMNS) + content_columns
 
 X = df[feature_columns]
 
@@ -49,11 +42,13 @@ print(f"Doomscrolling sessions: {y.sum()} ({y.sum()/len(y)*100:.1f}%)")
 print(f"Focused sessions: {len(y)-y.sum()} ({(len(y)-y.sum())/len(y)*100:.1f}%)")
 
 # 4. Scale Features
+instrument.stage('scale')
 scaler = StandardScaler()
 X_scaled = scaler.fit_transform(X)
 X_scaled_df = pd.DataFrame(X_scaled, columns=feature_columns)
 
 # 5. Feature Importance
+instrument.stage('rf_importance')
 def feature_importance_rank(X, y):
     rf = RandomForestClassifier(n_estimators=100, random_state=42)
     rf.fit(X, y)
@@ -63,16 +58,14 @@ def feature_importance_rank(X, y):
     }).sort_values('importance', ascending=False)
     return importance_df
 
-importance_df = feature_importance_rank(X_scaled_df, y)
+importance_df = stage_cache.cached('rf_importance', lambda: feature_importance_rank(X_scaled_df, y),
+                                   {'X': X_scaled_df, 'y': y}, code=[feature_importance_rank])
 print("Feature Importance:\n", importance_df)
 
-plt.figure(figsize=(10,6))
-sns.barplot(x='importance', y='feature', data=importance_df)
-plt.title("Random Forest Feature Importance")
-plt.tight_layout()
-plt.show()
+plotting.add(plotting.draw_importance, importance_df, name="Random Forest Feature Importance")
 
 # 6. Automated Feature Analysis
+instrument.stage('feature_analysis')
 def feature_summary(df, features, label='is_doomscrolling'):
     summary = {}
     for feature in features:
@@ -91,8 +84,11 @@ print("Feature Summary:\n", summary_df)
 
 # Correlation filter
 def feature_correlation_filter(df, features, threshold=0.9):
+    # Only look above the diagonal (every column correlates 1.0 with itself), so
+    # of each highly correlated pair the later feature is dropped
     corr_matrix = df[features].corr().abs()
-    to_drop = [col for col in corr_matrix.columns if any(corr_matrix[col] > threshold) and col not in corr_matrix.columns[:1]]
+    upper = corr_matrix.where(np.triu(np.ones(corr_matrix.shape, dtype=bool), k=1))
+    to_drop = [col for col in upper.columns if (upper[col] > threshold).any()]
     return to_drop
 
 to_drop = feature_correlation_filter(df, feature_columns)
@@ -102,61 +98,39 @@ print("Highly correlated features to drop:", to_drop)
 X_filtered = X_scaled_df.drop(columns=to_drop)
 feature_columns_filtered = X_filtered.columns.tolist()
 
-# 7. Cross-Validation Functions
-def cross_val_confusion_roc(model, X, y, cv):
-    cms, tprs, aucs = [], [], []
-    mean_fpr = np.linspace(0,1,100)
-    for train_idx, test_idx in cv.split(X, y):
-        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
-        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        y_proba = model.predict_proba(X_test)[:,1]
-        cms.append(confusion_matrix(y_test, y_pred))
-        fpr, tpr, _ = roc_curve(y_test, y_proba)
-        tpr_interp = np.interp(mean_fpr, fpr, tpr)
-        tpr_interp[0] = 0.0
-        tprs.append(tpr_interp)
-        aucs.append(auc(fpr, tpr))
-    mean_cm = np.mean(cms, axis=0)
-    mean_tpr = np.mean(tprs, axis=0)
-    mean_tpr[-1] = 1.0
-    mean_auc = np.mean(aucs)
-    return mean_cm, mean_fpr, mean_tpr, mean_auc
+# 7. Cross-Validation: every (model, fold) pair runs in a process pool with
+# the feature matrix in shared memory (see cv_engine.py)
+X_cv = X_filtered.to_numpy()
 
 # 8. Train & Evaluate Models
 lr_model = LogisticRegression(random_state=42, max_iter=1000)
 rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
 
 # 5-Fold CV
+instrument.stage('kfold_cv')
 kf = KFold(n_splits=5, shuffle=True, random_state=42)
-rf_cm_5fold, rf_fpr_5, rf_tpr_5, rf_auc_5 = cross_val_confusion_roc(rf_model, X_filtered, y, kf)
-lr_cm_5fold, lr_fpr_5, lr_tpr_5, lr_auc_5 = cross_val_confusion_roc(lr_model, X_filtered, y, kf)
+cv_models = {'rf': rf_model, 'lr': lr_model}
+kf_folds = test_folds(kf, X_cv, y)
+kf_results = stage_cache.cached('kfold_cv', lambda: run_cv(cv_models, X_cv, y, kf_folds),
+                                {'X': X_cv, 'y': y, 'models': cv_models, 'folds': kf_folds},
+                                code=[cv_engine])
+rf_cm_5fold, rf_fpr_5, rf_tpr_5, rf_auc_5 = kfold_summary(y, kf_folds, kf_results['rf'])
+lr_cm_5fold, lr_fpr_5, lr_tpr_5, lr_auc_5 = kfold_summary(y, kf_folds, kf_results['lr'])
 
 print("Random Forest 5-Fold AUC:", rf_auc_5)
 print("Logistic Regression 5-Fold AUC:", lr_auc_5)
 
 # LOOCV
-from sklearn.model_selection import LeaveOneOut
-loo = LeaveOneOut()
-def loo_eval(model, X, y):
-    y_true, y_pred, y_proba = [], [], []
-    for train_idx, test_idx in loo.split(X, y):
-        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
-        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
-        model.fit(X_train, y_train)
-        pred = model.predict(X_test)
-        proba = model.predict_proba(X_test)[:,1]
-        y_true.append(y_test.values[0])
-        y_pred.append(pred[0])
-        y_proba.append(proba[0])
-    cm = confusion_matrix(y_true, y_pred)
-    fpr, tpr, _ = roc_curve(y_true, y_proba)
-    roc_auc = auc(fpr, tpr)
-    return cm, fpr, tpr, roc_auc
-
-rf_loo_cm, rf_loo_fpr, rf_loo_tpr, rf_loo_auc = loo_eval(rf_model, X_filtered, y)
-lr_loo_cm, lr_loo_fpr, lr_loo_tpr, lr_loo_auc = loo_eval(lr_model, X_filtered, y)
+instrument.stage('loocv')
+loo = loo_folds(len(y))
+loo_results = stage_cache.cached('loocv', lambda: run_cv(cv_models, X_cv, y, loo),
+                                 {'X': X_cv, 'y': y, 'models': cv_models, 'folds': loo},
+                                 code=[cv_engine])
+rf_loo_cm, rf_loo_fpr, rf_loo_tpr, rf_loo_auc = pooled_summary(y, loo, loo_results['rf'])
+lr_loo_cm, lr_loo_fpr, lr_loo_tpr, lr_loo_auc = pooled_summary(y, loo, loo_results['lr'])
 
 print("Random Forest LOOCV AUC:", rf_loo_auc)
 print("Logistic Regression LOOCV AUC:", lr_loo_auc)
+
+instrument.stage('plots')
+plotting.finish()
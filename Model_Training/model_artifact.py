@@ -0,0 +1,226 @@
+"""Serialized LR model, the generated model.js, and a sklearn-free scorer.
+
+final_model.py saves the fitted StandardScaler and LogisticRegression as a
+small JSON artifact and regenerates YouTube-Tracker/background/model.js from
+it, so the constants no longer have to be copied by hand. bay_net.py saves
+the Bayesian network's compiled posterior table (posterior_table.py) with
+its bin cut points the same way; scoring_service.py serves both. A rerun
+that fits the same model leaves both files untouched: the 'created' stamp
+only changes along with the model.
+
+predict_proba repeats predictDoomscrollProbability's arithmetic in the same
+order with NumPy, one vectorized pass over any number of sessions. Check it
+against the JS with node installed:
+    python Model_Training/model_artifact.py --check
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.join(HERE, "artifacts", "lr_model.json")
+BAYES_ARTIFACT_PATH = os.path.join(HERE, "artifacts", "bayes_model.json")
+MODEL_JS_PATH = os.path.join(HERE, "..", "YouTube-Tracker", "background", "model.js")
+
+# Keys predictDoomscrollProbability reads, in feature order
+JS_FEATURE_KEYS = ['scrollIntensity', 'engagementScore', 'durationMinutes']
+
+MODEL_JS_TEMPLATE = """\
+// Generated by Model_Training/model_artifact.py from {artifact_name}
+// ({n_sessions} sessions, {created}). Rerun final_model.py instead of editing by hand.
+const scaler = {{
+  mean: {mean},
+  std:  {std}
+}};
+
+const lrModel = {{
+  weights: {weights},
+  bias: {bias}
+}};
+
+function standardize(x, i) {{
+  return (x - scaler.mean[i]) / scaler.std[i];
+}}
+
+function sigmoid(z) {{
+  return 1 / (1 + Math.exp(-z));
+}}
+
+function predictDoomscrollProbability(features) {{
+  const x = [
+    features.scrollIntensity,
+    features.engagementScore,
+    features.durationMinutes
+  ];
+
+  let z = lrModel.bias;
+
+  for (let i = 0; i < x.length; i++) {{
+    z += lrModel.weights[i] * standardize(x[i], i);
+  }}
+
+  return sigmoid(z); // probability of doomscrolling
+}}
+"""
+
+
+def build_artifact(scaler, lr_model, features, n_sessions):
+    """Plain-JSON description of a fitted StandardScaler + binary LogisticRegression."""
+    return {
+        'features': list(features),
+        'scaler': {'mean': scaler.mean_.tolist(), 'std': scaler.scale_.tolist()},
+        'lr': {'weights': lr_model.coef_[0].tolist(), 'bias': float(lr_model.intercept_[0])},
+        'n_sessions': int(n_sessions),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def build_bayes_artifact(posterior_table, n_sessions, cuts=None):
+    """Plain-JSON PosteriorTable plus the add_bayes_bins cut points its evidence was binned with."""
+    from features import CLICK_RATE_CUTS, SCROLL_RATE_CUTS, SESSION_LENGTH_CUTS
+
+    cuts = cuts or {'scroll_cuts': SCROLL_RATE_CUTS, 'click_cuts': CLICK_RATE_CUTS,
+                    'length_cuts': SESSION_LENGTH_CUTS}
+    return {
+        'table': posterior_table.to_dict(),
+        'cuts': {name: [float(c) for c in values] for name, values in cuts.items()},
+        'n_sessions': int(n_sessions),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def save_artifact(artifact, path=ARTIFACT_PATH):
+    """Write artifact to path unless the file already holds the same model; return the artifact on disk.
+
+    Only 'created' may differ for the file to be kept, and the kept artifact
+    is returned so that model.js rendered from it is unchanged as well.
+    """
+    try:
+        existing = load_artifact(path)
+    except (OSError, ValueError):
+        existing = None
+    if existing is not None and _without_stamp(existing) == _without_stamp(artifact):
+        return existing
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(artifact, f, indent=2)
+        f.write('\n')
+    return artifact
+
+
+def _without_stamp(artifact):
+    # Through JSON so tuples and lists (and floats, exactly) compare the same
+    return json.loads(json.dumps({k: v for k, v in artifact.items() if k != 'created'}))
+
+
+def load_artifact(path=ARTIFACT_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def predict_proba(artifact, X):
+    """P(doomscrolling) for each row of X (columns in artifact['features'] order).
+
+    Accumulates z in the same order as the JS loop so results agree to the
+    last bit or two.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    mean, std = artifact['scaler']['mean'], artifact['scaler']['std']
+    weights = artifact['lr']['weights']
+
+    z = np.full(len(X), artifact['lr']['bias'], dtype=np.float64)
+    for i, w in enumerate(weights):
+        z += w * ((X[:, i] - mean[i]) / std[i])
+    return 1 / (1 + np.exp(-z))
+
+
+def score_sessions(artifact, df):
+    """Score a session DataFrame, computing the engineered features if needed."""
+    missing = [f for f in artifact['features'] if f not in df]
+    if missing:
+        from features import add_ratio_features
+        df = add_ratio_features(df.copy(), dtype=np.float64)
+    return predict_proba(artifact, df[artifact['features']].to_numpy())
+
+
+def _js_array(values):
+    return '[' + ', '.join(repr(float(v)) for v in values) + ']'
+
+
+def render_model_js(artifact, artifact_name=os.path.basename(ARTIFACT_PATH)):
+    return MODEL_JS_TEMPLATE.format(
+        artifact_name=artifact_name,
+        n_sessions=artifact['n_sessions'],
+        created=artifact['created'],
+        mean=_js_array(artifact['scaler']['mean']),
+        std=_js_array(artifact['scaler']['std']),
+        weights=_js_array(artifact['lr']['weights']),
+        bias=repr(float(artifact['lr']['bias'])),
+    )
+
+
+def write_model_js(artifact, path=MODEL_JS_PATH):
+    """Regenerate model.js; returns False (and leaves the file alone) if it would not change."""
+    text = render_model_js(artifact)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    with open(path, 'w') as f:
+        f.write(text)
+    return True
+
+
+def check_js_parity(artifact, js_path=MODEL_JS_PATH, n_samples=10_000, seed=0):
+    """Score random inputs with model.js under node and with predict_proba; return max |diff|."""
+    rng = np.random.default_rng(seed)
+    mean = np.asarray(artifact['scaler']['mean'])
+    std = np.asarray(artifact['scaler']['std'])
+    X = np.abs(rng.normal(mean, 3 * std, size=(n_samples, len(mean))))
+
+    runner = (
+        "const fs = require('fs');\n"
+        + open(js_path).read()
+        + "\nconst rows = JSON.parse(fs.readFileSync(0, 'utf8'));\n"
+        + "const keys = " + json.dumps(JS_FEATURE_KEYS) + ";\n"
+        + "const out = rows.map(r => predictDoomscrollProbability("
+        + "Object.fromEntries(keys.map((k, i) => [k, r[i]]))));\n"
+        + "process.stdout.write(JSON.stringify(out));\n"
+    )
+    with tempfile.NamedTemporaryFile('w', suffix='.js', delete=False) as f:
+        f.write(runner)
+    try:
+        result = subprocess.run(['node', f.name], input=json.dumps(X.tolist()),
+                                capture_output=True, text=True, check=True)
+    finally:
+        os.unlink(f.name)
+
+    js = np.asarray(json.loads(result.stdout))
+    return float(np.abs(js - predict_proba(artifact, X)).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate model.js or check it against the Python scorer")
+    parser.add_argument('--artifact', default=ARTIFACT_PATH)
+    parser.add_argument('--write-js', action='store_true', help="regenerate model.js from the artifact")
+    parser.add_argument('--check', action='store_true', help="compare model.js (run with node) to predict_proba")
+    args = parser.parse_args()
+
+    artifact = load_artifact(args.artifact)
+    if args.write_js:
+        write_model_js(artifact)
+        print("Wrote", os.path.normpath(MODEL_JS_PATH))
+    if args.check:
+        diff = check_js_parity(artifact)
+        print(f"model.js vs predict_proba: max |diff| = {diff:.3g}")
+        if diff > 1e-12:
+            raise SystemExit("model.js and the Python scorer disagree")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,640 @@
+"""Offline replay of the background.js nudge logic over recorded sessions.
+
+replay() runs analyzeSession's state machine on many sessions at once: every
+piece of per-session state (rolling window, watch cooldown, rule hysteresis,
+nudge cooldown) is a NumPy array, and all sessions advance through their
+saveScrollData snapshots in lockstep. The knobs that are hard-coded in the
+extension are in DEFAULT_PARAMS, and grid_search() replays every combination
+of a parameter grid in parallel and reports the nudge rate, time to first
+nudge and precision/recall against doomscroll_label.
+
+Snapshots come from a JSON dump of saveScrollData payloads
+(batch_from_snapshots / load_snapshot_log). A session export only has final
+totals, so batch_from_export interpolates each session linearly over 30 s
+saves. That is crude, but it is enough to see how thresholds behave at scale.
+
+Differences from the extension, all deliberate:
+- Sessions are replayed independently. In the extension, nudgeCount and
+  lastNudgeTime are shared by every session since the browser started.
+- Personal thresholds are fixed per session, from the viable sessions that
+  ended before it. The extension appends a viable session's snapshots as it
+  goes.
+
+check_js_parity() runs the real background.js under node on the same
+snapshots and compares the nudges:
+    python Model_Training/nudge_replay.py --check [--random 1000]
+    python Model_Training/nudge_replay.py --grid decay_factor=0.5,0.75,0.9 ml_threshold=0.6,0.65,0.7
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from features import LABEL
+from model_artifact import HERE, MODEL_JS_PATH, load_artifact, predict_proba
+
+BACKGROUND_JS_PATH = os.path.join(HERE, "..", "YouTube-Tracker", "background", "background.js")
+
+DEFAULT_PARAMS = {
+    'analysis_interval_min': 0.5,   # mlCalculationInterval (0.5 while testing, 5 when shipping)
+    'grace_main_min': 2.0,
+    'grace_shorts_min': 0.5,
+    'decay_factor': 0.75,           # rolling-window decay per analysis while watching
+    'window_decay': 0.7,            # rolling-window decay every window_reset_s in the feed
+    'window_reset_s': 30,
+    'cooldown_scale': 1.0,          # multiplies calcEarnedCooldown's 1/3/6 minute bases
+    'personal_multiplier': 1.5,     # calculatePersonalThresholds: median * 1.5
+    'ml_threshold': 0.65,
+    'bayes_threshold': 0.55,
+    'arm_threshold': 3,
+    'stay_threshold': 2,
+    'cooldown_arm_threshold': 5,
+    'cooldown_stay_threshold': 4,
+    'nudge_cooldown_min': 5,
+}
+
+HARDCODED_HIGH_SCROLLING = 10000
+HARDCODED_FAST_SCROLLING = 2000
+
+# currentContext and video label codes used in the snapshot arrays
+OTHER, WATCHING, SHORTS = 0, 1, 2
+CONTEXT_CODES = {'watching_video': WATCHING, 'shorts_feed': SHORTS}
+CONTEXT_NAMES = {OTHER: 'homepage', WATCHING: 'watching_video', SHORTS: 'shorts_feed'}
+NEUTRAL, PRODUCTIVE, UNPRODUCTIVE = 0, 1, 2
+MISSING = -1    # no currentVideoLabel in the payload, so the JS falls back to lastVideoLabel
+LABEL_CODES = {'neutral': NEUTRAL, 'productive': PRODUCTIVE, 'unproductive': UNPRODUCTIVE}
+LABEL_NAMES = {v: k for k, v in LABEL_CODES.items()}
+LABEL_NAMES[MISSING] = ''
+
+# ---- building snapshot batches ----
+
+def _dense(codes, steps, values, n_sessions, n_steps, fill, dtype):
+    out = np.full((n_sessions, n_steps), fill, dtype=dtype)
+    out[codes, steps] = values
+    return out
+
+
+def batch_from_snapshots(snapshots, labels=None):
+    """Dense snapshot arrays from a long DataFrame of saveScrollData payloads.
+
+    labels maps sessionId -> doomscroll_label (sessions without one get -1).
+    """
+    snapshots = snapshots.sort_values(['sessionId', 'timestamp'], kind='stable')
+    session_ids, codes = np.unique(snapshots['sessionId'].to_numpy(), return_inverse=True)
+    steps = snapshots.groupby('sessionId', sort=False).cumcount().to_numpy()
+    n, T = len(session_ids), int(steps.max()) + 1 if len(steps) else 0
+
+    def column(name, default=0):
+        if name not in snapshots:
+            return np.full(len(snapshots), default)
+        return snapshots[name].fillna(default).to_numpy()
+
+    def coded(name, mapping, default):
+        return pd.Series(column(name, '')).map(mapping).fillna(default).to_numpy()
+
+    batch = {
+        'session_id': session_ids,
+        'valid': _dense(codes, steps, True, n, T, False, bool),
+        'time': _dense(codes, steps, column('timestamp'), n, T, np.nan, np.float64),
+        'duration': _dense(codes, steps, column('sessionDuration'), n, T, np.nan, np.float64),
+        'scroll': _dense(codes, steps, column('totalScrollDistance'), n, T, 0, np.float64),
+        'video_clicks': _dense(codes, steps, column('videoClicks'), n, T, 0, np.float64),
+        'shorts_clicks': _dense(codes, steps, column('shortsClicks'), n, T, 0, np.float64),
+        'actual_watch': _dense(codes, steps, column('actualWatchTime'), n, T, 0, np.float64),
+        'context': _dense(codes, steps, coded('currentContext', CONTEXT_CODES, OTHER), n, T, OTHER, np.int8),
+        'last_label': _dense(codes, steps, coded('lastVideoLabel', LABEL_CODES, NEUTRAL), n, T, NEUTRAL, np.int8),
+        'current_label': _dense(codes, steps, coded('currentVideoLabel', LABEL_CODES, MISSING),
+                                n, T, MISSING, np.int8),
+    }
+    labels = labels or {}
+    batch['label'] = np.array([labels.get(s, -1) for s in session_ids], dtype=np.int8)
+    return batch
+
+
+def load_snapshot_log(path, labels=None):
+    """Batch from a JSON list of saveScrollData payloads (or {"snapshots": [...]})."""
+    with open(path) as f:
+        payloads = json.load(f)
+    if isinstance(payloads, dict):
+        payloads = payloads['snapshots']
+    return batch_from_snapshots(pd.DataFrame(payloads), labels)
+
+
+def batch_from_export(df, save_every_s=30, start_time=1.7e12):
+    """Synthetic snapshot sequences from a session export's final totals.
+
+    Each session is saved every save_every_s seconds with its scroll distance
+    and clicks growing linearly to the exported totals. Sessions whose last URL
+    is a Short are replayed in the Shorts feed (clicks counted as Shorts), all
+    others on the homepage feed.
+    """
+    duration_ms = df['Duration (minutes)'].to_numpy(dtype=np.float64) * 60_000
+    n_steps = np.maximum(1, np.ceil(duration_ms / (save_every_s * 1000)).astype(np.int64))
+    T = int(n_steps.max())
+    step = np.arange(1, T + 1)
+    valid = step[None, :] <= n_steps[:, None]
+    fraction = np.minimum(step[None, :] / n_steps[:, None], 1.0)
+    elapsed = fraction * duration_ms[:, None]
+
+    is_shorts = df['URL'].astype(str).str.contains('/shorts/', regex=False).to_numpy()
+    clicks = df['Total Clicks'].to_numpy(dtype=np.float64)[:, None]
+    click_path = np.floor(fraction * clicks)
+    n = len(df)
+    return {
+        'session_id': df['Session ID'].astype(str).to_numpy() if 'Session ID' in df else np.arange(n),
+        'valid': valid,
+        'time': np.where(valid, start_time + elapsed, np.nan),
+        'duration': np.where(valid, elapsed, np.nan),
+        'scroll': fraction * df['Total Scroll Distance'].to_numpy(dtype=np.float64)[:, None],
+        'video_clicks': np.where(is_shorts[:, None], 0, click_path),
+        'shorts_clicks': np.where(is_shorts[:, None], click_path, 0),
+        'actual_watch': np.broadcast_to(0.0, (n, T)),
+        'context': np.where(is_shorts[:, None] & valid, SHORTS, OTHER).astype(np.int8),
+        'last_label': np.broadcast_to(np.int8(NEUTRAL), (n, T)),
+        'current_label': np.broadcast_to(np.int8(NEUTRAL), (n, T)),
+        'label': df[LABEL].to_numpy().astype(np.int8),
+    }
+
+
+def random_batch(n_sessions, max_steps=120, seed=0):
+    """Random snapshot sequences that switch between feed, Shorts and watching.
+
+    Used by the parity check to reach every branch of the state machine
+    (watch cooldowns, video labels, missing currentVideoLabel, resumed gaps).
+    """
+    rng = np.random.default_rng(seed)
+    n, T = n_sessions, max_steps
+    valid = np.arange(T)[None, :] < rng.integers(5, T + 1, n)[:, None]
+
+    # 30 s saves, with the occasional long gap (tab closed and resumed)
+    gaps = np.where(rng.random((n, T)) < 0.05, rng.uniform(60, 600, (n, T)), rng.uniform(25, 35, (n, T)))
+    elapsed = np.cumsum(gaps * 1000, axis=1)
+    duration = np.cumsum(np.where(gaps > 60, 30, gaps) * 1000, axis=1)
+
+    # Context is a sticky random walk over feed / watching / Shorts
+    switch = rng.random((n, T)) < 0.15
+    choice = rng.integers(0, 3, (n, T)).astype(np.int8)
+    context = np.zeros((n, T), dtype=np.int8)
+    context[:, 0] = choice[:, 0]
+    for t in range(1, T):
+        context[:, t] = np.where(switch[:, t], choice[:, t], context[:, t - 1])
+
+    watching = context == WATCHING
+    in_feed = ~watching
+    scroll = np.cumsum(np.where(in_feed, rng.exponential(1500, (n, T)), 0), axis=1)
+    video_clicks = np.cumsum(rng.random((n, T)) < np.where(context == OTHER, 0.3, 0.05), axis=1)
+    shorts_clicks = np.cumsum(np.where(context == SHORTS, rng.poisson(2, (n, T)), 0), axis=1)
+    actual_watch = np.cumsum(np.where(watching, gaps * 1000 * rng.uniform(0.5, 1, (n, T)), 0), axis=1)
+    labels = rng.integers(-1, 3, (n, T)).astype(np.int8)
+
+    return {
+        'session_id': np.array([f"session_{i}" for i in range(n)]),
+        'valid': valid,
+        'time': np.where(valid, 1.7e12 + elapsed, np.nan),
+        'duration': np.where(valid, duration, np.nan),
+        'scroll': scroll,
+        'video_clicks': video_clicks.astype(np.float64),
+        'shorts_clicks': shorts_clicks.astype(np.float64),
+        'actual_watch': actual_watch,
+        'context': context,
+        'last_label': np.maximum(labels, NEUTRAL),
+        'current_label': np.roll(labels, 1, axis=1),
+        'label': rng.integers(0, 2, n).astype(np.int8),
+    }
+
+
+def split_batch(batch, chunk_sessions):
+    """Split a batch into batches of at most chunk_sessions sessions."""
+    n = len(batch['session_id'])
+    return [{k: v[i:i + chunk_sessions] for k, v in batch.items()} for i in range(0, n, chunk_sessions)]
+
+
+# ---- personal thresholds ----
+
+def personal_medians(scroll_distance, scroll_intensity, viable, window=7, min_sessions=5):
+    """Median scroll distance and intensity of the last `window` viable sessions before each session.
+
+    Sessions are in chronological order; NaN where fewer than min_sessions
+    viable sessions came before, i.e. the extension has no personal thresholds.
+    """
+    values = np.column_stack([scroll_distance, scroll_intensity])[viable]
+    before = np.cumsum(viable) - viable            # viable sessions strictly before each one
+    medians = np.full((len(viable), 2), np.nan)
+
+    # Window medians over the viable sessions, indexed by how many came before
+    by_count = np.full((len(values) + 1, 2), np.nan)
+    for k in range(min_sessions, min(window, len(values)) + 1):
+        by_count[k] = np.median(values[:k], axis=0)
+    if len(values) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+        by_count[window:] = np.median(windows, axis=-1)
+
+    ready = before >= min_sessions
+    medians[ready] = by_count[before[ready]]
+    return medians[:, 0], medians[:, 1]
+
+
+def export_personal_medians(df):
+    """personal_medians for a session export, treating exports as in time order by Date.
+
+    Viability follows isViableSession except the 60 s feed-time rule, which
+    exports cannot check.
+    """
+    order = np.argsort(pd.to_datetime(df['Date'], utc=True, format='ISO8601').to_numpy(), kind='stable')
+    duration = df['Duration (minutes)'].to_numpy(dtype=np.float64)[order]
+    scroll = df['Total Scroll Distance'].to_numpy(dtype=np.float64)[order]
+    clicks = df['Total Clicks'].to_numpy(dtype=np.float64)[order]
+    intensity = np.divide(scroll, duration, out=np.zeros_like(scroll), where=duration > 0)
+    viable = (duration >= 3) & (scroll >= 2000) & (clicks >= 1)
+
+    high, fast = personal_medians(scroll, intensity, viable)
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    return high[inverse], fast[inverse]
+
+
+# ---- the state machine ----
+
+def earned_cooldown_ms(watch_ms, label, scale=1.0):
+    """calcEarnedCooldown for arrays of watch times and label codes."""
+    watch_min = watch_ms / 1000 / 60
+    multiplier = np.where(label == PRODUCTIVE, 1.33, np.where(label == UNPRODUCTIVE, 0.5, 1.0))
+    base = np.where(watch_min < 5, 1, np.where(watch_min < 10, 3, 6)) * 60 * 1000 * scale
+    # Math.round rounds halves up, np.round to even
+    return np.where(watch_min < 2, 0, np.floor(base * multiplier + 0.5))
+
+
+def replay(batch, params=None, artifact=None, personal=None):
+    """Run analyzeSession over every snapshot of every session in the batch.
+
+    personal: optional (high_median, fast_median) per session from
+    personal_medians; NaN means no personal thresholds for that session.
+    Returns per-session arrays: n_nudges, first_nudge_min (session minutes at
+    the first nudge, NaN if never nudged), max_level and n_analyses.
+    """
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    artifact = artifact or load_artifact()
+    n, T = batch['valid'].shape
+
+    has_window = np.zeros(n, dtype=bool)
+    last_reset = np.zeros(n)
+    w_scroll, w_video, w_shorts, w_duration = (np.zeros(n) for _ in range(4))
+    watch_start = np.full(n, np.nan)
+    cooldown_until = np.zeros(n)
+    last_context = np.full(n, -1, dtype=np.int8)
+    last_scroll, last_video, last_shorts = (np.full(n, np.nan) for _ in range(3))
+    rule_state = np.zeros(n, dtype=bool)
+    next_allowed = np.full(n, -np.inf)
+    last_nudge = np.full(n, -np.inf)
+    n_nudges = np.zeros(n, dtype=np.int64)
+    max_level = np.zeros(n, dtype=np.int8)
+    first_nudge = np.full(n, np.nan)
+    n_analyses = np.zeros(n, dtype=np.int64)
+
+    high_thr = np.full(n, float(HARDCODED_HIGH_SCROLLING))
+    fast_thr = np.full(n, float(HARDCODED_FAST_SCROLLING))
+    if personal is not None:
+        has_personal = ~np.isnan(personal[0])
+        high_thr[has_personal] = np.maximum(HARDCODED_HIGH_SCROLLING,
+                                            personal[0][has_personal] * p['personal_multiplier'])
+        fast_thr[has_personal] = np.maximum(HARDCODED_FAST_SCROLLING,
+                                            personal[1][has_personal] * p['personal_multiplier'])
+
+    interval_ms = p['analysis_interval_min'] * 60 * 1000
+    nudge_cooldown_ms = p['nudge_cooldown_min'] * 60 * 1000
+
+    for t in range(T):
+        now = batch['time'][:, t]
+        duration = batch['duration'][:, t]
+        context = batch['context'][:, t]
+        called = batch['valid'][:, t] & (now >= next_allowed)
+
+        created = called & ~has_window
+        last_reset[created] = now[created]
+        has_window |= created
+
+        minutes = duration / 1000 / 60
+        grace = np.where(context == SHORTS, p['grace_shorts_min'], p['grace_main_min'])
+        run = called & ~(minutes < grace)
+        if not run.any():
+            continue
+        n_analyses += run
+
+        # ---- watch cooldown state machine ----
+        watching = run & (context == WATCHING)
+        starting = watching & np.isnan(watch_start)
+        watch_start[starting] = now[starting]
+        for window in (w_scroll, w_video, w_shorts, w_duration):
+            window[watching] *= p['decay_factor']
+
+        feed = run & ~watching
+        leaving = feed & (last_context == WATCHING) & ~np.isnan(watch_start)
+        if leaving.any():
+            actual = batch['actual_watch'][:, t]
+            watch_ms = np.where(actual > 0, actual, now - watch_start)
+            earned = earned_cooldown_ms(watch_ms, batch['last_label'][:, t], p['cooldown_scale'])
+            award = leaving & (earned > 0)
+            cooldown_until[award] = now[award] + earned[award]
+            watch_start[leaving] = np.nan
+
+        for window, last, field in ((w_scroll, last_scroll, 'scroll'), (w_video, last_video, 'video_clicks'),
+                                    (w_shorts, last_shorts, 'shorts_clicks')):
+            current = batch[field][:, t]
+            first = feed & np.isnan(last)
+            last[first] = current[first]
+            window[feed] += np.maximum(0, current[feed] - last[feed])
+            last[feed] = current[feed]
+        w_duration[feed] += duration[feed]
+
+        resetting = feed & (now - last_reset > p['window_reset_s'] * 1000)
+        for window in (w_scroll, w_video, w_shorts, w_duration):
+            window[resetting] *= p['window_decay']
+        last_reset[resetting] = now[resetting]
+
+        last_context[run] = context[run]
+
+        # ---- metrics ----
+        rolling_min = w_duration / 1000 / 60
+        clicks = w_video + w_shorts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intensity = np.where(rolling_min > 0, w_scroll / rolling_min, 0)
+            click_rate = np.where(rolling_min > 0, clicks / rolling_min, 0)
+            engagement = np.where(w_scroll > 0, clicks * 1000 / w_scroll, 0)
+        doom_prob = predict_proba(artifact, np.column_stack([intensity, engagement, rolling_min]))
+
+        # ---- Bayesian fallback ----
+        p_scroll = np.where(intensity > fast_thr, 0.75, 0.25)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            watch_ratio = np.where(duration > 0, batch['actual_watch'][:, t] / duration, 0)
+        p_low_watch = np.where(watch_ratio < 0.3, 0.70, np.where(watch_ratio < 0.6, 0.45, 0.20))
+        video_label = np.where(batch['current_label'][:, t] != MISSING,
+                               batch['current_label'][:, t], batch['last_label'][:, t])
+        p_unproductive = np.where(video_label == UNPRODUCTIVE, 0.75,
+                                  np.where(video_label == NEUTRAL, 0.50, 0.20))
+        bayes_doom = (doom_prob < p['ml_threshold']) & \
+            ((p_scroll + p_low_watch + p_unproductive) / 3 >= p['bayes_threshold'])
+
+        # ---- rule-based signals with cooldown hysteresis ----
+        signal_count = (
+            (minutes > 7.5).astype(np.int8)
+            + (w_scroll > high_thr)
+            + (engagement < 0.5)
+            + (intensity > fast_thr)
+            + ((click_rate < 0.3) & (minutes > 7.5))
+            + ((context == SHORTS) & (w_shorts > 18))
+        )
+        in_cooldown = now < cooldown_until
+        arm = np.where(in_cooldown, p['cooldown_arm_threshold'], p['arm_threshold'])
+        stay = np.where(in_cooldown, p['cooldown_stay_threshold'], p['stay_threshold'])
+        rule_based = np.where(rule_state, signal_count >= stay, signal_count >= arm) & (context != WATCHING)
+        rule_state[run] = rule_based[run]
+
+        ml_based = doom_prob >= p['ml_threshold']
+        doomscrolling = (rule_based.astype(np.int8) + ml_based + bayes_doom) >= 2
+
+        # ---- triggerNudge ----
+        nudge = run & doomscrolling & (context != WATCHING) & ~(now - last_nudge < nudge_cooldown_ms)
+        last_nudge[nudge] = now[nudge]
+        n_nudges += nudge
+        level = np.where((duration >= 25 * 60 * 1000) & (n_nudges >= 2), 3,
+                         np.where((duration >= 20 * 60 * 1000) | (n_nudges >= 2), 2, 1))
+        max_level[nudge] = np.maximum(max_level[nudge], level[nudge])
+        first = nudge & np.isnan(first_nudge)
+        first_nudge[first] = minutes[first]
+
+        next_allowed[run] = now[run] + interval_ms
+
+    return {'n_nudges': n_nudges, 'first_nudge_min': first_nudge, 'max_level': max_level,
+            'n_analyses': n_analyses}
+
+
+def summarize(outcome, labels):
+    """Nudge rate, time to first nudge and precision/recall against doomscroll_label."""
+    nudged = outcome['n_nudges'] > 0
+    labelled = labels >= 0
+    doom = labels == 1
+    first = outcome['first_nudge_min'][nudged]
+    return {
+        'sessions': int(len(labels)),
+        'nudge_rate': float(nudged.mean()) if len(labels) else float('nan'),
+        'nudges_per_session': float(outcome['n_nudges'].mean()) if len(labels) else float('nan'),
+        'median_first_nudge_min': float(np.median(first)) if len(first) else float('nan'),
+        'precision': float(doom[nudged & labelled].mean()) if (nudged & labelled).any() else float('nan'),
+        'recall': float(nudged[doom].mean()) if doom.any() else float('nan'),
+        'false_nudge_rate': float(nudged[labelled & ~doom].mean()) if (labelled & ~doom).any() else float('nan'),
+    }
+
+
+def replay_batches(batches, params=None, artifact=None, personal=None):
+    """replay() over a list of batches; personal is split to match. Returns the joined outcome."""
+    artifact = artifact or load_artifact()
+    outcomes, start = [], 0
+    for batch in batches:
+        n = len(batch['session_id'])
+        chunk_personal = None if personal is None else (personal[0][start:start + n], personal[1][start:start + n])
+        outcomes.append(replay(batch, params, artifact, chunk_personal))
+        start += n
+    return {k: np.concatenate([o[k] for o in outcomes]) for k in outcomes[0]}
+
+
+# ---- grid search ----
+
+# Set before forking the grid-search workers
+_grid = {}
+
+
+def _score(params):
+    outcome = replay_batches(_grid['batches'], params, _grid['artifact'], _grid['personal'])
+    return {**params, **summarize(outcome, _grid['labels'])}
+
+
+def grid_search(batches, grid, artifact=None, personal=None, n_jobs=None):
+    """Replay every combination of the grid ({param: [values]}) and return a DataFrame of metrics."""
+    unknown = set(grid) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown replay parameters: {sorted(unknown)}")
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[k] for k in names))]
+
+    _grid.update(batches=batches, artifact=artifact or load_artifact(), personal=personal,
+                 labels=np.concatenate([b['label'] for b in batches]))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(combos))
+    try:
+        if n_jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            rows = [_score(c) for c in combos]
+        else:
+            with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+                rows = list(pool.map(_score, combos))
+    finally:
+        _grid.clear()
+    return pd.DataFrame(rows)
+
+
+# ---- parity with background.js ----
+
+JS_HARNESS = r"""
+const fs = require('fs');
+const vm = require('vm');
+
+// Every browser.* call resolves to an empty array (no stored keys, no tabs); listeners are ignored
+const stub = new Proxy(function () {}, {
+  get: (target, prop) => prop === 'then' ? undefined : stub,
+  apply: () => Promise.resolve([]),
+});
+let now = 0;
+class FakeDate extends Date {
+  static now() { return now; }
+}
+const context = { console: { log() {}, warn() {}, error() {} }, browser: stub, window: {}, Date: FakeDate,
+                  setTimeout, clearTimeout };
+vm.createContext(context);
+for (const path of process.argv.slice(2)) vm.runInContext(fs.readFileSync(path, 'utf8'), context);
+
+// Mirrors the saveScrollData handler: analyze when the interval allows it
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const out = [];
+for (const session of input.sessions) {
+  vm.runInContext('nudgeCount = 0; lastNudgeTime = 0;', context);
+  let nudges = 0, first = null, next = 0;
+  for (const snap of session.snapshots) {
+    now = snap.timestamp;
+    if (now < next) continue;
+    const before = vm.runInContext('nudgeCount', context);
+    const result = context.analyzeSession(snap, session.thresholds);
+    if (result !== null) next = now + input.interval * 60 * 1000;
+    if (vm.runInContext('nudgeCount', context) > before) {
+      nudges++;
+      if (first === null) first = snap.sessionDuration / 1000 / 60;
+    }
+  }
+  out.push([nudges, first]);
+}
+process.stdout.write(JSON.stringify(out));
+"""
+
+
+def _payloads(batch, i):
+    steps = np.flatnonzero(batch['valid'][i])
+    sid = str(batch['session_id'][i])
+    return [{
+        'sessionId': sid,
+        'timestamp': float(batch['time'][i, t]),
+        'sessionDuration': float(batch['duration'][i, t]),
+        'totalScrollDistance': float(batch['scroll'][i, t]),
+        'videoClicks': float(batch['video_clicks'][i, t]),
+        'shortsClicks': float(batch['shorts_clicks'][i, t]),
+        'actualWatchTime': float(batch['actual_watch'][i, t]),
+        'currentContext': CONTEXT_NAMES[int(batch['context'][i, t])],
+        'lastVideoLabel': LABEL_NAMES[int(batch['last_label'][i, t])],
+        'currentVideoLabel': LABEL_NAMES[int(batch['current_label'][i, t])],
+    } for t in steps]
+
+
+def check_js_parity(batch, personal=None, artifact=None, interval_min=DEFAULT_PARAMS['analysis_interval_min']):
+    """Replay the batch with background.js under node and with replay(); returns mismatching session indices.
+
+    Only the default parameters can be compared, since the JS hard-codes them.
+    """
+    artifact = artifact or load_artifact()
+    n = len(batch['session_id'])
+    sessions = []
+    for i in range(n):
+        thresholds = None
+        if personal is not None and not np.isnan(personal[0][i]):
+            thresholds = {'highScrolling': personal[0][i] * DEFAULT_PARAMS['personal_multiplier'],
+                          'fastScrolling': personal[1][i] * DEFAULT_PARAMS['personal_multiplier'],
+                          'sessionCount': 5}
+        sessions.append({'snapshots': _payloads(batch, i), 'thresholds': thresholds})
+
+    with tempfile.NamedTemporaryFile('w', suffix='.js', delete=False) as f:
+        f.write(JS_HARNESS)
+    try:
+        result = subprocess.run(['node', f.name, MODEL_JS_PATH, BACKGROUND_JS_PATH],
+                                input=json.dumps({'interval': interval_min, 'sessions': sessions}),
+                                capture_output=True, text=True)
+    finally:
+        os.unlink(f.name)
+    if result.returncode != 0:
+        raise RuntimeError(f"node failed:\n{result.stderr}")
+    js = json.loads(result.stdout)
+
+    py = replay(batch, {'analysis_interval_min': interval_min}, artifact, personal)
+    mismatches = []
+    for i, (js_nudges, js_first) in enumerate(js):
+        js_first = np.nan if js_first is None else js_first
+        same_first = np.isclose(js_first, py['first_nudge_min'][i], equal_nan=True)
+        if js_nudges != py['n_nudges'][i] or not same_first:
+            mismatches.append(i)
+    return mismatches
+
+
+def _parse_grid(items):
+    grid = {}
+    for item in items:
+        name, _, values = item.partition('=')
+        grid[name] = [float(v) for v in values.split(',')]
+    return grid
+
+
+def main():
+    from loader import DEFAULT_CSV
+
+    parser = argparse.ArgumentParser(description="Replay the extension's nudge logic over recorded sessions")
+    parser.add_argument('--export', default=DEFAULT_CSV, help="session export CSV (replayed via batch_from_export)")
+    parser.add_argument('--snapshots', help="JSON dump of saveScrollData payloads to replay instead")
+    parser.add_argument('--grid', nargs='*', default=[], metavar='PARAM=V1,V2',
+                        help=f"parameters to search: {', '.join(DEFAULT_PARAMS)}")
+    parser.add_argument('--chunk-sessions', type=int, default=50_000)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--check', action='store_true', help="compare with background.js under node")
+    parser.add_argument('--random', type=int, metavar='N',
+                        help="replay N random sessions that visit every branch instead of an export")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.export)
+    if args.random:
+        batches = [random_batch(args.random)]
+        rng = np.random.default_rng(1)
+        medians = rng.uniform([5000, 500], [40000, 4000], (args.random, 2))
+        medians[rng.random(args.random) < 0.5] = np.nan
+        personal = (medians[:, 0], medians[:, 1])
+    elif args.snapshots:
+        labels = dict(zip(df['Session ID'], df[LABEL]))
+        batches = split_batch(load_snapshot_log(args.snapshots, labels), args.chunk_sessions)
+        personal = None
+    else:
+        # Chunks of similar-length sessions, so little of the (session, step)
+        # arrays is padding
+        personal = export_personal_medians(df)
+        order = np.argsort(df['Duration (minutes)'].to_numpy(), kind='stable')
+        df, personal = df.iloc[order], tuple(m[order] for m in personal)
+        batches = [batch_from_export(df.iloc[i:i + args.chunk_sessions])
+                   for i in range(0, len(df), args.chunk_sessions)]
+
+    if args.check:
+        mismatches = []
+        for k, batch in enumerate(batches):
+            start = k * args.chunk_sessions
+            chunk_personal = None if personal is None else tuple(m[start:start + len(batch['session_id'])]
+                                                                 for m in personal)
+            mismatches += [start + i for i in check_js_parity(batch, chunk_personal)]
+        total = sum(len(b['session_id']) for b in batches)
+        print(f"background.js vs replay: {total - len(mismatches)}/{total} sessions agree")
+        if mismatches:
+            raise SystemExit(f"Sessions that differ: {mismatches[:20]}")
+        return
+
+    results = grid_search(batches, _parse_grid(args.grid), personal=personal, n_jobs=args.jobs)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(results.sort_values('precision', ascending=False).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
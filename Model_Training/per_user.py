@@ -0,0 +1,277 @@
+"""Per-user evaluation: grouped CV and every user's personal thresholds in one pass.
+
+The extension personalizes its scroll thresholds per user
+(updateViableSessions / calculatePersonalThresholds in background.js), but
+session_data.csv is one person's export and the training scripts treat it
+as a single population. For data from many users:
+
+- merge_exports stacks several users' exports into one CSV with a User ID
+  column (synthetic.py --users generates such data at any size).
+- grouped_cv_report compares plain KFold with GroupKFold by user
+  (cv_engine.group_folds, the same folds without GroupKFold's per-fold
+  np.isin over every user ID). KFold
+  lets a user's other sessions into the training folds, so the gap between
+  the two AUCs is how much the pooled CV overstates new-user performance.
+- personal_thresholds computes, for every session of every user, the
+  personal thresholds in force when it started: 1.5 x the medians of the
+  user's last 7 viable sessions (isViableSession), once at least 5 exist.
+  Sessions are sorted by (user, date) once; a groupby cumcount gives each
+  viable session's position in its user's history, and the 7-session
+  windows are lagged copies of the value column, sorted row-wise. No Python
+  loop runs per user or per session, so millions of users take one pass.
+- rule_report scores the hard-coded thresholds, the personal thresholds and
+  the global LR model against doomscroll_label, overall and per user.
+
+Exports cannot check isViableSession's 60 s feed-time rule, so viability
+here uses duration, scroll distance and clicks only (as
+nudge_replay.export_personal_medians does).
+
+    python Model_Training/per_user.py merge merged.csv alice.csv bob.csv
+    python Model_Training/per_user.py evaluate merged.csv
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import StandardScaler
+
+from cv_engine import group_folds, kfold_summary, run_cv, test_folds
+from features import CLICKS, DURATION, LABEL, SCROLL_DISTANCE, TOP_FEATURES, add_ratio_features, safe_rate
+from loader import DATE, RAW_FEATURE_COLUMNS, SESSION_ID, USER_ID, load_sessions
+from model_artifact import load_artifact, predict_proba
+from nudge_replay import DEFAULT_PARAMS, HARDCODED_FAST_SCROLLING, HARDCODED_HIGH_SCROLLING
+
+# isViableSession and updateViableSessions
+VIABLE_MIN_DURATION = 3      # minutes
+VIABLE_MIN_SCROLL = 2000     # px
+VIABLE_MIN_CLICKS = 1
+WINDOW = 7
+MIN_SESSIONS = 5
+
+# The final models' settings, as in final_model.py
+CV_MODELS = {
+    'lr': LogisticRegression(max_iter=1000, random_state=42),
+    'rf': RandomForestClassifier(n_estimators=100, random_state=42),
+}
+
+# Viable sessions whose windows are built at once (each is WINDOW floats per value)
+BLOCK_ROWS = 1 << 20
+
+
+def merge_exports(paths, output, user_ids=None):
+    """Write the exports at paths as one CSV with a User ID column (default: each file's name)."""
+    user_ids = user_ids or [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    if len(set(user_ids)) != len(user_ids):
+        raise ValueError("Each export needs a distinct user ID")
+    written, columns = 0, None
+    for k, (path, user) in enumerate(zip(paths, user_ids)):
+        # Read as text so every value is written back exactly as exported
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        df.insert(int(SESSION_ID in df), USER_ID, user)
+        if columns is None:
+            columns = list(df.columns)
+        else:
+            # Later files are appended without a header, so they follow the first
+            # file's columns; ones they lack are left empty
+            extra = [c for c in df.columns if c not in columns]
+            if extra:
+                raise ValueError(f"{path} has columns the first export lacks: {extra}")
+            df = df.reindex(columns=columns, fill_value='')
+        df.to_csv(output, mode='w' if k == 0 else 'a', header=k == 0, index=False)
+        written += len(df)
+    return written
+
+
+def viable_sessions(duration, scroll, clicks):
+    """isViableSession for arrays of session totals, without the feed-time rule."""
+    return (duration >= VIABLE_MIN_DURATION) & (scroll >= VIABLE_MIN_SCROLL) & (clicks >= VIABLE_MIN_CLICKS)
+
+
+def _window_medians(values, rank, window):
+    """Median of each row's window: values[i - rank_i .. i], at most `window` long, like the JS median()."""
+    count = np.minimum(rank + 1, window)
+    out = np.empty(len(values))
+    for start in range(0, len(values), BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, len(values)))
+        lagged = np.empty((len(rows), window))
+        for lag in range(window):
+            lagged[:, lag] = np.where(rank[rows] >= lag, values[np.maximum(rows - lag, 0)], np.nan)
+        lagged.sort(axis=1)                                  # NaNs sort last
+        n = count[rows]
+        picks = np.column_stack([(n - 1) // 2, n // 2])
+        out[rows] = np.take_along_axis(lagged, picks, axis=1).mean(axis=1)
+    return out
+
+
+def rolling_baselines(users, values, viable, window=WINDOW, min_sessions=MIN_SESSIONS):
+    """Medians of each user's last `window` viable sessions strictly before each session.
+
+    Rows must be sorted by user, then time. values is (n_sessions, k); the
+    result is too, NaN where the user had fewer than min_sessions viable
+    sessions so far (the extension has no personal thresholds yet).
+    """
+    users = np.asarray(users)
+    values = np.asarray(values, dtype=np.float64).reshape(len(users), -1)
+    viable = np.asarray(viable, dtype=bool)
+    rows = np.flatnonzero(viable)
+    viable_users = users[rows]
+    rank = pd.Series(viable_users).groupby(viable_users, sort=False).cumcount().to_numpy()
+
+    # Thresholds after appending each viable session, as updateViableSessions stores them
+    after = np.column_stack([_window_medians(values[rows, j], rank, window) for j in range(values.shape[1])])
+    after[rank + 1 < min_sessions] = np.nan
+
+    # Each session uses the state left by its user's last viable session before it
+    last = np.cumsum(viable) - viable - 1
+    has_last = last >= 0
+    has_last[has_last] = viable_users[last[has_last]] == users[has_last]
+    baselines = np.full(values.shape, np.nan)
+    baselines[has_last] = after[last[has_last]]
+    return baselines
+
+
+def personal_thresholds(df, multiplier=DEFAULT_PARAMS['personal_multiplier']):
+    """Personal highScrolling/fastScrolling thresholds in force at the start of every session.
+
+    df needs User ID, Date, Duration, Total Scroll Distance and Total Clicks.
+    Returns a DataFrame on df's index with the personal thresholds (NaN
+    before a user has 5 viable sessions) and the thresholds analyzeSession
+    applies (never below the hard-coded ones).
+    """
+    users = df[USER_ID]
+    codes = users.cat.codes.to_numpy() if isinstance(users.dtype, pd.CategoricalDtype) else \
+        pd.factorize(users)[0]
+    if df[DATE].is_monotonic_increasing:
+        # Exports are already in time order, so a stable sort by user is enough
+        order = np.argsort(codes, kind='stable')
+    else:
+        # datetime64 keys: a tz-aware column would otherwise become an object array of Timestamps
+        order = np.lexsort((df[DATE].to_numpy(dtype='datetime64[ns]'), codes))
+    duration = df[DURATION].to_numpy(dtype=np.float64)[order]
+    scroll = df[SCROLL_DISTANCE].to_numpy(dtype=np.float64)[order]
+    clicks = df[CLICKS].to_numpy(dtype=np.float64)[order]
+    viable = viable_sessions(duration, scroll, clicks)
+
+    medians = rolling_baselines(codes[order], np.column_stack([scroll, safe_rate(scroll, duration)]), viable)
+    result = np.empty_like(medians)
+    result[order] = medians * multiplier
+
+    out = pd.DataFrame({'personal_high': result[:, 0], 'personal_fast': result[:, 1]}, index=df.index)
+    out['applied_high'] = np.fmax(out['personal_high'], HARDCODED_HIGH_SCROLLING)
+    out['applied_fast'] = np.fmax(out['personal_fast'], HARDCODED_FAST_SCROLLING)
+    return out
+
+
+def rule_flags(df, thresholds, artifact=None, ml_threshold=DEFAULT_PARAMS['ml_threshold']):
+    """Session-level flags of the hard-coded thresholds, the personal thresholds and the global model.
+
+    df needs the ratio features (add_ratio_features). Thresholds are compared
+    with session totals, a stand-in for the extension's rolling window.
+    """
+    artifact = artifact if artifact is not None else load_artifact()
+    scroll = df[SCROLL_DISTANCE].to_numpy()
+    intensity = safe_rate(scroll, df[DURATION].to_numpy())
+    return pd.DataFrame({
+        'hardcoded': (scroll > HARDCODED_HIGH_SCROLLING) | (intensity > HARDCODED_FAST_SCROLLING),
+        'personal': (scroll > thresholds['applied_high'].to_numpy()) | (intensity > thresholds['applied_fast'].to_numpy()),
+        'model': predict_proba(artifact, df[artifact['features']].to_numpy()) >= ml_threshold,
+    }, index=df.index)
+
+
+def rule_report(flags, y, users):
+    """Flag rate, precision and recall of each rule, pooled and averaged over users."""
+    y = np.asarray(y, dtype=bool)
+    report = {}
+    for rule in flags:
+        flagged = flags[rule].to_numpy()
+        hits = flagged & y
+        per_user = pd.DataFrame({'hits': hits, 'flagged': flagged, 'doom': y}).groupby(
+            np.asarray(users), sort=False, observed=True).sum()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            report[rule] = {
+                'flag_rate': flagged.mean(),
+                'precision': hits.sum() / max(flagged.sum(), 1),
+                'recall': hits.sum() / max(y.sum(), 1),
+                'user_precision': (per_user['hits'] / per_user['flagged']).mean(),
+                'user_recall': (per_user['hits'] / per_user['doom']).mean(),
+            }
+    return pd.DataFrame(report).T
+
+
+def grouped_cv_report(X, y, users, n_splits=5, seed=42, models=('lr',), n_jobs=None):
+    """Mean fold AUC of each model under KFold and under GroupKFold by user.
+
+    Both use min(n_splits, number of users) folds, so they stay comparable.
+    """
+    models = {name: CV_MODELS[name] for name in models}
+    codes, uniques = pd.factorize(np.asarray(users))
+    n_splits = min(n_splits, len(uniques))
+    if n_splits < 2:
+        raise ValueError("Grouped CV needs sessions from at least 2 users")
+    X_scaled = StandardScaler().fit_transform(X)
+    y = np.asarray(y)
+    splits = {'kfold': test_folds(KFold(n_splits, shuffle=True, random_state=seed), X_scaled, y),
+              'group_kfold': group_folds(codes, n_splits, seed)}
+    report = {}
+    for name, folds in splits.items():
+        results = run_cv(models, X_scaled, y, folds, n_jobs)
+        report[name] = {model: kfold_summary(y, folds, results[model])[3] for model in models}
+    report = pd.DataFrame(report)
+    report['leakage'] = report['kfold'] - report['group_kfold']
+    report.attrs['n_splits'] = n_splits
+    return report
+
+
+def evaluate(path, n_splits=5, models=('lr',), n_jobs=None):
+    header = pd.read_csv(path, nrows=0).columns
+    if USER_ID not in header:
+        raise ValueError(f"{path} has no {USER_ID!r} column; merge per-user exports with 'merge' first")
+    df = load_sessions(path, columns=[USER_ID, DATE] + RAW_FEATURE_COLUMNS, float_dtype=np.float64)
+    add_ratio_features(df, dtype=np.float64)
+    print(f"{len(df):,} sessions from {df[USER_ID].nunique():,} users")
+
+    start = time.perf_counter()
+    thresholds = personal_thresholds(df)
+    personalized = thresholds['personal_high'].notna()
+    print(f"Personal thresholds in {time.perf_counter() - start:.2f}s: "
+          f"{personalized.mean():.1%} of sessions started with them, "
+          f"{personalized.groupby(df[USER_ID], observed=True).any().mean():.1%} of users reached them")
+
+    print("\nNudge rules vs doomscroll_label (session totals):")
+    print(rule_report(rule_flags(df, thresholds), df[LABEL], df[USER_ID]).round(3))
+
+    start = time.perf_counter()
+    report = grouped_cv_report(df[TOP_FEATURES].to_numpy(), df[LABEL], df[USER_ID], n_splits,
+                               models=models, n_jobs=n_jobs)
+    print(f"\n{report.attrs['n_splits']}-fold AUC, pooled vs grouped by user ({time.perf_counter() - start:.1f}s):")
+    print(report.round(4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user evaluation of session exports")
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge = commands.add_parser('merge', help="stack per-user exports into one CSV with a User ID column")
+    merge.add_argument('output')
+    merge.add_argument('exports', nargs='+')
+    merge.add_argument('--user-ids', nargs='+', help="one per export (default: the file names)")
+    run = commands.add_parser('evaluate', help="grouped CV and personal thresholds vs the global model")
+    run.add_argument('csv')
+    run.add_argument('--splits', type=int, default=5)
+    run.add_argument('--models', nargs='+', choices=list(CV_MODELS), default=['lr'])
+    run.add_argument('--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        written = merge_exports(args.exports, args.output, args.user_ids)
+        print(f"Wrote {written:,} sessions from {len(args.exports)} exports to {os.path.abspath(args.output)}")
+    else:
+        evaluate(args.csv, args.splits, args.models, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
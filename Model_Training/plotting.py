@@ -0,0 +1,114 @@
+"""Figures for the training scripts, with matplotlib/seaborn imported lazily.
+
+Scripts hand each figure to add() as a draw function plus its data. What
+happens next depends on the mode set by cli.py:
+
+- 'show' (default, what running a script directly does): draw and plt.show()
+  straight away, as the scripts always did.
+- 'save': queue the figure; finish() renders the queue with the Agg backend,
+  in parallel worker processes, into PNG files.
+- 'off': drop the figure; matplotlib is never imported.
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+_config = {'mode': 'show', 'plots_dir': None, 'workers': None}
+_queue = []
+
+
+def configure(mode='show', plots_dir=None, workers=None):
+    if mode not in ('show', 'save', 'off'):
+        raise ValueError(f"Unknown plot mode: {mode}")
+    if mode == 'save' and not plots_dir:
+        raise ValueError("Saving plots needs a plots_dir")
+    _config.update(mode=mode, plots_dir=plots_dir, workers=workers)
+    _queue.clear()
+
+
+def add(draw, *args, name):
+    """Draw a figure with draw(plt, sns, *args), or queue it when saving."""
+    if _config['mode'] == 'off':
+        return
+    if _config['mode'] == 'save':
+        _queue.append((len(_queue), draw, args, name))
+        return
+
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    draw(plt, sns, *args)
+    plt.show()
+
+
+def _filename(index, name):
+    slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+    return f"{index:02d}_{slug}.png"
+
+
+def _render(job, plots_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    index, draw, args, name = job
+    draw(plt, sns, *args)
+    path = os.path.join(plots_dir, _filename(index, name))
+    plt.savefig(path, dpi=120)
+    plt.close('all')
+    return path
+
+
+def finish():
+    """Render every queued figure; returns the written paths."""
+    if not _queue:
+        return []
+    jobs, plots_dir = list(_queue), _config['plots_dir']
+    _queue.clear()
+    os.makedirs(plots_dir, exist_ok=True)
+
+    workers = min(_config['workers'] or os.cpu_count() or 1, len(jobs))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [_render(job, plots_dir) for job in jobs]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        return list(pool.map(_render, jobs, [plots_dir] * len(jobs)))
+
+
+# Draw functions. They are module-level so queued figures can be pickled to
+# the render workers.
+
+def draw_cpd(plt, sns, df_cpd, var, has_parents):
+    plt.figure(figsize=(8, 5))
+    sns.heatmap(df_cpd, annot=True, fmt=".2f", cmap="Blues")
+    plt.title(f"CPD for {var}")
+    plt.xlabel("Parent States" if has_parents else "Probability")
+    plt.ylabel(var)
+    plt.tight_layout()
+
+
+def draw_importance(plt, sns, importance_df):
+    plt.figure(figsize=(10,6))
+    sns.barplot(x='importance', y='feature', data=importance_df)
+    plt.title("Random Forest Feature Importance")
+    plt.tight_layout()
+
+
+def draw_cm(plt, sns, cm, title):
+    plt.figure(figsize=(5,4))
+    sns.heatmap(cm, annot=True, fmt=".1f", cmap='Blues',
+                xticklabels=['Focused','Doomscrolling'],
+                yticklabels=['Focused','Doomscrolling'])
+    plt.xlabel("Predicted")
+    plt.ylabel("Actual")
+    plt.title(title)
+
+
+def draw_roc(plt, sns, fpr, tpr, auc_score, title):
+    plt.figure(figsize=(6,5))
+    plt.plot(fpr, tpr, label=f'AUC={auc_score:.3f}')
+    plt.plot([0,1],[0,1],'k--')
+    plt.xlabel('False Positive Rate')
+    plt.ylabel('True Positive Rate')
+    plt.title(title)
+    plt.legend()
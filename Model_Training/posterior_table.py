@@ -0,0 +1,115 @@
+"""Compiled inference for the discrete Bayesian network in bay_net.py.
+
+The network only has a handful of evidence combinations (3 x 3 x 3 for
+ScrollRate, ClickRate and SessionLength), so instead of running
+VariableElimination once per row we run a single joint query, keep the
+posterior for every combination in a NumPy tensor, and score a whole
+DataFrame with one integer-index gather.
+
+Each evidence axis of the tensor has one extra slot at the end that holds the
+posterior with that variable marginalized out, so rows with missing evidence
+(NaN) are scored in the same gather.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+
+class PosteriorTable:
+    """P(target | evidence) for every evidence combination of a fitted network."""
+
+    def __init__(self, posterior, evidence_vars, state_names, target):
+        self.posterior = posterior          # shape: (k_1 + 1, ..., k_n + 1, k_target)
+        self.evidence_vars = list(evidence_vars)
+        self.state_names = state_names      # variable -> list of states, in tensor order
+        self.target = target
+
+    @classmethod
+    def from_inference(cls, inference, target, evidence_vars):
+        """Build the table from one joint query on a pgmpy inference object."""
+        evidence_vars = list(evidence_vars)
+        order = evidence_vars + [target]
+        joint = inference.query(variables=order, joint=True, show_progress=False)
+        instrument.count('pgmpy_queries')
+        axes = [joint.variables.index(v) for v in order]
+        values = np.transpose(joint.values, axes)
+        state_names = {v: list(joint.state_names[v]) for v in order}
+        return cls.from_joint(values, evidence_vars, state_names, target)
+
+    @classmethod
+    def from_joint(cls, values, evidence_vars, state_names, target):
+        """Build the table from a joint distribution with axes (evidence..., target)."""
+        # Append the marginal over each evidence axis as an extra "missing" state
+        for axis in range(len(evidence_vars)):
+            values = np.concatenate([values, values.sum(axis=axis, keepdims=True)], axis=axis)
+
+        totals = values.sum(axis=-1, keepdims=True)
+        posterior = np.full(values.shape, np.nan)
+        np.divide(values, totals, out=posterior, where=totals > 0)
+        return cls(posterior, evidence_vars, state_names, target)
+
+    def to_dict(self):
+        """JSON-ready form of the table (missing posteriors as None), see from_dict."""
+        posterior = np.where(np.isnan(self.posterior), None, self.posterior)
+        return {'target': self.target, 'evidence_vars': self.evidence_vars,
+                'state_names': self.state_names, 'posterior': posterior.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        posterior = np.array(data['posterior'], dtype=np.float64)   # None becomes NaN
+        return cls(posterior, data['evidence_vars'], data['state_names'], data['target'])
+
+    def codes(self, df):
+        """Integer index of each row's evidence state along every tensor axis."""
+        index = []
+        for var in self.evidence_vars:
+            states = self.state_names[var]
+            if var not in df:
+                index.append(np.full(len(df), len(states), dtype=np.intp))
+                continue
+            column = df[var]
+            codes = pd.Categorical(column, categories=states).codes.astype(np.intp)
+            unknown = (codes < 0) & column.notna().to_numpy()
+            if unknown.any():
+                bad = sorted(set(column[unknown].astype(str)))
+                raise ValueError(f"{var} has states the network never saw: {bad}")
+            codes[codes < 0] = len(states)
+            index.append(codes)
+        return tuple(index)
+
+    def predict_proba(self, df):
+        """Posterior over every target state for each row, shape (len(df), k_target).
+
+        Evidence columns that are absent from df, or NaN in a row, are
+        marginalized out.
+        """
+        instrument.count('rows_scored', len(df))
+        return self.posterior[self.codes(df)]
+
+    def prob(self, df, state):
+        """Posterior probability of one target state for each row."""
+        return self.predict_proba(df)[:, self.state_names[self.target].index(state)]
+
+    def query(self, evidence):
+        """Posterior for a single (possibly partial) evidence dict, like VariableElimination.query."""
+        return self.predict_proba(pd.DataFrame([evidence]))[0]
+
+    def check_against(self, inference, atol=1e-9):
+        """Compare every full and partial evidence combination with pgmpy; returns the max error."""
+        worst = 0.0
+        for n_given in range(1, len(self.evidence_vars) + 1):
+            for given in itertools.combinations(self.evidence_vars, n_given):
+                for states in itertools.product(*(self.state_names[v] for v in given)):
+                    evidence = dict(zip(given, states))
+                    expected = inference.query(variables=[self.target], evidence=evidence,
+                                               show_progress=False)
+                    instrument.count('pgmpy_queries')
+                    order = [expected.state_names[self.target].index(s)
+                             for s in self.state_names[self.target]]
+                    worst = max(worst, np.abs(self.query(evidence) - expected.values[order]).max())
+        if worst > atol:
+            raise AssertionError(f"Compiled posteriors differ from pgmpy by up to {worst:.3g}")
+        return worst
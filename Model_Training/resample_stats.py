@@ -0,0 +1,261 @@
+"""Bootstrap confidence intervals and permutation tests, batched with NumPy.
+
+final_model.py and bay_net.py report t-tests and Cohen's d as point
+estimates. This module adds their uncertainty, computed for every feature
+and many resamples at once rather than in Python loops:
+
+- Bootstrap: each class is resampled with replacement, keeping its size
+  (a stratified bootstrap). A block of resamples becomes a matrix of
+  resample counts via one bincount of the resample indices. Group sums and
+  sums of squares for every feature are then two matrix products, which
+  give the group means and Cohen's d.
+- AUC: the focused sessions are sorted once per feature, and each
+  doomscrolling session's position among them is found once with
+  searchsorted. Per resample, a cumulative sum of the focused counts in that
+  order then gives how many focused sessions rank below every doomscrolling
+  session, so there is no sorting per resample.
+- Permutation test: each permutation picks which sessions form the
+  doomscrolling group (argpartition of random keys, an exact subset of the
+  right size). Welch's t for every feature and permutation again comes from
+  matrix products with the values and their squares.
+
+Resamples are processed in blocks sized so one block's matrices stay under
+max_bytes, whatever the number of resamples. Blocks are independent. They
+run on a fork pool like the CV in cv_engine.py (serially where fork is
+unavailable), with memory up to n_jobs x max_bytes. Each block has its own
+seed from a SeedSequence, so results do not depend on the worker count.
+
+    python Model_Training/resample_stats.py [csv] --resamples 10000
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_ind
+
+from features import LABEL, TOP_FEATURES, add_ratio_features
+from loader import DEFAULT_CSV, RAW_FEATURE_COLUMNS, load_sessions
+
+MAX_BYTES = 256 * 2**20
+
+# Inputs of the block functions, set before forking the workers
+_data = {}
+
+
+def _map_blocks(block_fn, n_resamples, n_rows, seed, max_bytes, n_jobs, copies=4):
+    """Run block_fn((seed_sequence, block_size)) over blocks of resamples, in block order."""
+    size = max(1, int(max_bytes // (copies * 8 * max(n_rows, 1))))
+    sizes = [min(size, n_resamples - start) for start in range(0, n_resamples, size)]
+    jobs = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+    if n_jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [block_fn(job) for job in jobs]
+    with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+        return list(pool.map(block_fn, jobs))
+
+
+def _counts(rng, n, block):
+    """(block, n) int32 matrix of how often each of n rows is drawn in block resamples of size n."""
+    draws = rng.integers(0, n, size=(block, n))
+    draws += (np.arange(block) * n)[:, None]
+    return np.bincount(draws.ravel(), minlength=block * n).reshape(block, n).astype(np.int32)
+
+
+def _auc_from_groups(pos, neg):
+    """AUC from positive/negative counts per ascending score group (last axis); ties count half."""
+    neg = np.asarray(neg, dtype=np.int64)
+    twice_below = 2 * np.cumsum(neg, axis=-1) - neg      # 2 x (negatives below) + negatives tied
+    wins = (np.asarray(pos, dtype=np.int64) * twice_below).sum(axis=-1)
+    return wins / (2.0 * np.sum(pos, axis=-1) * np.sum(neg, axis=-1))
+
+
+def _rank_bounds(x_0, x_1):
+    """Per feature: the group-0 sort order, and for each group-1 row how many group-0 values are < and <= it."""
+    bounds = []
+    for k in range(x_0.shape[1]):
+        order = np.argsort(x_0[:, k], kind='stable')
+        sorted_0 = x_0[order, k]
+        bounds.append((order, np.searchsorted(sorted_0, x_1[:, k], 'left'),
+                       np.searchsorted(sorted_0, x_1[:, k], 'right')))
+    return bounds
+
+
+def _bootstrap_block(job):
+    seed, block = job
+    rng = np.random.default_rng(seed)
+    moments, counts = [], []
+    for n, center, x_c, x_sq in _data['classes']:
+        c = _counts(rng, n, block)
+        weights = c.astype(np.float64)
+        shift = weights @ x_c / n
+        var = (weights @ x_sq - n * shift ** 2) / max(n - 1, 1)
+        moments.append((n, center + shift, np.clip(var, 0, None)))
+        counts.append(c)
+
+    (n0, m0, v0), (n1, m1, v1) = moments
+    pooled = np.sqrt(((n0 - 1) * v0 + (n1 - 1) * v1) / max(n0 + n1 - 2, 1))
+    d = np.divide(m0 - m1, pooled, out=np.full(m0.shape, np.nan), where=pooled > 0)
+
+    # AUC with group 1 as the positive class. below[:, i] is how many resampled
+    # group-0 sessions rank below the i-th smallest group-0 value, so each group-1
+    # row wins below[:, lo] + below[:, hi] half-comparisons (ties count half)
+    auc_block = np.empty((block, len(_data['bounds'])))
+    below = np.zeros((block, n0 + 1), dtype=np.int32)
+    for k, (order, lo, hi) in enumerate(_data['bounds']):
+        np.cumsum(counts[0][:, order], axis=1, out=below[:, 1:])
+        twice_wins = below[:, lo] + below[:, hi]
+        auc_block[:, k] = np.einsum('ij,ij->i', counts[1], twice_wins, dtype=np.int64) / (2.0 * n0 * n1)
+    return m0, m1, d, auc_block
+
+
+def bootstrap(x, y, n_resamples=10_000, seed=0, max_bytes=MAX_BYTES, n_jobs=None):
+    """Stratified bootstrap of the group means, Cohen's d (group 0 minus group 1) and AUC of every column of x.
+
+    Returns a dict of (n_resamples, n_features) arrays: 'mean_0', 'mean_1', 'd' and 'auc'.
+    """
+    y = np.asarray(y)
+    x = np.asarray(x, dtype=np.float64).reshape(len(y), -1)
+    # Each class is resampled on its own; its values, squares and rank bounds are prepared once.
+    # Values are centred on their class mean, or Σx² − n·mean² cancels into noise
+    # for a feature with a large offset and a small spread
+    x_0, x_1 = x[y == 0], x[y == 1]
+    _data['classes'] = []
+    for x_k in (x_0, x_1):
+        center = x_k.mean(axis=0)
+        x_c = x_k - center
+        _data['classes'].append((len(x_k), center, x_c, x_c ** 2))
+    _data['bounds'] = _rank_bounds(x_0, x_1)
+    try:
+        blocks = _map_blocks(_bootstrap_block, n_resamples, len(y), seed, max_bytes, n_jobs)
+    finally:
+        _data.clear()
+    return {key: np.concatenate(parts) for key, parts in zip(('mean_0', 'mean_1', 'd', 'auc'), zip(*blocks))}
+
+
+def auc(y, scores):
+    """ROC AUC of each score column, with the same tie handling as bootstrap."""
+    y = np.asarray(y)
+    scores = np.asarray(scores, dtype=np.float64).reshape(len(y), -1)
+    result = np.empty(scores.shape[1])
+    for k in range(scores.shape[1]):
+        _, group = np.unique(scores[:, k], return_inverse=True)
+        pos = np.bincount(group[y == 1], minlength=group.max() + 1)
+        neg = np.bincount(group[y == 0], minlength=group.max() + 1)
+        result[k] = _auc_from_groups(pos, neg)
+    return result
+
+
+def welch_t(sum_0, sq_0, n_0, sum_1, sq_1, n_1):
+    """Welch's t (group 0 minus group 1) from group sums and sums of squares."""
+    m0, m1 = sum_0 / n_0, sum_1 / n_1
+    v0 = (sq_0 - n_0 * m0 ** 2) / (n_0 - 1)
+    v1 = (sq_1 - n_1 * m1 ** 2) / (n_1 - 1)
+    se = np.sqrt(np.clip(v0, 0, None) / n_0 + np.clip(v1, 0, None) / n_1)
+    return np.divide(m0 - m1, se, out=np.full(np.broadcast(m0, se).shape, np.nan), where=se > 0)
+
+
+def _group_t(in_1):
+    """Welch's t per (row of in_1, feature), where in_1 marks each row's group-1 sessions."""
+    x, x_sq, total, total_sq, n_0, n_1 = (_data[k] for k in ('x', 'x_sq', 'total', 'total_sq', 'n_0', 'n_1'))
+    sum_1, sq_1 = in_1 @ x, in_1 @ x_sq
+    return welch_t(total - sum_1, total_sq - sq_1, n_0, sum_1, sq_1, n_1)
+
+
+def _permutation_block(job):
+    seed, block = job
+    rng = np.random.default_rng(seed)
+    n, n_1 = len(_data['x']), _data['n_1']
+    # The n_1 smallest of n random keys are a uniformly random group of size n_1
+    chosen = np.argpartition(rng.random((block, n)), n_1 - 1, axis=1)[:, :n_1]
+    in_1 = np.zeros((block, n))
+    np.put_along_axis(in_1, chosen, 1.0, axis=1)
+    return (np.abs(_group_t(in_1)) >= _data['threshold']).sum(axis=0)
+
+
+def permutation_test(x, y, n_permutations=10_000, seed=0, max_bytes=MAX_BYTES, n_jobs=None):
+    """Two-sided permutation p-value of Welch's t for every column of x at once.
+
+    Returns (observed t per feature, p-value per feature); p = (1 + #|t_perm| >= |t_obs|) / (1 + B),
+    NaN where the observed t is not finite (a constant column, for instance).
+    """
+    y = np.asarray(y)
+    x = np.asarray(x, dtype=np.float64).reshape(len(y), -1)
+    n_1 = int((y == 1).sum())
+    # Welch's t does not change with a shift; centring keeps its variances from cancelling
+    x = x - x.mean(axis=0)
+    _data.update(x=x, x_sq=x ** 2, total=x.sum(axis=0), total_sq=(x ** 2).sum(axis=0), n_0=len(y) - n_1, n_1=n_1)
+    try:
+        observed = _group_t((y == 1).astype(np.float64)[None])[0]
+        # Tolerance so permutations that reproduce the observed split count as extreme
+        _data['threshold'] = np.abs(observed) * (1 - 1e-12)
+        extreme = sum(_map_blocks(_permutation_block, n_permutations, len(y), seed, max_bytes, n_jobs, copies=3))
+    finally:
+        _data.clear()
+    # A NaN threshold would count no permutation as extreme and give the smallest p possible
+    p = np.where(np.isfinite(observed), (1 + extreme) / (1 + n_permutations), np.nan)
+    return observed, p
+
+
+def percentile_ci(samples, level=0.95):
+    """Percentile interval of bootstrap samples along axis 0, as (low, high) arrays."""
+    tail = (1 - level) / 2 * 100
+    low, high = np.nanpercentile(samples, [tail, 100 - tail], axis=0)
+    return low, high
+
+
+def feature_report(df, features, label=LABEL, n_resamples=10_000, seed=0, level=0.95, max_bytes=MAX_BYTES,
+                   n_jobs=None):
+    """Per-feature means, Cohen's d and single-feature AUC with bootstrap CIs, plus Welch and permutation p-values."""
+    x = df[features].to_numpy(dtype=np.float64)
+    y = df[label].to_numpy()
+    boot = bootstrap(x, y, n_resamples, seed, max_bytes, n_jobs)
+    t_obs, p_perm = permutation_test(x, y, n_resamples, seed + 1, max_bytes, n_jobs)
+    _, p_welch = ttest_ind(x[y == 0], x[y == 1], equal_var=False)
+
+    x0, x1 = x[y == 0], x[y == 1]
+    n0, n1 = len(x0), len(x1)
+    pooled = np.sqrt(((n0 - 1) * x0.var(axis=0, ddof=1) + (n1 - 1) * x1.var(axis=0, ddof=1)) / (n0 + n1 - 2))
+    point = {'mean_0': x0.mean(axis=0), 'mean_1': x1.mean(axis=0), 'd': (x0.mean(axis=0) - x1.mean(axis=0)) / pooled}
+
+    report = pd.DataFrame(index=pd.Index(features, name='feature'))
+    for key, name in (('mean_0', 'focused_mean'), ('mean_1', 'doom_mean'), ('d', 'cohen_d')):
+        low, high = percentile_ci(boot[key], level)
+        report[name], report[f'{name}_low'], report[f'{name}_high'] = point[key], low, high
+    low, high = percentile_ci(boot['auc'], level)
+    report['auc'], report['auc_low'], report['auc_high'] = auc(y, x), low, high
+    report['welch_t'], report['p_welch'], report['p_permutation'] = t_obs, p_welch, p_perm
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap CIs and permutation tests for every feature")
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--features', nargs='+', default=TOP_FEATURES)
+    parser.add_argument('--resamples', type=int, default=10_000)
+    parser.add_argument('--level', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-mb', type=float, default=MAX_BYTES / 2**20,
+                        help="memory budget per block of resamples (per worker)")
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--out', help="write the report to this CSV")
+    args = parser.parse_args()
+
+    df = add_ratio_features(load_sessions(args.csv, columns=RAW_FEATURE_COLUMNS, float_dtype=np.float64),
+                            dtype=np.float64)
+    start = time.perf_counter()
+    report = feature_report(df, args.features, n_resamples=args.resamples, seed=args.seed, level=args.level,
+                            max_bytes=int(args.max_mb * 2**20), n_jobs=args.jobs)
+    print(f"{args.resamples:,} resamples over {len(df):,} sessions in {time.perf_counter() - start:.1f}s")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(report.T)
+    if args.out:
+        report.to_csv(args.out)
+
+
+if __name__ == '__main__':
+    main()
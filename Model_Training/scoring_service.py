@@ -0,0 +1,478 @@
+"""Localhost scoring service for the LR model and the Bayesian network.
+
+The extension scores sessions with predictDoomscrollProbability in model.js,
+so trying another model means shipping a new extension. This service scores
+the same sessions from the saved artifacts (model_artifact.py) instead:
+
+- POST /score takes one session payload, or {"sessions": [...]}, with the
+  rolling-window values background.js computes its features from:
+      {"durationMinutes": 12.5, "scrollDistance": 18000, "clicks": 3, "scrollEvents": 140}
+  and answers {"lr": P(doomscroll), "bayes": P(Doomscrolling=yes), "version": ...}
+  (lists for a list of sessions). bayes is null when no Bayes artifact is loaded.
+  All four keys are required and must be numbers; anything else is a 400.
+- Concurrent requests are micro-batched: the batcher takes everything that
+  is queued (up to --max-batch rows, waiting at most --max-wait-ms for more
+  once there is concurrency) and scores it with one vectorized pass through
+  the training code (features.py, model_artifact.predict_proba,
+  PosteriorTable.prob).
+- GET /stats reports server-side latency percentiles (queue wait + scoring)
+  over the last LATENCY_WINDOW requests, batch sizes and the model version.
+- POST /reload loads the artifacts again (or {"lr": path, "bayes": path}),
+  checks the new models on a probe session and swaps them in between two
+  batches. A batch in progress finishes on the models it started with, so
+  no request is dropped or fails during a swap.
+
+Only the standard library's asyncio is used; the HTTP/1.1 handling covers
+what the extension's fetch() and the load generator send (keep-alive,
+Content-Length bodies, JSON).
+
+    python Model_Training/scoring_service.py serve [--port 8765]
+    python Model_Training/scoring_service.py load --connections 64 --seconds 10 [--reload-every 2]
+    python Model_Training/scoring_service.py demo    # both in one process, with hot swaps
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import CLICKS, DURATION, SCROLL_DISTANCE, SCROLL_EVENTS, add_bayes_bins, add_ratio_features
+from model_artifact import ARTIFACT_PATH, BAYES_ARTIFACT_PATH, predict_proba
+from posterior_table import PosteriorTable
+
+DEFAULT_PORT = 8765
+MAX_BATCH = 1024
+MAX_WAIT_MS = 2.0
+LATENCY_WINDOW = 100_000
+
+# Payload keys, in the order of the export columns they fill
+PAYLOAD_KEYS = ['durationMinutes', 'scrollDistance', 'clicks', 'scrollEvents']
+PAYLOAD_COLUMNS = [DURATION, SCROLL_DISTANCE, CLICKS, SCROLL_EVENTS]
+PROBE = {'durationMinutes': 20.0, 'scrollDistance': 30000.0, 'clicks': 4.0, 'scrollEvents': 300.0}
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+class ModelSet:
+    """One loaded version of the LR artifact and (optionally) the Bayes artifact."""
+
+    def __init__(self, lr_path=ARTIFACT_PATH, bayes_path=BAYES_ARTIFACT_PATH):
+        with open(lr_path, 'rb') as f:
+            lr_bytes = f.read()
+        self.lr = json.loads(lr_bytes)
+        digest = hashlib.sha1(lr_bytes)
+        self.bayes = self.cuts = None
+        if bayes_path:
+            try:
+                with open(bayes_path, 'rb') as f:
+                    bayes_bytes = f.read()
+            except FileNotFoundError:
+                pass    # LR only, until bay_net.py has saved a posterior table
+            else:
+                bayes = json.loads(bayes_bytes)
+                self.bayes = PosteriorTable.from_dict(bayes['table'])
+                self.cuts = {name: tuple(values) for name, values in bayes['cuts'].items()}
+                digest.update(bayes_bytes)
+        self.version = digest.hexdigest()[:12]
+        self.paths = {'lr': lr_path, 'bayes': bayes_path}
+
+    def score(self, X):
+        """(lr, bayes) probabilities for an (n, 4) array of payload values; bayes is None without a table."""
+        df = pd.DataFrame(X, columns=PAYLOAD_COLUMNS)
+        add_ratio_features(df, dtype=np.float64)
+        lr = predict_proba(self.lr, df[self.lr['features']].to_numpy())
+        if self.bayes is None:
+            return lr, None
+        add_bayes_bins(df, **self.cuts)
+        return lr, self.bayes.prob(df, 'yes')
+
+
+def payload_rows(payload):
+    """(n, 4) float array from one session dict or {"sessions": [...]}; also whether it was a list."""
+    sessions = payload.get('sessions') if isinstance(payload, dict) else None
+    many = sessions is not None
+    sessions = sessions if many else [payload]
+    if not isinstance(sessions, list) or not all(isinstance(s, dict) for s in sessions):
+        raise ValueError("expected a session object or {\"sessions\": [objects]}")
+    for s in sessions:
+        # A misspelt key would otherwise be scored as a 0
+        missing = [k for k in PAYLOAD_KEYS if k not in s]
+        if missing:
+            raise ValueError(f"session is missing {', '.join(missing)}")
+        # bool is an int subclass, and True would be scored as 1.0
+        if not all(isinstance(s[k], (int, float)) and not isinstance(s[k], bool) for k in PAYLOAD_KEYS):
+            raise ValueError(f"session values must be numbers ({', '.join(PAYLOAD_KEYS)})")
+    try:
+        X = np.array([[s[k] for k in PAYLOAD_KEYS] for s in sessions], dtype=np.float64)
+    except OverflowError:
+        raise ValueError("session values must be finite and non-negative") from None
+    if not np.isfinite(X).all() or (X < 0).any():
+        raise ValueError("session values must be finite and non-negative")
+    return X.reshape(len(sessions), len(PAYLOAD_KEYS)), many
+
+
+class LatencyStats:
+    """Latencies (seconds) of the last `window` requests and batch size counts."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = np.zeros(window)
+        self.n = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.max_batch = 0
+
+    def add_batch(self, latencies, n_rows):
+        k = len(latencies)
+        index = (self.n + np.arange(k)) % len(self.latencies)
+        self.latencies[index] = latencies
+        self.n += k
+        self.batches += 1
+        self.batch_rows += n_rows
+        self.max_batch = max(self.max_batch, n_rows)
+
+    def report(self):
+        recent = self.latencies[:min(self.n, len(self.latencies))]
+        percentiles = np.percentile(recent, [50, 90, 99, 99.9]) * 1e3 if len(recent) else [None] * 4
+        return {
+            'requests': self.n,
+            'batches': self.batches,
+            'mean_batch_rows': round(self.batch_rows / self.batches, 2) if self.batches else 0,
+            'max_batch_rows': self.max_batch,
+            'latency_ms': {name: (round(float(p), 3) if p is not None else None)
+                           for name, p in zip(['p50', 'p90', 'p99', 'p99.9'], percentiles)},
+        }
+
+
+class ScoringService:
+    """Micro-batching scorer plus the HTTP front end."""
+
+    def __init__(self, models, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.models = models
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1e3
+        self.stats = LatencyStats()
+        self.swaps = 0
+        self._queue = asyncio.Queue()
+        self._batcher = None
+        self._reload_lock = asyncio.Lock()
+
+    def start(self):
+        self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, X):
+        """Queue an (n, 4) array for the next batch; returns (lr, bayes, version)."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((X, future, time.perf_counter()))
+        return await future
+
+    def _drain(self, batch, n_rows):
+        while n_rows < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            batch.append(item)
+            n_rows += len(item[0])
+        return n_rows
+
+    async def _run_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            n_rows = self._drain(batch, len(batch[0][0]))
+            # Only wait for stragglers when requests are arriving concurrently
+            if len(batch) > 1 and n_rows < self.max_batch and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+                n_rows = self._drain(batch, n_rows)
+            self._score_batch(batch, n_rows)
+
+    def _score_batch(self, batch, n_rows):
+        models = self.models    # a swap during this batch applies from the next one
+        X = np.concatenate([item[0] for item in batch]) if len(batch) > 1 else batch[0][0]
+        try:
+            lr, bayes = models.score(X)
+        except Exception as error:  # reported to every caller in the batch
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for X_item, future, _ in batch:
+            stop = start + len(X_item)
+            if not future.done():
+                future.set_result((lr[start:stop], None if bayes is None else bayes[start:stop], models.version))
+            start = stop
+        now = time.perf_counter()
+        self.stats.add_batch(np.array([now - queued for _, _, queued in batch]), n_rows)
+
+    async def reload(self, lr_path=None, bayes_path=None):
+        """Load and check a new ModelSet off the event loop, then swap it in; returns its version."""
+        async with self._reload_lock:
+            old = self.models
+            lr_path = lr_path or old.paths['lr']
+            bayes_path = bayes_path or old.paths['bayes']
+            loop = asyncio.get_running_loop()
+            models = await loop.run_in_executor(None, ModelSet, lr_path, bayes_path)
+            lr, bayes = models.score(payload_rows(PROBE)[0])
+            if not np.isfinite(lr).all() or (bayes is not None and not np.isfinite(bayes).all()):
+                raise ValueError("new models give non-finite scores on the probe session")
+            self.models = models
+            self.swaps += 1
+            return models.version
+
+    # ---- HTTP ----
+
+    async def handle(self, method, path, body):
+        if method == 'POST' and path == '/score':
+            X, many = payload_rows(json.loads(body or b'{}'))
+            lr, bayes, version = await self.score(X)
+            lr = lr.tolist()
+            bayes = bayes.tolist() if bayes is not None else None
+            if not many:
+                lr, bayes = lr[0], bayes[0] if bayes is not None else None
+            return 200, {'lr': lr, 'bayes': bayes, 'version': version}
+        if method == 'GET' and path == '/stats':
+            return 200, {**self.stats.report(), 'version': self.models.version, 'swaps': self.swaps,
+                         'queued': self._queue.qsize()}
+        if method == 'POST' and path == '/reload':
+            request = json.loads(body) if body else {}
+            version = await self.reload(request.get('lr'), request.get('bayes'))
+            return 200, {'version': version, 'swaps': self.swaps}
+        return 404, {'error': f"no route for {method} {path}"}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_http_message(reader)
+                if request is None:
+                    break
+                (method, path, _), headers, body = request
+                try:
+                    status, response = await self.handle(method, path, body)
+                except (ValueError, KeyError) as error:
+                    status, response = 400, {'error': str(error)}
+                except Exception as error:  # keep the connection and the server alive
+                    status, response = 500, {'error': f"{type(error).__name__}: {error}"}
+                writer.write(http_response(status, response))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_http_message(reader):
+    """((first-line parts), headers, body) of the next HTTP message, or None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    first = line.decode('latin-1').split(None, 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return first, headers, body
+
+
+def http_response(status, payload):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode() + body
+
+
+def http_request(method, path, payload=None, host='127.0.0.1'):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+    return head.encode() + body
+
+
+async def start_server(service, host='127.0.0.1', port=DEFAULT_PORT):
+    service.start()
+    return await asyncio.start_server(service.serve_connection, host, port)
+
+
+# ---- load generator ----
+
+class Client:
+    """One keep-alive connection to the service."""
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, method, path, payload=None):
+        self.writer.write(http_request(method, path, payload))
+        await self.writer.drain()
+        message = await read_http_message(self.reader)
+        if message is None:
+            raise ConnectionError("server closed the connection")
+        (_, status, _), _, body = message
+        return int(status), json.loads(body)
+
+    def close(self):
+        self.writer.close()
+
+
+def random_sessions(n, seed=0):
+    """Plausible payloads: log-normal durations and rates around the study export's ranges."""
+    rng = np.random.default_rng(seed)
+    duration = rng.lognormal(2.8, 0.7, n)
+    events = duration * rng.lognormal(2.5, 0.8, n)
+    return [{'durationMinutes': float(d), 'scrollDistance': float(e * rng.uniform(20, 60)),
+             'clicks': float(rng.poisson(d / 5)), 'scrollEvents': float(round(e))}
+            for d, e in zip(duration, events)]
+
+
+async def run_load(host='127.0.0.1', port=DEFAULT_PORT, connections=64, seconds=10.0,
+                   sessions_per_request=1, reload_every=None, seed=0):
+    """Send /score requests from `connections` concurrent clients for `seconds`; returns a summary dict."""
+    payloads = random_sessions(4096 * sessions_per_request, seed)
+    latencies, errors, versions = [], 0, set()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+
+    async def worker(k):
+        nonlocal errors
+        client = await Client.connect(host, port)
+        i = k
+        try:
+            while loop.time() < deadline:
+                start = i * sessions_per_request % len(payloads)
+                chunk = payloads[start:start + sessions_per_request]
+                body = chunk[0] if sessions_per_request == 1 else {'sessions': chunk}
+                sent = time.perf_counter()
+                status, response = await client.request('POST', '/score', body)
+                latencies.append(time.perf_counter() - sent)
+                if status != 200:
+                    errors += 1
+                else:
+                    versions.add(response['version'])
+                i += connections
+        finally:
+            client.close()
+
+    async def reloader():
+        client = await Client.connect(host, port)
+        swaps = 0
+        try:
+            while loop.time() + reload_every < deadline:
+                await asyncio.sleep(reload_every)
+                status, _ = await client.request('POST', '/reload', {})
+                swaps += status == 200
+        finally:
+            client.close()
+        return swaps
+
+    started = time.perf_counter()
+    tasks = [worker(k) for k in range(connections)]
+    if reload_every:
+        tasks.append(reloader())
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    stats_client = await Client.connect(host, port)
+    _, server = await stats_client.request('GET', '/stats')
+    stats_client.close()
+    latencies = np.array(latencies)
+    return {
+        'requests': len(latencies),
+        'sessions': len(latencies) * sessions_per_request,
+        'errors': errors,
+        'requests_per_s': len(latencies) / elapsed,
+        'client_latency_ms': dict(zip(['p50', 'p90', 'p99', 'p99.9'],
+                                      np.percentile(latencies, [50, 90, 99, 99.9]) * 1e3)) if len(latencies) else {},
+        'reloads': results[-1] if reload_every else 0,
+        'versions_seen': len(versions),
+        'server': server,
+    }
+
+
+def print_load_summary(summary):
+    client = ", ".join(f"{k} {v:.2f}" for k, v in summary['client_latency_ms'].items())
+    server = summary['server']
+    print(f"{summary['requests']:,} requests ({summary['sessions']:,} sessions), {summary['errors']} errors, "
+          f"{summary['requests_per_s']:,.0f} requests/s")
+    print(f"client latency ms: {client}")
+    print("server latency ms: " + ", ".join(f"{k} {v}" for k, v in server['latency_ms'].items()))
+    print(f"batches: {server['batches']:,}, mean {server['mean_batch_rows']} rows, max {server['max_batch_rows']}")
+    print(f"hot swaps during the run: {summary['reloads']}, errors: {summary['errors']}, "
+          f"server version {server['version']}")
+
+
+async def _serve(args):
+    service = ScoringService(ModelSet(args.lr, args.bayes), args.max_batch, args.max_wait_ms)
+    server = await start_server(service, args.host, args.port)
+    print(f"Scoring on http://{args.host}:{args.port} (models {service.models.version}, "
+          f"Bayes {'on' if service.models.bayes is not None else 'off'})")
+    async with server:
+        await server.serve_forever()
+
+
+async def _demo(args):
+    service = ScoringService(ModelSet(args.lr, args.bayes), args.max_batch, args.max_wait_ms)
+    server = await start_server(service, args.host, 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        summary = await run_load(args.host, port, args.connections, args.seconds,
+                                 args.sessions_per_request, args.reload_every or 1.0)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+    print_load_summary(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching localhost scoring service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('serve', "run the service"), ('load', "load-test a running service"),
+                            ('demo', "run the service and the load generator together")]:
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('--port', type=int, default=DEFAULT_PORT)
+        if name in ('serve', 'demo'):
+            sub.add_argument('--lr', default=ARTIFACT_PATH, help="LR artifact (final_model.py)")
+            sub.add_argument('--bayes', default=BAYES_ARTIFACT_PATH, help="Bayes artifact (bay_net.py)")
+            sub.add_argument('--max-batch', type=int, default=MAX_BATCH)
+            sub.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+        if name in ('load', 'demo'):
+            sub.add_argument('--connections', type=int, default=64)
+            sub.add_argument('--seconds', type=float, default=10.0)
+            sub.add_argument('--sessions-per-request', type=int, default=1)
+            sub.add_argument('--reload-every', type=float, default=None,
+                             help="POST /reload this often (seconds) during the run")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        asyncio.run(_serve(args))
+    elif args.command == 'demo':
+        asyncio.run(_demo(args))
+    else:
+        summary = asyncio.run(run_load(args.host, args.port, args.connections, args.seconds,
+                                       args.sessions_per_request, args.reload_every))
+        print_load_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
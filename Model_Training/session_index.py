@@ -0,0 +1,462 @@
+"""Nearest-neighbour index over past sessions, for explanations and kNN scoring.
+
+When a session is flagged, similar_sessions shows the past sessions nearest
+to it and their labels. knn_proba turns the same neighbours into a kNN
+score to compare with the LR and RF models.
+
+Sessions are indexed as their top_features vectors (features.TOP_FEATURES),
+standardized with the scaler in the LR artifact, so distances live in the
+space the deployed model sees. The points sit in a sklearn KDTree (three
+dimensions, where a KD-tree's exact search beats any approximate scheme):
+
+- save() writes the tree's arrays (points, permutation, node data and
+  bounds) as .npy files. load() memory-maps them read-only and hands them
+  to the tree as they are, so opening a million-session index reads almost
+  nothing until queries touch it. If the sklearn version that saved the
+  tree differs, the tree is rebuilt from the mapped points instead.
+- add() appends new sessions to a small in-memory delta that queries scan
+  by brute force alongside the tree. Exports overlap (exportToCSV always
+  writes the last 100 sessions), so sessions whose Session ID is already
+  indexed are skipped rather than indexed twice. Once the delta outgrows
+  REBUILD_FRACTION of the tree (and at least REBUILD_MIN sessions), both
+  are rebuilt into one tree. save() after an add rewrites only the delta
+  files while the tree is unchanged.
+- query() answers a whole batch: one tree query, one vectorized distance
+  block against the delta, merged per row.
+
+    python Model_Training/session_index.py build Model_Training/session_data.csv [--out DIR]
+    python Model_Training/session_index.py add new_sessions.csv [--index DIR]
+    python Model_Training/session_index.py similar new_sessions.csv [--index DIR] [--k 5]
+    python Model_Training/session_index.py --benchmark 1000000
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.neighbors import KDTree
+
+from features import LABEL, TOP_FEATURES, add_ratio_features
+from loader import SESSION_ID, load_sessions
+from model_artifact import load_artifact
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.path.join(HERE, ".cache", "session_index")
+INDEX_VERSION = 1
+LEAF_SIZE = 40
+REBUILD_FRACTION = 0.05
+REBUILD_MIN = 10_000
+QUERY_BLOCK = 64    # queries per brute-force distance block against the delta
+
+# The first four items of a KDTree's pickled state, saved as .npy files
+TREE_ARRAYS = ['data', 'idx_array', 'node_data', 'node_bounds']
+
+
+class SessionIndex:
+    """KD-tree of standardized session vectors plus an append-only delta."""
+
+    def __init__(self, mean, std, features=TOP_FEATURES, leaf_size=LEAF_SIZE):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.features = list(features)
+        self.leaf_size = leaf_size
+        self.tree = None
+        self.labels = np.empty(0, dtype=np.int8)
+        self.ids = np.empty(0, dtype='S1')
+        self._delta = []            # (X, labels, ids) batches not in the tree yet
+        self._delta_cache = None
+        self._saved_to = None       # folder holding this exact tree, if any
+        self._sorted_ids = None     # the tree's non-empty IDs, sorted for membership tests
+
+    @classmethod
+    def from_artifact(cls, artifact=None, **kwargs):
+        """An empty index in the LR artifact's standardized feature space."""
+        artifact = artifact or load_artifact()
+        return cls(artifact['scaler']['mean'], artifact['scaler']['std'], artifact['features'], **kwargs)
+
+    # ---- vectors ----
+
+    def vectors(self, df):
+        """Standardized feature vectors of a session DataFrame (engineered features added if needed)."""
+        if any(f not in df for f in self.features):
+            df = add_ratio_features(df.copy(), dtype=np.float64)
+        return (df[self.features].to_numpy(dtype=np.float64) - self.mean) / self.std
+
+    @property
+    def n_tree(self):
+        return 0 if self.tree is None else len(self.labels)
+
+    def __len__(self):
+        return self.n_tree + len(self._delta_arrays()[1])
+
+    def _delta_arrays(self):
+        if self._delta_cache is None:
+            if self._delta:
+                X, labels, ids = zip(*self._delta)
+                self._delta_cache = (np.concatenate(X), np.concatenate(labels), np.concatenate(ids))
+                self._delta = [self._delta_cache]
+            else:
+                self._delta_cache = (np.empty((0, len(self.features))), np.empty(0, np.int8), np.empty(0, 'S1'))
+        return self._delta_cache
+
+    # ---- building ----
+
+    def build(self, X, labels, ids=None):
+        """Index standardized vectors X (replacing everything indexed so far); a repeated ID keeps its last row."""
+        ids = _ids(ids, len(X))
+        keep = _last_occurrence(ids)
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float64)[keep])
+        self.tree = KDTree(X, leaf_size=self.leaf_size)
+        self.labels = np.asarray(labels, dtype=np.int8)[keep]
+        self.ids = ids[keep]
+        self._delta, self._delta_cache = [], None
+        self._saved_to = self._sorted_ids = None
+        return self
+
+    def add(self, X, labels, ids=None):
+        """Insert standardized vectors, skipping IDs already indexed; returns how many were added.
+
+        The delta is folded into the tree once it is big enough.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        ids = _ids(ids, len(X))
+        keep = _last_occurrence(ids) & ~self.contains(ids)
+        if not keep.any():
+            return 0
+        self._delta.append((X[keep], np.asarray(labels, dtype=np.int8)[keep], ids[keep]))
+        self._delta_cache = None
+        if self.tree is None or len(self._delta_arrays()[1]) > max(REBUILD_MIN, REBUILD_FRACTION * self.n_tree):
+            self.rebuild()
+        return int(keep.sum())
+
+    def contains(self, ids):
+        """Which of the (utf-8 encoded) ids are already indexed; empty IDs never are."""
+        ids = np.asarray(ids)
+        if self._sorted_ids is None:
+            self._sorted_ids = np.sort(self.ids[self.ids != b''])
+        known = self._sorted_ids
+        found = np.zeros(len(ids), dtype=bool)
+        if len(known):
+            found = known[np.searchsorted(known, ids).clip(max=len(known) - 1)] == ids
+        delta_ids = self._delta_arrays()[2]
+        if len(delta_ids):
+            found |= np.isin(ids, delta_ids)
+        return found & (ids != b'')
+
+    def rebuild(self):
+        """Merge the delta into a new tree."""
+        dX, dlabels, dids = self._delta_arrays()
+        if self.tree is None:
+            return self.build(dX, dlabels, dids)
+        data = np.asarray(self.tree.get_arrays()[0])
+        return self.build(np.concatenate([data, dX]), np.concatenate([self.labels, dlabels]),
+                          np.concatenate([self.ids, dids]))
+
+    # ---- queries ----
+
+    def query(self, X, k=10):
+        """(distances, indices) of the k nearest indexed sessions to each row of X, nearest first.
+
+        Indices below n_tree are tree rows; the rest are delta rows in
+        insertion order (label_of and id_of take either).
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        parts = []
+        if self.tree is not None:
+            dist, idx = self.tree.query(X, k=min(k, self.n_tree))
+            parts.append((dist, idx))
+        dX = self._delta_arrays()[0]
+        if len(dX):
+            parts.append(self._brute(X, dX, k, offset=self.n_tree))
+        if not parts:
+            raise ValueError("the index is empty")
+        if len(parts) == 1:
+            return parts[0]
+        dist = np.concatenate([p[0] for p in parts], axis=1)
+        idx = np.concatenate([p[1] for p in parts], axis=1)
+        order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+    @staticmethod
+    def _brute(X, points, k, offset=0, block=QUERY_BLOCK):
+        """Exact k nearest of `points` for each row of X, block by block."""
+        k = min(k, len(points))
+        squared = (points ** 2).sum(axis=1)
+        dist = np.empty((len(X), k))
+        idx = np.empty((len(X), k), dtype=np.int64)
+        for start in range(0, len(X), block):
+            q = X[start:start + block]
+            d2 = (q ** 2).sum(axis=1)[:, None] + squared[None, :] - 2 * q @ points.T
+            nearest = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < len(points) else \
+                np.broadcast_to(np.arange(len(points)), (len(q), len(points)))
+            near_d2 = np.take_along_axis(d2, nearest, axis=1)
+            order = np.argsort(near_d2, axis=1, kind='stable')
+            dist[start:start + block] = np.sqrt(np.maximum(np.take_along_axis(near_d2, order, axis=1), 0))
+            idx[start:start + block] = np.take_along_axis(nearest, order, axis=1) + offset
+        return dist, idx
+
+    def label_of(self, idx):
+        return np.concatenate([self.labels, self._delta_arrays()[1]])[idx] if len(self._delta_arrays()[1]) \
+            else self.labels[idx]
+
+    def id_of(self, idx):
+        ids = np.concatenate([self.ids, self._delta_arrays()[2]]) if len(self._delta_arrays()[2]) else self.ids
+        return np.char.decode(ids[idx], 'utf-8')
+
+    def knn_proba(self, X, k=10):
+        """Share of each row's k nearest labelled sessions that were doomscrolling (unlabelled ones skipped)."""
+        _, idx = self.query(X, k)
+        labels = self.label_of(idx)
+        known = labels >= 0
+        return np.divide((labels == 1).sum(axis=1), known.sum(axis=1),
+                         out=np.full(len(idx), np.nan), where=known.any(axis=1))
+
+    def similar_sessions(self, df, k=5):
+        """The k nearest indexed sessions to each session in df: one row per (query, rank).
+
+        A session that is itself indexed is left out of its own neighbours.
+        """
+        if SESSION_ID not in df:
+            dist, idx = self.query(self.vectors(df), k)
+            query_ids, own = np.arange(len(df)), np.zeros(idx.shape, dtype=bool)
+        else:
+            query_ids = df[SESSION_ID].astype(str).to_numpy()
+            dist, idx = self.query(self.vectors(df), k + 1)
+            # Own entries move to the end of their row (the stable sort keeps the
+            # rest in distance order) and are dropped below if still within k
+            own = self.id_of(idx) == query_ids[:, None]
+            order = np.argsort(own, axis=1, kind='stable')[:, :k]
+            dist, idx, own = (np.take_along_axis(a, order, axis=1) for a in (dist, idx, own))
+        keep = ~own.ravel()
+        return pd.DataFrame({
+            'query': np.repeat(query_ids, idx.shape[1])[keep],
+            'rank': np.tile(np.arange(1, idx.shape[1] + 1), len(idx))[keep],
+            SESSION_ID: self.id_of(idx.ravel()[keep]),
+            LABEL: self.label_of(idx.ravel()[keep]),
+            'distance': dist.ravel()[keep],
+        })
+
+    # ---- persistence ----
+
+    def save(self, folder=INDEX_DIR):
+        """Write the index to folder; the tree files are skipped if folder already holds this tree."""
+        os.makedirs(folder, exist_ok=True)
+        if self.tree is not None and self._saved_to != os.path.abspath(folder):
+            state = self.tree.__getstate__()
+            for name, array in zip(TREE_ARRAYS, state):
+                _save_npy(os.path.join(folder, name + ".npy"), np.asarray(array))
+            _save_npy(os.path.join(folder, "labels.npy"), self.labels)
+            _save_npy(os.path.join(folder, "ids.npy"), self.ids)
+            with open(os.path.join(folder, "tree_state.pkl"), 'wb') as f:
+                pickle.dump(state[len(TREE_ARRAYS):], f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._saved_to = os.path.abspath(folder)
+        dX, dlabels, dids = self._delta_arrays()
+        _save_npy(os.path.join(folder, "delta_X.npy"), dX)
+        _save_npy(os.path.join(folder, "delta_labels.npy"), dlabels)
+        _save_npy(os.path.join(folder, "delta_ids.npy"), dids)
+        meta = {'version': INDEX_VERSION, 'sklearn': sklearn.__version__, 'features': self.features,
+                'mean': self.mean.tolist(), 'std': self.std.tolist(), 'leaf_size': self.leaf_size,
+                'n_tree': self.n_tree, 'n_delta': len(dlabels)}
+        tmp_path = os.path.join(folder, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(folder, "meta.json"))
+        return folder
+
+    @classmethod
+    def load(cls, folder=INDEX_DIR, mmap=True):
+        """Open a saved index; with mmap the tree arrays stay on disk until queries read them."""
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        if meta['version'] != INDEX_VERSION:
+            raise ValueError(f"{folder} holds index version {meta['version']}, expected {INDEX_VERSION}")
+        index = cls(meta['mean'], meta['std'], meta['features'], meta['leaf_size'])
+        mode = 'r' if mmap else None
+        if meta['n_tree']:
+            arrays = [np.load(os.path.join(folder, name + ".npy"), mmap_mode=mode) for name in TREE_ARRAYS]
+            index.labels = np.load(os.path.join(folder, "labels.npy"), mmap_mode=mode)
+            index.ids = np.load(os.path.join(folder, "ids.npy"), mmap_mode=mode)
+            if meta['sklearn'] == sklearn.__version__:
+                with open(os.path.join(folder, "tree_state.pkl"), 'rb') as f:
+                    rest = pickle.load(f)
+                index.tree = KDTree.__new__(KDTree)
+                index.tree.__setstate__(tuple(arrays) + tuple(rest))
+                index._saved_to = os.path.abspath(folder)
+            else:
+                # Another sklearn may lay the state out differently; the points are enough
+                index.tree = KDTree(np.asarray(arrays[0]), leaf_size=index.leaf_size)
+        dlabels = np.load(os.path.join(folder, "delta_labels.npy"))
+        if len(dlabels):
+            index._delta = [(np.load(os.path.join(folder, "delta_X.npy")), dlabels,
+                             np.load(os.path.join(folder, "delta_ids.npy")))]
+        return index
+
+
+def _ids(ids, n):
+    if ids is None:
+        return np.zeros(n, dtype='S1')
+    return np.char.encode(np.asarray(ids, dtype=str), 'utf-8') if len(ids) else np.empty(0, 'S1')
+
+
+def _last_occurrence(ids):
+    """Mask keeping the last row of each repeated non-empty ID (a later export holds the final values)."""
+    keep = ids == b''
+    _, last = np.unique(ids[::-1], return_index=True)
+    keep[len(ids) - 1 - last] = True
+    return keep
+
+
+def _save_npy(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def build_index(df, artifact=None, leaf_size=LEAF_SIZE):
+    """Index every session of an export (labels from doomscroll_label, -1 where missing)."""
+    index = SessionIndex.from_artifact(artifact, leaf_size=leaf_size)
+    labels = df[LABEL].fillna(-1).to_numpy() if LABEL in df else np.full(len(df), -1)
+    ids = df[SESSION_ID].astype(str).to_numpy() if SESSION_ID in df else None
+    return index.build(index.vectors(df), labels, ids)
+
+
+def _rss_mb():
+    """Current resident set size in MB (Linux only; the peak would hide a load after the build)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def recall(index_dist, brute_dist, tol=1e-9):
+    """Share of returned neighbours within the true k-th distance (ties count as correct)."""
+    return float((index_dist <= brute_dist[:, -1:] + tol).mean())
+
+
+def benchmark(n_sessions, n_queries=10_000, k=10, n_insert=100_000):
+    import tempfile
+
+    from sklearn.metrics import roc_auc_score
+
+    from model_artifact import score_sessions
+    from synthetic import generate_sessions, load_session_model
+
+    model = load_session_model()
+    sessions = generate_sessions(n_sessions, model, seed=0)
+    queries = generate_sessions(n_queries, model, seed=1)
+    inserts = generate_sessions(n_insert, model, seed=2)
+    artifact = load_artifact()
+    print(f"{n_sessions:,} sessions, {n_queries:,} queries, k={k}")
+
+    start = time.perf_counter()
+    index = build_index(sessions, artifact)
+    print(f"build: {time.perf_counter() - start:.2f}s")
+
+    with tempfile.TemporaryDirectory(prefix='session_index_') as folder:
+        start = time.perf_counter()
+        index.save(folder)
+        print(f"save: {time.perf_counter() - start:.2f}s "
+              f"({sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)) / 2**20:,.0f} MB)")
+        points = np.asarray(index.tree.get_arrays()[0]).copy()
+        del index
+
+        rss = _rss_mb()
+        start = time.perf_counter()
+        index = SessionIndex.load(folder)
+        print(f"load (mmap): {(time.perf_counter() - start) * 1e3:.1f} ms, RSS grew {_rss_mb() - rss:.1f} MB")
+
+        Q = index.vectors(queries)
+        for batch in (1, 100, n_queries):
+            n = min(n_queries, 1000) if batch == 1 else n_queries
+            times = []
+            for lo in range(0, n, batch):
+                t = time.perf_counter()
+                index.query(Q[lo:lo + batch], k)
+                times.append(time.perf_counter() - t)
+            per_query = sum(times) / n * 1e6
+            print(f"query batch {batch:>6,}: {per_query:8.1f} us/query, "
+                  f"p50 {np.percentile(times, 50) * 1e3:.3f} ms, p99 {np.percentile(times, 99) * 1e3:.3f} ms per batch")
+
+        n_check = min(n_queries, 1000)
+        dist, _ = index.query(Q[:n_check], k)
+        start = time.perf_counter()
+        brute, _ = SessionIndex._brute(Q[:n_check], points, k)
+        brute_us = (time.perf_counter() - start) / n_check * 1e6
+        print(f"brute force: {brute_us:,.0f} us/query; recall@{k} {recall(dist, brute):.4f}")
+
+        X_new = index.vectors(inserts)
+        y_new = inserts[LABEL].to_numpy()
+        ids_new = inserts[SESSION_ID].to_numpy()
+        start = time.perf_counter()
+        rebuilds = 0
+        for lo in range(0, n_insert, 1000):
+            before = index.n_tree
+            index.add(X_new[lo:lo + 1000], y_new[lo:lo + 1000], ids_new[lo:lo + 1000])
+            rebuilds += index.n_tree != before
+        insert_s = time.perf_counter() - start
+        # Overlapping exports: sessions indexed already are skipped
+        if index.add(X_new[:1000], y_new[:1000], ids_new[:1000]):
+            raise AssertionError("re-added sessions were indexed twice")
+        start = time.perf_counter()
+        index.save(folder)
+        print(f"insert {n_insert:,} in batches of 1,000: {insert_s / (n_insert / 1000) * 1e3:.2f} ms/batch, "
+              f"{rebuilds} rebuilds; save {time.perf_counter() - start:.2f}s; {index.n_tree:,} in tree, "
+              f"{len(index) - index.n_tree:,} in delta")
+
+        reopened = SessionIndex.load(folder)
+        dist, _ = reopened.query(Q[:n_check], k)
+        brute, _ = SessionIndex._brute(Q[:n_check], np.concatenate([points, X_new]), k)
+        print(f"after inserts (reloaded): recall@{k} {recall(dist, brute):.4f}")
+
+        y = queries[LABEL].to_numpy()
+        knn = reopened.knn_proba(Q, k)
+        lr = score_sessions(artifact, queries)
+        print(f"held-out AUC: kNN (k={k}) {roc_auc_score(y, knn):.3f}, LR {roc_auc_score(y, lr):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearest-neighbour index over past sessions")
+    parser.add_argument('--benchmark', type=int, metavar='SESSIONS', help="time build/query/insert at this size")
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help="index every session of an export")
+    build.add_argument('csv')
+    build.add_argument('--out', default=INDEX_DIR)
+    similar = commands.add_parser('similar', help="list the indexed sessions nearest to each session of an export")
+    similar.add_argument('csv')
+    similar.add_argument('--index', default=INDEX_DIR)
+    similar.add_argument('--k', type=int, default=5)
+    add = commands.add_parser('add', help="insert the sessions of an export into an existing index")
+    add.add_argument('csv')
+    add.add_argument('--index', default=INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.command == 'build':
+        index = build_index(load_sessions(args.csv, float_dtype=np.float64))
+        index.save(args.out)
+        print(f"Indexed {len(index):,} sessions in {args.out}")
+    elif args.command == 'similar':
+        index = SessionIndex.load(args.index)
+        print(index.similar_sessions(load_sessions(args.csv, float_dtype=np.float64), args.k).to_string(index=False))
+    elif args.command == 'add':
+        index = SessionIndex.load(args.index)
+        df = load_sessions(args.csv, float_dtype=np.float64)
+        labels = df[LABEL].fillna(-1).to_numpy() if LABEL in df else np.full(len(df), -1)
+        added = index.add(index.vectors(df), labels,
+                          df[SESSION_ID].astype(str).to_numpy() if SESSION_ID in df else None)
+        index.save(args.index)
+        print(f"Added {added:,} of {len(df):,} sessions (the rest were indexed already)")
+        print(f"Index now holds {len(index):,} sessions ({len(index) - index.n_tree:,} awaiting a rebuild)")
+    else:
+        parser.error("give a command or --benchmark")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+"""Training rows rebuilt from raw browser.storage.local dumps.
+
+exportToCSV (popup.js) only sees the last 100 scrollSessions that
+saveSessionData keeps, and cleanupOldData drops anything older than 30
+days. Dumps of the raw storage taken over time hold the full history, but
+they are large: every session record carries its scrollEvents and
+videoInteractions arrays. This module turns any number of them into one
+compact export:
+
+1. iter_storage_items streams the scrollSessions and nudgeOutcomes arrays
+   out of a dump one element at a time. The file is read in blocks and each
+   element is decoded with the json module's C scanner, so memory holds one
+   block and one element, never the whole dump. .gz dumps are read as they
+   are.
+2. Each session record is reduced to the exportToCSV columns plus
+   timeInShorts, timeWatchingVideo and actualWatchTime, and each nudge
+   outcome to its session, type and outcome. Rows are collected in batches
+   of typed columns, not as dicts.
+3. saveSessionData replaces a session's record on every auto-save and
+   dumps overlap, so a session shows up many times. Only its most recently
+   saved record is kept (by savedAt; on a tie the later one read). A nudge
+   outcome is identified by its session and timestamp, and its last update
+   wins (closed becomes closed_then_returned in place).
+4. The rows, with the number of nudges shown per session, are written to a
+   CSV in batches. It has the columns of session_data.csv and loads with
+   loader.load_sessions. With --labels, doomscroll_label is joined from an
+   already labelled export by Session ID, and only labelled sessions are
+   kept.
+
+    python Model_Training/sessionize.py dump_2025_11.json dump_2025_12.json.gz --out history.csv \\
+        [--labels Model_Training/session_data.csv] [--outcomes nudges.csv]
+    python Model_Training/sessionize.py --benchmark 50000
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from features import CLICKS, DURATION, LABEL, NUDGES_SHOWN, SCROLL_DISTANCE, SCROLL_EVENTS, \
+    SHORTS_TIME, VIDEO_TIME, WATCH_TIME
+from loader import DATE, SESSION_ID, URL
+
+SESSIONS_KEY = 'scrollSessions'
+OUTCOMES_KEY = 'nudgeOutcomes'
+
+# Characters read from a dump at a time, and rows per typed batch / CSV write
+BLOCK_CHARS = 1 << 20
+BATCH_ROWS = 100_000
+
+OUTCOME_COLUMNS = ['sessionId', 'timestamp', 'nudgeType', 'chosenSuggestion', 'contextAtNudge',
+                   'scrollDistAtNudge', 'durationAtNudge', 'finalOutcome']
+
+# Session record fields kept, in row order; the *_ms ones are milliseconds
+_SESSION_FIELDS = ['sessionId', 'savedAt', 'timestamp', 'sessionDuration', 'totalScrollDistance',
+                   'totalClicks', 'scrollEvents', 'url', 'timeInShorts', 'timeWatchingVideo',
+                   'actualWatchTime']
+_MS_PER_MINUTE = 60_000
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class _Stream:
+    """A JSON text read block by block, consumed from the front."""
+
+    def __init__(self, f, block_chars=BLOCK_CHARS):
+        self.f = f
+        self.block_chars = block_chars
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _read(self, n_chars):
+        if self.pos > len(self.buf) // 2:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        block = self.f.read(n_chars)
+        self.eof = not block
+        self.buf += block
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character ('' at the end of the text)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._read(self.block_chars):
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the storage dump, found {char or 'the end'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading more of the file until it is complete."""
+        self.peek()
+        want = self.block_chars
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._read(want):
+                    raise
+                want *= 2    # an element bigger than a block: grow the reads, not the retries
+                continue
+            # A number can end at the buffer's edge and still have more digits to come
+            if end == len(self.buf) and not self.eof and self._read(want):
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Elements of the array starting here, one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_storage_items(path, keys=(SESSIONS_KEY, OUTCOMES_KEY), block_chars=BLOCK_CHARS):
+    """(key, element) for every element of the `keys` arrays in a storage dump, in file order.
+
+    The dump is the JSON object browser.storage.local.get() returns; other
+    keys are skipped. A dump that is a bare array is taken as scrollSessions.
+    """
+    with _open(path) as f:
+        stream = _Stream(f, block_chars)
+        if stream.peek() == '[':
+            if SESSIONS_KEY in keys:
+                for item in stream.items():
+                    yield SESSIONS_KEY, item
+            return
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key in keys and stream.peek() == '[':
+                for item in stream.items():
+                    yield key, item
+            else:
+                stream.value()
+            if stream.expect(',}') == '}':
+                return
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _session_row(record):
+    events = record.get('scrollEvents')
+    n_events = len(events) if isinstance(events, list) else _number(events)
+    return (record.get('sessionId'), _number(record.get('savedAt')), _number(record.get('timestamp')),
+            _number(record.get('sessionDuration')), _number(record.get('totalScrollDistance')),
+            _number(record.get('totalClicks')), n_events, record.get('url') or '',
+            _number(record.get('timeInShorts')), _number(record.get('timeWatchingVideo')),
+            _number(record.get('actualWatchTime')))
+
+
+def _outcome_row(record):
+    return (record.get('sessionId'), _number(record.get('timestamp')), record.get('nudgeType'),
+            record.get('chosenSuggestion'), record.get('contextAtNudge'),
+            _number(record.get('scrollDistAtNudge')), _number(record.get('durationAtNudge')),
+            record.get('finalOutcome') or record.get('outcome'),
+            max(_number(record.get('savedAt')), _number(record.get('returnedAt'))))
+
+
+def _session_batch(rows):
+    columns = dict(zip(_SESSION_FIELDS, zip(*rows)))
+    batch = pd.DataFrame({name: np.asarray(values, dtype=np.float64)
+                          for name, values in columns.items() if name not in ('sessionId', 'url')})
+    batch['sessionId'] = pd.Categorical(columns['sessionId'])
+    batch['url'] = pd.Categorical(columns['url'])
+    return batch
+
+
+def _outcome_batch(rows):
+    batch = pd.DataFrame(rows, columns=OUTCOME_COLUMNS + ['updatedAt'])
+    for name in ('sessionId', 'nudgeType', 'chosenSuggestion', 'contextAtNudge', 'finalOutcome'):
+        batch[name] = batch[name].astype('category')
+    return batch
+
+
+def _concat(batches, columns):
+    """One frame from typed batches; categoricals are unioned rather than falling back to object."""
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    out = {}
+    for column in batches[0]:
+        parts = [batch[column] for batch in batches]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            out[column] = union_categoricals(parts)
+        else:
+            out[column] = np.concatenate([part.to_numpy() for part in parts])
+    return pd.DataFrame(out)
+
+
+def read_dumps(paths, batch_rows=BATCH_ROWS):
+    """Deduplicated session records and nudge outcomes from storage dumps, in the given order.
+
+    Returns (sessions, outcomes, n_records): one row per sessionId (its most
+    recently saved record), one row per nudge (its last update), and how
+    many session records were read in total.
+    """
+    batches = {SESSIONS_KEY: [], OUTCOMES_KEY: []}
+    pending = {SESSIONS_KEY: [], OUTCOMES_KEY: []}
+    build = {SESSIONS_KEY: (_session_row, _session_batch), OUTCOMES_KEY: (_outcome_row, _outcome_batch)}
+    n_records = 0
+    for path in paths:
+        for key, record in iter_storage_items(path):
+            if not isinstance(record, dict) or not record.get('sessionId'):
+                continue
+            to_row, to_batch = build[key]
+            rows = pending[key]
+            rows.append(to_row(record))
+            n_records += key == SESSIONS_KEY
+            if len(rows) >= batch_rows:
+                batches[key].append(to_batch(rows))
+                rows.clear()
+    for key, rows in pending.items():
+        if rows:
+            batches[key].append(build[key][1](rows))
+
+    sessions = _concat(batches[SESSIONS_KEY], _SESSION_FIELDS)
+    # Stable sort: among equal savedAt values the record read last stays last
+    sessions = sessions.iloc[np.argsort(sessions['savedAt'].to_numpy(), kind='stable')]
+    sessions = sessions.drop_duplicates('sessionId', keep='last')
+
+    outcomes = _concat(batches[OUTCOMES_KEY], OUTCOME_COLUMNS + ['updatedAt'])
+    outcomes = outcomes.iloc[np.argsort(outcomes['updatedAt'].to_numpy(), kind='stable')]
+    outcomes = outcomes.drop_duplicates(['sessionId', 'timestamp'], keep='last')
+    return sessions, outcomes.sort_values('timestamp', kind='stable')[OUTCOME_COLUMNS], n_records
+
+
+def _iso_ms(epoch_ms):
+    """Date.prototype.toISOString for epoch milliseconds, vectorized."""
+    stamps = np.asarray(epoch_ms, dtype=np.float64).astype('datetime64[ms]')
+    return np.char.add(np.datetime_as_string(stamps, unit='ms'), 'Z')
+
+
+def training_rows(sessions, outcomes=None):
+    """The exportToCSV columns plus watch times and nudge counts, one row per session in start order.
+
+    Values follow exportToCSV: Date is timestamp (or savedAt when it is 0),
+    Duration is rounded to whole minutes and Scroll Events Count is the
+    length of scrollEvents. The watch times are in (unrounded) minutes.
+    """
+    started = np.where(sessions['timestamp'].to_numpy() > 0, sessions['timestamp'], sessions['savedAt'])
+    order = np.argsort(started, kind='stable')
+    sessions, started = sessions.iloc[order], started[order]
+    rows = pd.DataFrame({
+        SESSION_ID: sessions['sessionId'].astype(str).to_numpy(),
+        DATE: _iso_ms(started),
+        # toFixed(0) rounds halves up
+        DURATION: np.floor(sessions['sessionDuration'].to_numpy() / _MS_PER_MINUTE + 0.5).astype(np.int64),
+        SCROLL_DISTANCE: sessions['totalScrollDistance'].to_numpy(),
+        CLICKS: sessions['totalClicks'].to_numpy().astype(np.int64),
+        SCROLL_EVENTS: sessions['scrollEvents'].to_numpy().astype(np.int64),
+        URL: sessions['url'].astype(str).to_numpy(),
+        SHORTS_TIME: sessions['timeInShorts'].to_numpy() / _MS_PER_MINUTE,
+        VIDEO_TIME: sessions['timeWatchingVideo'].to_numpy() / _MS_PER_MINUTE,
+        WATCH_TIME: sessions['actualWatchTime'].to_numpy() / _MS_PER_MINUTE,
+    })
+    nudges = np.zeros(len(rows), dtype=np.int32)
+    if outcomes is not None and len(outcomes):
+        shown = outcomes['sessionId'].astype(str).value_counts()
+        nudges = shown.reindex(rows[SESSION_ID]).fillna(0).to_numpy(dtype=np.int32)
+    rows[NUDGES_SHOWN] = nudges
+    return rows
+
+
+def add_labels(rows, labels_csv):
+    """Join doomscroll_label from a labelled export by Session ID; unlabelled sessions are dropped."""
+    labels = pd.read_csv(labels_csv, usecols=[SESSION_ID, LABEL], dtype={SESSION_ID: str})
+    labels = labels.dropna().drop_duplicates(SESSION_ID, keep='last').set_index(SESSION_ID)[LABEL]
+    label = rows[SESSION_ID].map(labels)
+    rows = rows[label.notna().to_numpy()].copy()
+    rows[LABEL] = label.dropna().astype(np.int8).to_numpy()
+    return rows
+
+
+def write_csv(df, path, batch_rows=BATCH_ROWS):
+    """Write df to path batch_rows rows at a time, replacing the file only once it is complete."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        for start in range(0, max(len(df), 1), batch_rows):
+            df.iloc[start:start + batch_rows].to_csv(f, header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def sessionize(paths, out, labels_csv=None, outcomes_out=None, batch_rows=BATCH_ROWS):
+    """Rebuild a training export from storage dumps; returns a dict of row counts."""
+    sessions, outcomes, n_records = read_dumps(paths, batch_rows)
+    rows = training_rows(sessions, outcomes)
+    n_sessions = len(rows)
+    if labels_csv:
+        rows = add_labels(rows, labels_csv)
+    write_csv(rows, out, batch_rows)
+    if outcomes_out:
+        write_csv(outcomes, outcomes_out, batch_rows)
+    return {'records': n_records, 'sessions': n_sessions, 'written': len(rows), 'nudges': len(outcomes)}
+
+
+def write_benchmark_dump(path, n_sessions, saves=3, seed=0):
+    """A storage dump of n_sessions synthetic sessions, each saved `saves` times as it grew.
+
+    Records are written in save order, so every session's earlier, partial
+    records come before its final one, as in overlapping dumps concatenated.
+    Returns the final records' export columns for checking.
+    """
+    from synthetic import generate_sessions, load_session_model
+
+    rng = np.random.default_rng(seed)
+    final = generate_sessions(n_sessions, load_session_model(), seed=seed)
+    start = 1.76e12 + np.sort(rng.uniform(0, 90 * 86400e3, n_sessions)).round()
+    duration_ms = final[DURATION].to_numpy() * _MS_PER_MINUTE
+    n_events = final[SCROLL_EVENTS].to_numpy().astype(int)
+    shorts_ms = (rng.uniform(0, 1, n_sessions) * duration_ms).round()
+    watch_ms = ((duration_ms - shorts_ms) * rng.uniform(0, 1, n_sessions)).round()
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"mlInterval": 5, "scrollSessions": [')
+        first = True
+        # Interleave sessions the way auto-saves from consecutive sessions arrive
+        for lo in range(0, n_sessions, 1000):
+            hi = min(lo + 1000, n_sessions)
+            for save in range(1, saves + 1):
+                share = save / saves
+                for i in range(lo, hi):
+                    events = [{'timestamp': int(start[i]) + k * 1000, 'scrollY': k * 40, 'scrollDistance': 40}
+                              for k in range(int(n_events[i] * share))]
+                    record = {
+                        'sessionId': final[SESSION_ID].iat[i], 'startTime': int(start[i]),
+                        'scrollEvents': events, 'videoClicks': 0, 'shortsClicks': 0,
+                        'totalClicks': float(final[CLICKS].iat[i]) * share,
+                        'totalScrollDistance': float(final[SCROLL_DISTANCE].iat[i]) * share,
+                        'timeInShorts': float(shorts_ms[i]), 'timeWatchingVideo': float(watch_ms[i]),
+                        'actualWatchTime': float(watch_ms[i]) * 0.9,
+                        'sessionDuration': float(duration_ms[i]) * share,
+                        'url': final[URL].iat[i], 'timestamp': int(start[i]),
+                        'savedAt': int(start[i] + duration_ms[i] * share),
+                    }
+                    f.write(('' if first else ',') + json.dumps(record))
+                    first = False
+        f.write('], "nudgeOutcomes": [')
+        nudged = np.flatnonzero(final[LABEL].to_numpy() == 1)[:n_sessions // 4]
+        for k, i in enumerate(nudged):
+            outcome = {'sessionId': final[SESSION_ID].iat[i], 'nudgeType': 'shorts_feed',
+                       'chosenSuggestion': 'Take a 5-minute break', 'contextAtNudge': 'shorts_feed',
+                       'scrollDistAtNudge': 1000, 'durationAtNudge': 60000,
+                       'timestamp': int(start[i]) + 60000, 'outcome': 'closed', 'finalOutcome': 'closed',
+                       'savedAt': int(start[i]) + 60000}
+            f.write(('' if k == 0 else ',') + json.dumps(outcome))
+        f.write('], "personalThresholds": {"highScrolling": 10000, "fastScrolling": 2000}}')
+    return final
+
+
+def benchmark(n_sessions, saves=3):
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix='sessionize_') as folder:
+        _benchmark(folder, n_sessions, saves)
+
+
+def _benchmark(folder, n_sessions, saves):
+    from instrument import _max_rss
+
+    dump = os.path.join(folder, 'storage_dump.json')
+    final = write_benchmark_dump(dump, n_sessions, saves)
+    size = os.path.getsize(dump)
+    print(f"{n_sessions:,} sessions x {saves} saves: {size / 2**20:,.0f} MB dump")
+
+    out = os.path.join(folder, 'history.csv')
+    rss = _max_rss()
+    start = time.perf_counter()
+    counts = sessionize([dump], out)
+    elapsed = time.perf_counter() - start
+    grew = f", peak RSS grew {(_max_rss() - rss) / 2**20:,.0f} MB" if rss is not None else ""
+    print(f"sessionize: {elapsed:.2f}s ({size / 2**20 / elapsed:,.0f} MB/s){grew}; "
+          f"{counts['records']:,} records -> {counts['sessions']:,} sessions, {counts['nudges']:,} nudges")
+
+    rows = pd.read_csv(out).set_index(SESSION_ID)
+    expected = final.set_index(SESSION_ID)
+    columns = [DURATION, SCROLL_DISTANCE, CLICKS, SCROLL_EVENTS]
+    mismatched = (~np.isclose(rows.loc[expected.index, columns], expected[columns])).any(axis=1).sum()
+    print(f"{mismatched} of {len(expected):,} sessions differ from their final record")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild training rows from raw extension storage dumps")
+    parser.add_argument('dumps', nargs='*', help="JSON dumps of browser.storage.local (.json or .json.gz), oldest first")
+    parser.add_argument('--out', help="CSV to write the training rows to")
+    parser.add_argument('--labels', help="labelled export to take doomscroll_label from (by Session ID)")
+    parser.add_argument('--outcomes', help="also write the deduplicated nudge outcomes to this CSV")
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    parser.add_argument('--benchmark', type=int, metavar='SESSIONS',
+                        help="time a synthetic dump with this many sessions instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+    if not args.dumps or not args.out:
+        parser.error("give one or more dumps and --out (or --benchmark)")
+
+    start = time.perf_counter()
+    counts = sessionize(args.dumps, args.out, args.labels, args.outcomes, args.batch_rows)
+    print(f"{counts['records']:,} session records -> {counts['sessions']:,} sessions, "
+          f"{counts['written']:,} written to {args.out} ({counts['nudges']:,} nudges) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
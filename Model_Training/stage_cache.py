@@ -0,0 +1,176 @@
+"""On-disk cache for the expensive stages of the training scripts.
+
+cached(stage, compute, inputs, code) runs compute() only when no earlier run
+had the same key, and otherwise loads the stored result. The key is a hash of:
+
+- inputs: arrays, DataFrames/Series, estimators (class and parameters),
+  fold lists and plain values, hashed by content;
+- code: the modules and functions the stage depends on, by source, plus
+  compute's own source;
+- the installed numpy/pandas/sklearn/scipy/pgmpy versions.
+
+Results are pickled under .cache/stages/<stage>/<key>.pkl. A hit refreshes
+the file's mtime. After each write, the least recently used files are
+deleted until the cache fits in max_bytes. Editing a plot or a summary
+print in a script does not change any stage key, so reruns reuse the CV
+and LOOCV results. Changing the data, the features or a model parameter
+recomputes only the stages that see it.
+
+cli.py sets the mode with configure(); running a script directly uses the
+cache with the defaults below.
+"""
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_VERSION = 1
+LIBRARIES = ('numpy', 'pandas', 'sklearn', 'scipy', 'pgmpy')
+
+_config = {'enabled': True, 'root': os.path.join(HERE, ".cache", "stages"), 'max_bytes': 1 << 30}
+_log = []
+
+
+def configure(enabled=True, root=None, max_bytes=None):
+    _config['enabled'] = enabled
+    if root is not None:
+        _config['root'] = root
+    if max_bytes is not None:
+        _config['max_bytes'] = max_bytes
+    _log.clear()
+
+
+def _feed(h, obj):
+    """Update hash h with a type-tagged, content-based encoding of obj."""
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'df')
+        _feed(h, [str(c) for c in obj.columns])
+        _feed(h, [str(t) for t in obj.dtypes])
+        _feed(h, pd.util.hash_pandas_object(obj, index=True).to_numpy())
+    elif isinstance(obj, pd.Series):
+        h.update(b'series')
+        _feed(h, [str(obj.name), str(obj.dtype)])
+        _feed(h, pd.util.hash_pandas_object(obj, index=True).to_numpy())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _feed(h, pd.Series(obj.ravel()))
+            _feed(h, obj.shape)
+        else:
+            h.update(f"nd{obj.dtype.str}{obj.shape}".encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif hasattr(obj, 'get_params'):
+        # Estimators: fitted or not, only the class and parameters matter
+        h.update(f"est{type(obj).__module__}.{type(obj).__qualname__}".encode())
+        _feed(h, obj.get_params(deep=False))
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            _feed(h, key)
+            _feed(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _feed(h, item)
+    elif isinstance(obj, types.ModuleType):
+        with open(obj.__file__, 'rb') as f:
+            h.update(b'module' + f.read())
+    elif callable(obj):
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            source = getattr(getattr(obj, '__code__', None), 'co_code', repr(obj))
+        h.update(b'code' + (source.encode() if isinstance(source, str) else source))
+    elif obj is None or isinstance(obj, (str, int, float, bool, np.generic)):
+        h.update(f"{type(obj).__name__}:{obj!r}".encode())
+    else:
+        raise TypeError(f"Cannot hash stage input of type {type(obj).__name__}")
+
+
+def stage_key(stage, inputs, code=()):
+    h = hashlib.sha256(f"stage-cache-v{CACHE_VERSION}:{stage}".encode())
+    _feed(h, [sys.modules[lib].__version__ for lib in LIBRARIES if lib in sys.modules])
+    _feed(h, list(code))
+    _feed(h, inputs)
+    return h.hexdigest()[:32]
+
+
+def _entries():
+    """(path, size, mtime) of every stored result."""
+    entries = []
+    for folder, _, files in os.walk(_config['root']):
+        for name in files:
+            if name.endswith('.pkl'):
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime_ns))
+    return entries
+
+
+def evict(max_bytes=None):
+    """Delete least recently used results until the cache fits in max_bytes; returns bytes freed."""
+    max_bytes = _config['max_bytes'] if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=lambda e: e[2])
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        freed += size
+    return freed
+
+
+def clear():
+    shutil.rmtree(_config['root'], ignore_errors=True)
+
+
+def cached(stage, compute, inputs, code=()):
+    """compute(), or its stored result from an earlier run with the same inputs and code."""
+    if not _config['enabled']:
+        return compute()
+
+    key = stage_key(stage, inputs, [compute, *code])
+    path = os.path.join(_config['root'], stage, key + ".pkl")
+    if os.path.isfile(path):
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass  # unreadable entry, recompute and overwrite it
+        else:
+            os.utime(path)
+            _log.append((stage, 'hit'))
+            instrument.count('cache_hits')
+            return result
+
+    result = compute()
+    payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(payload) <= _config['max_bytes']:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        evict()
+    _log.append((stage, 'miss'))
+    instrument.count('cache_misses')
+    return result
+
+
+def summary():
+    """One line listing which stages were loaded and which were computed."""
+    if not _config['enabled']:
+        return "stage cache off"
+    hits = [stage for stage, outcome in _log if outcome == 'hit']
+    misses = [stage for stage, outcome in _log if outcome == 'miss']
+    return f"stage cache: reused {', '.join(hits) or 'nothing'}; computed {', '.join(misses) or 'nothing'}"
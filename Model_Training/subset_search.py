@@ -0,0 +1,262 @@
+"""Cross-validated search over subsets of the engineered features.
+
+model.py ranks features once with RF importance and final_model.py hard-codes
+the top three. This scores subsets directly by 5-fold CV AUC instead:
+
+- exhaustive: all 2^9 - 1 = 511 non-empty subsets of FEATURE_COLUMNS
+- forward / backward: greedy selection, adding or removing the feature that
+  helps most each round, for as long as the AUC improves
+
+LR folds are warm-started from the previous fold's weights (--cold-start
+turns this off); the AUCs then differ from cold fits only in about the sixth
+decimal.
+
+The folds (same KFold as the training scripts) and each fold's training-set
+mean/std for every feature are computed once, so a candidate only slices
+columns out of the cached statistics; scaling is per fold, so held-out rows
+never leak into it. Candidates are scored on a fork pool with the data
+inherited rather than copied, and every score is memoized by subset.
+
+Early stopping: once a subset has been scored on min_folds folds, it is
+dropped if its running mean AUC is more than prune_margin below the best
+complete score seen so far. Pruned rows stay on the leaderboard with their
+partial score. Which subsets get pruned depends on the order workers finish
+in, but every fully scored subset's AUC is exact.
+
+    python Model_Training/subset_search.py --mode exhaustive --out leaderboard.csv
+    python Model_Training/subset_search.py --mode forward --model rf
+"""
+import argparse
+import contextlib
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import KFold
+
+from features import FEATURE_COLUMNS, LABEL, add_ratio_features
+from loader import DEFAULT_CSV, RAW_FEATURE_COLUMNS, load_sessions
+
+MODELS = {
+    'lr': lambda: LogisticRegression(max_iter=1000, random_state=42),
+    'rf': lambda: RandomForestClassifier(n_estimators=100, random_state=42),
+}
+
+
+class FoldCache:
+    """KFold test indices and per-fold training mean/std of every feature column."""
+
+    def __init__(self, X, y, n_splits=5, seed=42):
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        self.y = np.asarray(y)
+        splitter = KFold(n_splits=n_splits, shuffle=True, random_state=seed)
+        self.test_idx = [test for _, test in splitter.split(self.X)]
+
+        n_folds = len(self.test_idx)
+        self.mean = np.empty((n_folds, self.X.shape[1]))
+        self.std = np.empty((n_folds, self.X.shape[1]))
+        eps = np.finfo(np.float64).eps
+        train = np.empty(len(self.X), dtype=bool)
+        for fold, test in enumerate(self.test_idx):
+            train[:] = True
+            train[test] = False
+            X_train = self.X[train]
+            mean = self.mean[fold] = X_train.mean(axis=0)
+            # Centred second pass: E[x²] − mean² cancels into noise on a column
+            # that is constant in the training rows
+            var = ((X_train - mean) ** 2).mean(axis=0)
+            # Constant columns get scale 1, with StandardScaler's tolerance
+            constant = var <= len(X_train) * eps * var + (len(X_train) * mean * eps) ** 2
+            self.std[fold] = np.where(constant, 1.0, np.sqrt(var))
+
+    @property
+    def n_folds(self):
+        return len(self.test_idx)
+
+    def split(self, fold, cols):
+        """Scaled (X_train, y_train, X_test, y_test) of one fold, restricted to cols."""
+        test = self.test_idx[fold]
+        train = np.ones(len(self.y), dtype=bool)
+        train[test] = False
+        mean, std = self.mean[fold, cols], self.std[fold, cols]
+        X_cols = self.X[:, cols]
+        return (X_cols[train] - mean) / std, self.y[train], (X_cols[test] - mean) / std, self.y[test]
+
+
+# Set before forking the workers, inherited without copying
+_search = {}
+
+
+def _score_subset(cols):
+    cache, best = _search['cache'], _search['best']
+    model = MODELS[_search['model']]()
+    if _search['warm_start'] and isinstance(model, LogisticRegression):
+        # The folds share most of their training rows, so each fit starts
+        # from the previous fold's weights and converges in a few iterations
+        model.set_params(warm_start=True)
+    aucs = []
+    for fold in range(cache.n_folds):
+        X_train, y_train, X_test, y_test = cache.split(fold, list(cols))
+        proba = model.fit(X_train, y_train).predict_proba(X_test)[:, 1]
+        aucs.append(roc_auc_score(y_test, proba) if len(np.unique(y_test)) > 1 else np.nan)
+        if (len(aucs) >= _search['min_folds'] and len(aucs) < cache.n_folds
+                and np.nanmean(aucs) < best.value - _search['prune_margin']):
+            return cols, aucs, True
+
+    mean_auc = np.nanmean(aucs)
+    with best.get_lock():
+        best.value = max(best.value, mean_auc)
+    return cols, aucs, False
+
+
+class _Best:
+    """Stand-in for multiprocessing.Value when everything runs in-process."""
+
+    def __init__(self):
+        self.value = -np.inf
+
+    def get_lock(self):
+        return contextlib.nullcontext()
+
+
+class SubsetSearch:
+    def __init__(self, X, y, feature_names, model='lr', n_splits=5, min_folds=2, prune_margin=0.05,
+                 warm_start=True, n_jobs=None):
+        if model not in MODELS:
+            raise ValueError(f"Unknown model: {model}")
+        self.cache = FoldCache(X, y, n_splits)
+        self.feature_names = list(feature_names)
+        self.model = model
+        self.min_folds = min_folds
+        self.prune_margin = prune_margin
+        self.warm_start = warm_start
+        self.n_jobs = n_jobs
+        self.scores = {}          # tuple of column indices -> (fold AUCs, pruned)
+        self.best = multiprocessing.get_context('fork').Value('d', -np.inf) \
+            if 'fork' in multiprocessing.get_all_start_methods() else _Best()
+
+    def score(self, subsets):
+        """Score the subsets not scored yet; returns {subset: mean AUC} for all of them."""
+        todo = [s for s in dict.fromkeys(tuple(sorted(s)) for s in subsets) if s not in self.scores]
+        if todo:
+            _search.update(cache=self.cache, model=self.model, best=self.best,
+                           min_folds=self.min_folds, prune_margin=self.prune_margin,
+                           warm_start=self.warm_start)
+            n_jobs = min(self.n_jobs or os.cpu_count() or 1, len(todo))
+            try:
+                if n_jobs <= 1 or isinstance(self.best, _Best):
+                    results = [_score_subset(s) for s in todo]
+                else:
+                    with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+                        results = list(pool.map(_score_subset, todo, chunksize=max(1, len(todo) // (n_jobs * 4))))
+            finally:
+                _search.clear()
+            for cols, aucs, pruned in results:
+                self.scores[cols] = (aucs, pruned)
+        return {tuple(sorted(s)): np.nanmean(self.scores[tuple(sorted(s))][0]) for s in subsets}
+
+    def exhaustive(self):
+        n = len(self.feature_names)
+        # Small subsets first: they are cheapest and set the bar for pruning early
+        subsets = [c for k in range(1, n + 1) for c in itertools.combinations(range(n), k)]
+        self.score(subsets)
+
+    def _greedy(self, start, step, keep_ties):
+        current = tuple(start)
+        current_auc = self.score([current])[current] if current else -np.inf
+        path = [(current, current_auc)] if current else []
+        while True:
+            candidates = step(current)
+            if not candidates:
+                break
+            scores = self.score(candidates)
+            complete = {s: a for s, a in scores.items() if not self.scores[s][1]}
+            if not complete:
+                break
+            best = max(complete, key=complete.get)
+            if complete[best] < current_auc or (complete[best] == current_auc and not keep_ties):
+                break
+            current, current_auc = best, complete[best]
+            path.append((current, current_auc))
+        return path
+
+    def forward(self):
+        n = len(self.feature_names)
+        return self._greedy((), lambda cur: [tuple(sorted(cur + (f,))) for f in range(n) if f not in cur],
+                            keep_ties=False)
+
+    def backward(self):
+        n = len(self.feature_names)
+        # Dropping a feature that costs no AUC still counts as a step
+        return self._greedy(tuple(range(n)), lambda cur: [tuple(f for f in cur if f != drop) for drop in cur]
+                            if len(cur) > 1 else [], keep_ties=True)
+
+    def leaderboard(self):
+        rows = []
+        for cols, (aucs, pruned) in self.scores.items():
+            rows.append({
+                'n_features': len(cols),
+                'features': ' + '.join(self.feature_names[c] for c in cols),
+                'auc_mean': np.nanmean(aucs),
+                'auc_std': np.nanstd(aucs),
+                'folds_scored': len(aucs),
+                'pruned': pruned,
+            })
+        board = pd.DataFrame(rows).sort_values(['pruned', 'auc_mean', 'n_features'],
+                                               ascending=[True, False, True], ignore_index=True)
+        board.insert(0, 'rank', np.arange(1, len(board) + 1))
+        return board
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validated feature-subset search")
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--mode', choices=['exhaustive', 'forward', 'backward'], default='exhaustive')
+    parser.add_argument('--model', choices=list(MODELS), default='lr')
+    parser.add_argument('--min-folds', type=int, default=2, help="folds scored before a subset can be pruned")
+    parser.add_argument('--prune-margin', type=float, default=0.05,
+                        help="prune when the running AUC is this far below the best (inf disables)")
+    parser.add_argument('--cold-start', action='store_true',
+                        help="fit every LR fold from scratch instead of from the previous fold's weights")
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--out', help="write the full leaderboard to this CSV")
+    args = parser.parse_args()
+
+    df = add_ratio_features(load_sessions(args.csv, columns=RAW_FEATURE_COLUMNS, float_dtype=np.float64),
+                            dtype=np.float64)
+    search = SubsetSearch(df[FEATURE_COLUMNS].to_numpy(), df[LABEL].to_numpy(), FEATURE_COLUMNS,
+                          model=args.model, min_folds=args.min_folds, prune_margin=args.prune_margin,
+                          warm_start=not args.cold_start, n_jobs=args.jobs)
+
+    start = time.perf_counter()
+    if args.mode == 'exhaustive':
+        search.exhaustive()
+    else:
+        path = getattr(search, args.mode)()
+        print(f"{args.mode} selection path:")
+        for cols, auc_score in path:
+            names = ', '.join(FEATURE_COLUMNS[c] for c in cols)
+            print(f"  AUC {auc_score:.4f}  {names}")
+    elapsed = time.perf_counter() - start
+
+    board = search.leaderboard()
+    pruned = int(board['pruned'].sum())
+    print(f"\nScored {len(board)} subsets in {elapsed:.1f}s ({pruned} stopped early), "
+          f"{args.model.upper()} {search.cache.n_folds}-fold CV AUC, {len(df):,} sessions")
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 120):
+        print(board.head(args.top).to_string(index=False))
+    if args.out:
+        board.to_csv(args.out, index=False)
+        print("Leaderboard written to", args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Synthetic session exports shaped like session_data.csv, at any size.
+
+fit_session_model learns, separately for each label, the mean and covariance
+of log1p(Duration, Scroll Distance, Clicks, Scroll Events) from the real
+export, plus which URL kinds (watch, shorts, youtu.be, home, ...) occur.
+generate_sessions draws correlated log-normal counts from that model, so the
+per-label joint distribution of the counts and every ratio feature built on
+them follow the real data, without repeating its 50 rows. Everything is
+drawn in bulk with NumPy.
+
+With --users, sessions also get a User ID. Users differ the way real ones
+do: each has its own share of doomscrolling sessions, a log-count offset
+(some people simply scroll more) and an activity level, so sessions of the
+same user are correlated and grouped CV is needed (see per_user.py).
+
+    python Model_Training/synthetic.py 1000000 /tmp/sessions_1m.csv [--users 50000]
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from features import CLICKS, DURATION, LABEL, SCROLL_DISTANCE, SCROLL_EVENTS
+from loader import CHUNK_ROWS, DATE, DEFAULT_CSV, SESSION_ID, URL, USER_ID
+
+COUNT_ORDER = [DURATION, SCROLL_DISTANCE, CLICKS, SCROLL_EVENTS]
+CSV_COLUMNS = [SESSION_ID, DATE] + COUNT_ORDER + [URL, LABEL]
+
+# Video IDs are 11 characters from this alphabet
+ID_ALPHABET = np.frombuffer(
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_", dtype=np.uint8)
+SUFFIX_ALPHABET = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8)
+VIDEO_ID = re.compile(r'(?<=v=)[\w-]{11}|(?<=/shorts/)[\w-]{11}|(?<=youtu\.be/)[\w-]{11}')
+
+# Seed stream of the user effects, apart from the per-chunk streams (seed, chunk_index)
+USER_STREAM = 2**32 - 1
+
+
+def _url_template(url):
+    """(prefix, suffix, has_id): the URL with its video ID cut out, if it has one."""
+    match = VIDEO_ID.search(url)
+    if match is None:
+        return url, '', False
+    return url[:match.start()], url[match.end():], True
+
+
+def fit_session_model(df):
+    """Per-label log-count mean/covariance and URL templates of a session export."""
+    model = {'labels': [], 'dates': (df[DATE].min(), df[DATE].max())}
+    for label, group in df.groupby(LABEL):
+        logs = np.log1p(group[COUNT_ORDER].to_numpy(dtype=np.float64))
+        model['labels'].append({
+            'label': int(label),
+            'weight': len(group) / len(df),
+            'mean': logs.mean(axis=0),
+            'cov': np.cov(logs, rowvar=False),
+            'urls': [_url_template(u) for u in group[URL].astype(str)],
+        })
+    return model
+
+
+def _random_strings(rng, n, length, alphabet):
+    chars = alphabet[rng.integers(0, len(alphabet), (n, length))]
+    return chars.view(f'S{length}').ravel().astype(str)
+
+
+def _urls(rng, templates, n):
+    pick = rng.integers(0, len(templates), n)
+    prefix, suffix, has_id = (np.array(col, dtype=object) for col in zip(*templates))
+    ids = np.where(has_id[pick], _random_strings(rng, n, 11, ID_ALPHABET).astype(object), '')
+    return prefix[pick] + ids + suffix[pick]
+
+
+def user_effects(model, n_users, seed=0, spread=0.5, concentration=4.0):
+    """Per-user doomscrolling share, log-count offset and activity weight for n_users users.
+
+    Shares are Beta distributed around the export's doomscrolling share;
+    offsets are normal with `spread` times the typical log-count std.
+    """
+    rng = np.random.default_rng(seed)
+    doom = sum(c['weight'] for c in model['labels'] if c['label'] == 1)
+    doom = min(max(doom, 0.01), 0.99)
+    scale = np.sqrt(np.mean([np.diag(c['cov']) for c in model['labels']], axis=0))
+    activity = rng.lognormal(0, 1, n_users)
+    return {
+        'doom_share': rng.beta(doom * concentration, (1 - doom) * concentration, n_users),
+        'offset': rng.normal(0, spread, (n_users, len(COUNT_ORDER))) * scale,
+        'activity': activity / activity.sum(),
+    }
+
+
+def generate_sessions(n_rows, model, seed=0, users=None):
+    """DataFrame of n_rows synthetic sessions with the CSV's columns and dtypes.
+
+    With users (from user_effects) each session belongs to a user, whose
+    effects set its label odds and shift its counts, and a User ID column
+    follows Session ID.
+    """
+    rng = np.random.default_rng(seed)
+    if users is None:
+        weights = np.array([c['weight'] for c in model['labels']])
+        which = rng.choice(len(weights), n_rows, p=weights / weights.sum())
+    else:
+        user = rng.choice(len(users['activity']), n_rows, p=users['activity'])
+        doom = rng.random(n_rows) < users['doom_share'][user]
+        component = {c['label']: k for k, c in enumerate(model['labels'])}
+        which = np.where(doom, component.get(1, 0), component.get(0, 0))
+
+    counts = np.empty((n_rows, len(COUNT_ORDER)))
+    urls = np.empty(n_rows, dtype=object)
+    labels = np.empty(n_rows, dtype=np.int8)
+    for k, component in enumerate(model['labels']):
+        rows = np.flatnonzero(which == k)
+        logs = rng.multivariate_normal(component['mean'], component['cov'], len(rows), method='eigh')
+        if users is not None:
+            logs += users['offset'][user[rows]]
+        counts[rows] = np.expm1(logs).clip(0)
+        urls[rows] = _urls(rng, component['urls'], len(rows))
+        labels[rows] = component['label']
+
+    df = pd.DataFrame(counts, columns=COUNT_ORDER)
+    # Durations are whole minutes of at least 1; clicks and scroll events are counts
+    df[DURATION] = df[DURATION].round().clip(lower=1).astype(np.int64)
+    df[CLICKS] = df[CLICKS].round().astype(np.int64)
+    df[SCROLL_EVENTS] = df[SCROLL_EVENTS].round().astype(np.int64)
+    df[SCROLL_DISTANCE] = df[SCROLL_DISTANCE].round(6)
+
+    start, end = (pd.Timestamp(d).value // 1_000_000 for d in model['dates'])
+    millis = np.sort(rng.integers(start, end + 1, n_rows))
+    df.insert(0, DATE, pd.to_datetime(millis, unit='ms', utc=True))
+    df.insert(0, SESSION_ID, 'session_' + pd.Series(millis.astype(str)) + '_'
+              + _random_strings(rng, n_rows, 9, SUFFIX_ALPHABET))
+    df[URL] = urls
+    df[LABEL] = labels
+    if users is None:
+        return df[CSV_COLUMNS]
+    width = len(str(len(users['activity']) - 1))
+    df[USER_ID] = np.char.add('user_', np.char.zfill(user.astype(str), width))
+    return df[CSV_COLUMNS[:1] + [USER_ID] + CSV_COLUMNS[1:]]
+
+
+def load_session_model(path=DEFAULT_CSV):
+    return fit_session_model(pd.read_csv(path, parse_dates=[DATE]))
+
+
+def write_sessions_csv(path, n_rows, model=None, seed=0, chunk_rows=CHUNK_ROWS, n_users=None):
+    """Write n_rows synthetic sessions to a CSV in the export's format, one chunk at a time.
+
+    n_users adds a User ID column; users keep their effects across chunks.
+    """
+    model = model or load_session_model()
+    users = user_effects(model, n_users, seed=(seed, USER_STREAM)) if n_users else None
+    written = 0
+    for chunk_index, start in enumerate(range(0, n_rows, chunk_rows)):
+        chunk = generate_sessions(min(chunk_rows, n_rows - start), model, seed=(seed, chunk_index), users=users)
+        # Same ISO format as the extension's export, e.g. 2025-11-23T00:08:50.533Z
+        millis = chunk[DATE].dt.tz_convert(None).to_numpy().astype('datetime64[ms]')
+        chunk[DATE] = np.char.add(np.datetime_as_string(millis, unit='ms'), 'Z')
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic session export")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source', default=DEFAULT_CSV, help="real export to copy the distributions of")
+    parser.add_argument('--users', type=int, default=None, help="spread the sessions over this many users")
+    args = parser.parse_args()
+
+    written = write_sessions_csv(args.output, args.rows, load_session_model(args.source), args.seed,
+                                 n_users=args.users)
+    print(f"Wrote {written:,} sessions to {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
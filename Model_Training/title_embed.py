@@ -0,0 +1,298 @@
+"""Offline title embedding and content labels for exported sessions.
+
+In the extension, classifyTitleInBackground (background.js) embeds each video
+title with the Universal Sentence Encoder from a CDN and labels it by cosine
+similarity to ANCHOR_PHRASES. Those labels never reach the CSV export, so
+this module recomputes them offline from storage dumps
+(browser.storage.local scrollSessions, whose videoInteractions carry the
+titles):
+
+1. extract_titles: one row per titled video interaction, with its video ID.
+2. HashingTitleEncoder: a local, network-free stand-in for USE. Character
+   3-5-grams are hashed into a fixed number of dimensions and L2-normalized.
+   It is stateless (no vocabulary or IDF to fit), so a title's vector never
+   changes as more data arrives.
+3. VectorCache: the vectors live in a float32 file that is memory-mapped and
+   only appended to, indexed by a 64-bit hash of the title. Each distinct
+   title is embedded once, across all runs.
+4. label_titles: the similarity to every anchor phrase for all titles in one
+   matrix multiply, then the best anchor. Titles too far from every anchor
+   stay neutral.
+5. session_content_features / add_content_features: per-session label
+   shares, joined onto an export by Session ID.
+
+    python Model_Training/title_embed.py storage_dump.json --csv session_data.csv --out labelled.csv
+    python Model_Training/title_embed.py storage_dump.json --out content.csv
+    python Model_Training/cli.py explore --content content.csv
+
+With --content, model.py joins the shares (CONTENT_FEATURES) onto the
+export and weighs them alongside its nine candidate features.
+
+The anchor phrases are read from background.js, so both sides use the same
+ones. The hashing encoder is not USE, and its labels are an approximation of
+what the extension shows.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from features import CONTENT_FEATURES, LAST_VIDEO_LABEL, PRODUCTIVE_SHARE, TITLED_VIDEOS, UNPRODUCTIVE_SHARE
+from loader import SESSION_ID
+from sessionize import SESSIONS_KEY, iter_storage_items
+from url_parse import VIDEO_ID_PATTERN
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKGROUND_JS_PATH = os.path.join(HERE, "..", "YouTube-Tracker", "background", "background.js")
+CACHE_PATH = os.path.join(HERE, ".cache", "title_vectors")
+CACHE_VERSION = 1
+
+# Set by content.js when the title element is missing, not real titles
+PLACEHOLDER_TITLES = {'', 'Unknown Video', 'YouTube Short'}
+NEUTRAL = 'neutral'
+
+_config = {'content_path': None}
+
+
+def load_anchor_phrases(js_path=BACKGROUND_JS_PATH):
+    """ANCHOR_PHRASES from background.js as {label: phrase}."""
+    with open(js_path, encoding='utf-8') as f:
+        source = f.read()
+    block = re.search(r'const ANCHOR_PHRASES\s*=\s*\{(.*?)\};', source, re.S)
+    if block is None:
+        raise ValueError(f"No ANCHOR_PHRASES in {js_path}")
+    return dict(re.findall(r"(\w+)\s*:\s*'([^']*)'", block.group(1)))
+
+
+def load_storage_dump(path):
+    """Session objects from a JSON dump of browser.storage.local (or a plain list of them), streamed."""
+    return (session for _, session in iter_storage_items(path, keys=(SESSIONS_KEY,)))
+
+
+def extract_titles(sessions):
+    """One row per titled video interaction: Session ID, timestamp, URL, video ID and title."""
+    rows = [
+        (session.get('sessionId'), item.get('timestamp'), item.get('videoUrl') or '', item.get('videoTitle'))
+        for session in sessions
+        for item in session.get('videoInteractions') or ()
+    ]
+    titles = pd.DataFrame(rows, columns=[SESSION_ID, 'timestamp', 'videoUrl', 'title'])
+    titles['title'] = titles['title'].fillna('').astype(str).str.strip()
+    titles = titles[~titles['title'].isin(PLACEHOLDER_TITLES)].reset_index(drop=True)
+    titles['video_id'] = titles['videoUrl'].str.extract(VIDEO_ID_PATTERN, expand=False)
+    return titles
+
+
+def title_keys(titles):
+    """Stable 64-bit hash of each title (the same across runs and machines)."""
+    return pd.util.hash_array(np.asarray(titles, dtype=object))
+
+
+class HashingTitleEncoder:
+    def __init__(self, dim=512, ngram_range=(3, 5)):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=self.ngram_range, n_features=dim,
+                                            alternate_sign=False, norm='l2', lowercase=True)
+
+    @property
+    def config(self):
+        return {'encoder': 'hashing-char-wb', 'dim': self.dim, 'ngram_range': list(self.ngram_range)}
+
+    def encode(self, titles):
+        return self.vectorizer.transform(list(titles)).astype(np.float32).toarray()
+
+
+class VectorCache:
+    """Append-only float32 vectors on disk, one row per distinct title hash."""
+
+    def __init__(self, encoder, folder=CACHE_PATH):
+        self.encoder = encoder
+        self.folder = folder
+        self.vectors_path = os.path.join(folder, "vectors.f32")
+        self.keys_path = os.path.join(folder, "keys.npy")
+        self.meta_path = os.path.join(folder, "meta.json")
+        self.meta = {'version': CACHE_VERSION, **encoder.config}
+
+        self.keys = np.empty(0, dtype=np.uint64)
+        if self._meta_matches():
+            self.keys = np.load(self.keys_path)
+        else:
+            self._reset()
+        expected = len(self.keys) * self.encoder.dim * 4
+        if not os.path.isfile(self.vectors_path) or os.path.getsize(self.vectors_path) < expected:
+            # Vectors missing for saved keys: start over rather than pad them with zeros
+            self.keys = np.empty(0, dtype=np.uint64)
+            self._reset()
+        else:
+            # Vectors written after the last keys.npy save (an interrupted run) are dropped
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(expected)
+        self._sorted = np.argsort(self.keys, kind='stable')
+
+    def _meta_matches(self):
+        if not (os.path.isfile(self.meta_path) and os.path.isfile(self.keys_path)):
+            return False
+        with open(self.meta_path) as f:
+            return json.load(f) == self.meta
+
+    def _reset(self):
+        os.makedirs(self.folder, exist_ok=True)
+        open(self.vectors_path, 'wb').close()
+        np.save(self.keys_path, self.keys)
+        with open(self.meta_path, 'w') as f:
+            json.dump(self.meta, f)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def vectors(self):
+        """Memory-mapped (n_titles, dim) view of every cached vector."""
+        if not len(self.keys):
+            return np.empty((0, self.encoder.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self.keys), self.encoder.dim))
+
+    def _lookup(self, keys):
+        """Row of each key in the cache, -1 where it is not cached."""
+        if not len(self.keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(self.keys, keys, sorter=self._sorted).clip(max=len(self.keys) - 1)
+        rows = self._sorted[pos]
+        return np.where(self.keys[rows] == keys, rows, -1)
+
+    def rows(self, titles, batch_size=10_000):
+        """Cache row of every title, embedding the titles not seen before. Returns (rows, n_new)."""
+        titles = np.asarray(titles, dtype=object)
+        keys = title_keys(titles)
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        unique_rows = self._lookup(unique_keys)
+
+        missing = np.flatnonzero(unique_rows < 0)
+        if len(missing):
+            with open(self.vectors_path, 'ab') as f:
+                for start in range(0, len(missing), batch_size):
+                    batch = missing[start:start + batch_size]
+                    f.write(self.encoder.encode(titles[first[batch]]).tobytes())
+            unique_rows[missing] = len(self.keys) + np.arange(len(missing))
+            self.keys = np.concatenate([self.keys, unique_keys[missing]])
+            tmp_path = self.keys_path + ".tmp.npy"
+            np.save(tmp_path, self.keys)
+            os.replace(tmp_path, self.keys_path)
+            self._sorted = np.argsort(self.keys, kind='stable')
+        return unique_rows[inverse], len(missing)
+
+
+def label_titles(vectors, anchor_vectors, labels, min_similarity=0.05):
+    """Cosine similarity to each anchor (one matrix multiply) and the best anchor's label.
+
+    Vectors and anchors are L2-normalized, so the dot product is the cosine.
+    Titles whose best similarity is below min_similarity, or tied between
+    anchors, are labelled neutral.
+    """
+    similarity = np.asarray(vectors, dtype=np.float32) @ np.asarray(anchor_vectors, dtype=np.float32).T
+    best = similarity.argmax(axis=1)
+    top = np.take_along_axis(similarity, best[:, None], axis=1)[:, 0]
+    ties = (similarity == top[:, None]).sum(axis=1) > 1
+    names = np.asarray(labels, dtype=object)[best]
+    names[(top < min_similarity) | ties] = NEUTRAL
+    return similarity, names
+
+
+def label_sessions(sessions, encoder=None, cache=None, anchors=None, min_similarity=0.05):
+    """Titles of the sessions with their anchor similarities and labels; also returns how many were new."""
+    encoder = encoder if encoder is not None else HashingTitleEncoder()
+    cache = cache if cache is not None else VectorCache(encoder)
+    anchors = anchors if anchors is not None else load_anchor_phrases()
+
+    titles = extract_titles(sessions)
+    rows, n_new = cache.rows(titles['title'].to_numpy())
+    # Each distinct title is labelled once and the result fanned out to its rows
+    unique_rows, inverse = np.unique(rows, return_inverse=True)
+    similarity, names = label_titles(cache.vectors()[unique_rows], encoder.encode(anchors.values()),
+                                     list(anchors), min_similarity)
+    for k, label in enumerate(anchors):
+        titles[f'sim_{label}'] = similarity[inverse, k]
+    titles['label'] = names[inverse]
+    return titles, n_new
+
+
+def session_content_features(titles):
+    """Per-session share of productive/unproductive titles, titled video count and last label."""
+    if not len(titles):
+        return pd.DataFrame(columns=[SESSION_ID, PRODUCTIVE_SHARE, UNPRODUCTIVE_SHARE, TITLED_VIDEOS,
+                                     LAST_VIDEO_LABEL])
+    titles = titles.sort_values([SESSION_ID, 'timestamp'], kind='stable')
+    grouped = titles.groupby(SESSION_ID, sort=False)
+    return pd.DataFrame({
+        PRODUCTIVE_SHARE: (titles['label'] == 'productive').groupby(titles[SESSION_ID], sort=False).mean(),
+        UNPRODUCTIVE_SHARE: (titles['label'] == 'unproductive').groupby(titles[SESSION_ID], sort=False).mean(),
+        TITLED_VIDEOS: grouped.size(),
+        LAST_VIDEO_LABEL: grouped['label'].last(),
+    }).reset_index()
+
+
+def add_content_features(df, content):
+    """df with the content features joined on Session ID; sessions without titles count as neutral."""
+    df = df.merge(content, on=SESSION_ID, how='left')
+    df[[PRODUCTIVE_SHARE, UNPRODUCTIVE_SHARE]] = df[[PRODUCTIVE_SHARE, UNPRODUCTIVE_SHARE]].fillna(0.0)
+    df[TITLED_VIDEOS] = df[TITLED_VIDEOS].fillna(0).astype(np.int64)
+    df[LAST_VIDEO_LABEL] = df[LAST_VIDEO_LABEL].fillna(NEUTRAL)
+    return df
+
+
+def configure(content_path=None):
+    """Have join_configured_content add the features in content_path (main()'s --out file)."""
+    _config['content_path'] = content_path
+
+
+def join_configured_content(df):
+    """(df, added feature names): df with CONTENT_FEATURES joined if configure() named a file, else unchanged."""
+    if _config['content_path'] is None:
+        return df, []
+    content = pd.read_csv(_config['content_path'], usecols=[SESSION_ID] + CONTENT_FEATURES + [LAST_VIDEO_LABEL],
+                          dtype={SESSION_ID: str})
+    # One row per session, so the join cannot duplicate sessions of df
+    content = content.drop_duplicates(SESSION_ID, keep='last')
+    return add_content_features(df, content), list(CONTENT_FEATURES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label exported sessions by video title, offline")
+    parser.add_argument('dump', help="JSON dump of browser.storage.local (scrollSessions)")
+    parser.add_argument('--csv', help="session export to add the content features to")
+    parser.add_argument('--out', help="write the labelled export (or, without --csv, the per-session features)")
+    parser.add_argument('--titles-out', help="write every title with its similarities and label")
+    parser.add_argument('--cache', default=CACHE_PATH, help="vector cache directory")
+    parser.add_argument('--dim', type=int, default=512, help="hashed embedding size")
+    parser.add_argument('--min-similarity', type=float, default=0.05)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    encoder = HashingTitleEncoder(args.dim)
+    cache = VectorCache(encoder, args.cache)
+    titles, n_new = label_sessions(load_storage_dump(args.dump), encoder, cache,
+                                   min_similarity=args.min_similarity)
+    content = session_content_features(titles)
+    print(f"{len(titles):,} titles ({titles['title'].nunique():,} distinct, {n_new:,} newly embedded) "
+          f"in {content[SESSION_ID].nunique():,} sessions, {time.perf_counter() - start:.2f}s; "
+          f"{len(cache):,} titles cached")
+    print(titles['label'].value_counts().to_string())
+
+    if args.titles_out:
+        titles.to_csv(args.titles_out, index=False)
+    if args.csv:
+        from loader import load_sessions
+        content = add_content_features(load_sessions(args.csv, float_dtype=np.float64), content)
+        print(f"{int((content[TITLED_VIDEOS] > 0).sum()):,} of {len(content):,} exported sessions have titles")
+    if args.out:
+        content.to_csv(args.out, index=False)
+        print("Wrote", args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Vectorized decoding of the URL column into compact session features.
+
+Each session export ends with the page URL (watch?v=...&list=...&index=...,
+a short, youtu.be share links, the homepage, search results). decode_urls
+turns a whole column of them into four compact columns:
+
+- Video ID and Playlist ID, as categoricals
+- Playlist Index, as int32 (-1 when the URL has none)
+- Page Type, a categorical with the contexts content.js's updateContext
+  tracks (watch, shorts, home, search, subscriptions, other). youtu.be links
+  count as watch pages, which is where they redirect.
+
+Every field is one regex pass over the whole column, not a per-row urllib
+parse. With pyarrow installed the passes run in Arrow's compute kernels
+(RE2) on the string buffer. Without it, pandas' .str methods are used,
+which is slower but gives the same result. A categorical URL column (how
+loader.py loads it) is decoded once per distinct URL, and the results are
+spread to the rows through the category codes.
+
+    python Model_Training/url_parse.py --rows 20000000
+"""
+import argparse
+import re
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from features import PAGE_TYPE, PLAYLIST_ID, PLAYLIST_INDEX, URL, URL_COLUMNS, VIDEO_ID
+
+# One named group each: Arrow's extract_regex (RE2) only returns named groups
+VIDEO_ID_PATTERN = r'(?:[?&]v=|/shorts/|youtu\.be/)(?P<video>[\w-]{11})'
+PLAYLIST_ID_PATTERN = r'[?&]list=(?P<list>[\w-]+)'
+PLAYLIST_INDEX_PATTERN = r'[?&]index=(?P<index>\d{1,9})'
+
+# Checked in order, like updateContext in content.js; anything else is 'other'
+PAGE_PATTERNS = [
+    ('watch', r'/watch|//youtu\.be/'),
+    ('shorts', r'/shorts/'),
+    ('home', r'^https?://(?:www\.|m\.)?youtube\.com/?(?:[?#].*)?$'),
+    ('search', r'/results'),
+    ('subscriptions', r'/feed/subscriptions'),
+]
+PAGE_TYPES = [name for name, _ in PAGE_PATTERNS] + ['other']
+NO_INDEX = -1
+
+# Rows decoded per Arrow pass, bounding the intermediate match arrays
+CHUNK_ROWS = 5_000_000
+
+
+def _page_codes(matches):
+    """Page Type codes from one boolean array per PAGE_PATTERNS entry (first match wins)."""
+    return np.select(matches, np.arange(len(matches), dtype=np.int8), len(matches)).astype(np.int8)
+
+
+def _arrow_chunk(chunk):
+    """Raw decoded fields of one pyarrow string array: (video, playlist) arrays and index/page codes."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    def extract(array, pattern):
+        # struct_field keeps the nulls of non-matching rows
+        return pc.struct_field(pc.extract_regex(array, pattern), [0])
+
+    # Few URLs have playlist parameters; a substring test is cheaper than the
+    # extraction, so the playlist patterns only run on the rows that have them
+    listed = pc.match_substring_regex(chunk, 'list=|index=').fill_null(False)
+    in_list = pc.filter(chunk, listed)
+    playlist = pc.replace_with_mask(pa.nulls(len(chunk), pa.string()), listed,
+                                    extract(in_list, PLAYLIST_ID_PATTERN))
+    index = np.full(len(chunk), NO_INDEX, dtype=np.int32)
+    index[listed.to_numpy(zero_copy_only=False)] = \
+        pc.cast(extract(in_list, PLAYLIST_INDEX_PATTERN), pa.int32()).fill_null(NO_INDEX).to_numpy()
+
+    pages = [pc.match_substring_regex(chunk, pattern).fill_null(False).to_numpy(zero_copy_only=False)
+             for _, pattern in PAGE_PATTERNS]
+    return extract(chunk, VIDEO_ID_PATTERN), playlist, index, _page_codes(pages)
+
+
+def _categorical(chunks):
+    """One categorical from pyarrow string chunks, dictionary-encoded by Arrow.
+
+    The categories stay Arrow strings: with millions of distinct video IDs
+    they would otherwise be as many Python string objects.
+    """
+    import pyarrow as pa
+
+    encoded = pa.chunked_array(chunks, type=pa.string()).dictionary_encode().unify_dictionaries()
+    dictionary = encoded.chunk(0).dictionary if encoded.num_chunks else pa.array([], pa.string())
+    codes = [chunk.indices.fill_null(-1).to_numpy().astype(np.int32) for chunk in encoded.chunks]
+    return pd.Categorical.from_codes(np.concatenate(codes) if codes else np.empty(0, np.int32),
+                                     categories=pd.Index(pd.array(dictionary, dtype='string[pyarrow]')))
+
+
+def _decode_arrow(urls):
+    import pyarrow as pa
+
+    if not isinstance(urls, (pa.Array, pa.ChunkedArray)):
+        urls = pa.array(urls, type=pa.string(), from_pandas=True)
+    arrays = urls.chunks if isinstance(urls, pa.ChunkedArray) else [urls]
+    parts = [_arrow_chunk(array.slice(start, CHUNK_ROWS))
+             for array in arrays for start in range(0, len(array), CHUNK_ROWS)]
+    videos, playlists, index, page = zip(*parts) if parts else ([pa.array([], pa.string())],) * 2 + ([], [])
+    return {
+        VIDEO_ID: _categorical(videos),
+        PLAYLIST_ID: _categorical(playlists),
+        PLAYLIST_INDEX: np.concatenate(index or [np.empty(0)]).astype(np.int32),
+        PAGE_TYPE: np.concatenate(page or [np.empty(0)]).astype(np.int8),
+    }
+
+
+def _decode_pandas(urls):
+    urls = pd.Series(urls, dtype=object)
+    index = pd.to_numeric(urls.str.extract(PLAYLIST_INDEX_PATTERN, expand=False))
+    return {
+        VIDEO_ID: pd.Categorical(urls.str.extract(VIDEO_ID_PATTERN, expand=False)),
+        PLAYLIST_ID: pd.Categorical(urls.str.extract(PLAYLIST_ID_PATTERN, expand=False)),
+        PLAYLIST_INDEX: index.fillna(NO_INDEX).to_numpy(dtype=np.int32),
+        PAGE_TYPE: _page_codes([urls.str.contains(p, regex=True, na=False).to_numpy(dtype=bool)
+                                for _, p in PAGE_PATTERNS]),
+    }
+
+
+def _decode(urls):
+    try:
+        return _decode_arrow(urls)
+    except ImportError:
+        return _decode_pandas(urls)
+
+
+def _take(values, codes):
+    """values (decoded per category) for each row's category code; missing rows get the 'no match' value."""
+    if isinstance(values, pd.Categorical):
+        row_codes = np.where(codes >= 0, values.codes[codes], -1)
+        return pd.Categorical.from_codes(row_codes, categories=values.categories)
+    fill = NO_INDEX if values.dtype == np.int32 else len(PAGE_PATTERNS)
+    return np.where(codes >= 0, values[codes], fill).astype(values.dtype)
+
+
+def decode_urls(urls, index=None):
+    """DataFrame of Video ID, Playlist ID, Playlist Index and Page Type for a column of URLs.
+
+    urls may be a Series (categorical, object or string dtype), an array or
+    a pyarrow array. Missing URLs decode to missing IDs, index -1 and
+    'other'.
+    """
+    if isinstance(urls, pd.Series) and isinstance(urls.dtype, pd.CategoricalDtype):
+        index = urls.index if index is None else index
+        codes = urls.cat.codes.to_numpy()
+        fields = {name: _take(values, codes) for name, values in _decode(urls.cat.categories.to_numpy()).items()}
+    else:
+        if isinstance(urls, pd.Series):
+            index = urls.index if index is None else index
+        fields = _decode(urls)
+
+    fields[PAGE_TYPE] = pd.Categorical.from_codes(fields[PAGE_TYPE], categories=PAGE_TYPES)
+    return pd.DataFrame(fields, index=index)[URL_COLUMNS]
+
+
+def add_url_features(df, url_column=URL):
+    """Add the decoded URL columns to df (in place) and return it."""
+    decoded = decode_urls(df[url_column], index=df.index)
+    for column in URL_COLUMNS:
+        df[column] = decoded[column]
+    return df
+
+
+def decode_urls_urllib(urls):
+    """Per-row urllib reference decoder, for checking decode_urls and as the benchmark baseline."""
+    rows = []
+    for url in urls:
+        if not isinstance(url, str):
+            rows.append((None, None, NO_INDEX, 'other'))
+            continue
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        path = parts.path
+        if parts.netloc == 'youtu.be':
+            video = path[1:12] or None
+        elif path.startswith('/shorts/'):
+            video = path[8:19] or None
+        else:
+            video = query.get('v', [None])[0]
+        video = video if video and len(video) >= 11 else None
+        index = query.get('index', [''])[0]
+        page = next((name for name, pattern in PAGE_PATTERNS if re.search(pattern, url)), 'other')
+        rows.append((video[:11] if video else None, query.get('list', [None])[0],
+                     int(index) if index.isdigit() else NO_INDEX, page))
+    return pd.DataFrame(rows, columns=URL_COLUMNS)
+
+
+def rows_differ(a, b):
+    """Boolean mask of rows where two decoded frames disagree (missing equals missing)."""
+    same = np.ones(len(a), dtype=bool)
+    for column in URL_COLUMNS:
+        x, y = a[column].astype(object).to_numpy(), b[column].astype(object).to_numpy()
+        missing_x, missing_y = pd.isna(x), pd.isna(y)
+        both = ~missing_x & ~missing_y
+        equal = np.zeros(len(x), dtype=bool)
+        equal[both] = x[both] == y[both]
+        same &= equal | (missing_x & missing_y)
+    return ~same
+
+
+def benchmark_urls(n_rows, seed=0):
+    """n_rows URLs drawn from the real export's URL kinds with fresh video IDs, as a pyarrow array."""
+    import pyarrow as pa
+
+    from synthetic import _urls, load_session_model
+
+    templates = [t for component in load_session_model()['labels'] for t in component['urls']]
+    chunks = [pa.array(_urls(np.random.default_rng((seed, k)), templates, min(CHUNK_ROWS, n_rows - start)),
+                       type=pa.string())
+              for k, start in enumerate(range(0, n_rows, CHUNK_ROWS))]
+    return pa.chunked_array(chunks, type=pa.string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized URL decoder")
+    parser.add_argument('--rows', type=int, default=20_000_000)
+    parser.add_argument('--baseline-rows', type=int, default=100_000,
+                        help="rows timed with the per-row urllib decoder (extrapolated)")
+    args = parser.parse_args()
+
+    urls = benchmark_urls(args.rows)
+    print(f"{args.rows:,} URLs, {urls.nbytes / 2**20:,.0f} MB of Arrow strings")
+
+    start = time.perf_counter()
+    decoded = decode_urls(urls)
+    elapsed = time.perf_counter() - start
+    memory = decoded.memory_usage(deep=True).sum()
+    print(f"decode_urls: {elapsed:.2f}s ({args.rows / elapsed / 1e6:.1f}M rows/s), "
+          f"{memory / 2**20:,.0f} MB decoded")
+    print(decoded[PAGE_TYPE].value_counts().to_string())
+
+    sample = urls.slice(0, args.baseline_rows).to_pylist()
+    start = time.perf_counter()
+    reference = decode_urls_urllib(sample)
+    baseline = (time.perf_counter() - start) * args.rows / len(sample)
+    print(f"per-row urllib: ~{baseline:.0f}s for {args.rows:,} rows (timed on {len(sample):,}), "
+          f"{baseline / elapsed:.0f}x slower")
+
+    mismatched = rows_differ(decoded.head(len(sample)).reset_index(drop=True), reference).sum()
+    print(f"{mismatched} of {len(sample):,} rows differ from the urllib decoder")
+
+
+if __name__ == '__main__':
+    main()
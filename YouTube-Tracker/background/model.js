@@ -1,11 +1,13 @@
+// Generated by Model_Training/model_artifact.py from lr_model.json
+// (50 sessions, 2026-10-17T01:03:26+00:00). Rerun final_model.py instead of editing by hand.
 const scaler = {
-  mean: [1686.1593, 0.5569846, 23.7],
-  std:  [1571.9131, 0.5189293, 13.1061054]
+  mean: [1686.1593030156614, 0.5569845750146907, 23.7],
+  std:  [1571.913070171765, 0.5189292877332708, 13.106105447462264]
 };
 
 const lrModel = {
-  weights: [1.60056473, -0.34815377, 2.17577448],
-  bias: 0.13098922
+  weights: [1.6015787688495453, -0.34915709177878945, 2.1816254462325357],
+  bias: 0.13338270130060062
 };
 
 function standardize(x, i) {
@@ -29,5 +31,5 @@ function predictDoomscrollProbability(features) {
     z += lrModel.weights[i] * standardize(x[i], i);
   }
 
-  return sigmoid(z); // probability of doomscrolling (test run)
-}
\ No newline at end of file
+  return sigmoid(z); // probability of doomscrolling
+}